@@ -0,0 +1,190 @@
+import asyncio
+import heapq
+import logging
+import os
+import time
+from bisect import bisect_left, insort
+from sqlalchemy import select
+from db import SessionLocal
+import models as mod
+
+
+logger = logging.getLogger(__name__)
+
+# writes made by other worker processes show up after at most this many seconds
+AUTOCOMPLETE_MAX_AGE = float(os.getenv('AUTOCOMPLETE_MAX_AGE', 60))
+
+# keys sorted in one call while building; the event loop can wait about this long
+SORT_CHUNK = 10000
+# writes patched in since the last build before a rebuild folds them into the sorted keys
+PENDING_LIMIT = 10000
+
+
+def normalise(value: str):
+    return ' '.join((value or '').lower().split())
+
+
+# the whole name and every word start in it, so "розовые" finds "Семейство розовые"
+def prefix_keys(name_lt: str, name_ru: str):
+    keys = set()
+    for name in (normalise(name_lt), normalise(name_ru)):
+        words = name.split(' ')
+        keys.update(' '.join(words[i:]) for i in range(len(words)) if words[i])
+    return keys
+
+
+def scan(entries: list, prefix: str):
+    i = bisect_left(entries, (prefix,))
+    while i < len(entries) and entries[i][0].startswith(prefix):
+        yield entries[i]
+        i += 1
+
+
+class LevelIndex:
+    """Sorted (key, id) pairs of one taxonomy level, searched with bisect.
+
+    `entries` is sorted once per build and not touched by writes; pairs added
+    since go to the small sorted `recent` list and pairs removed since to the
+    `removed` set, and `matches` merges both in.
+    """
+
+    def __init__(self, level: mod.Level):
+        self.level = level
+        self.entries = []
+        self.recent = []
+        self.removed = set()
+        self.names = {}
+
+    def load(self, rows):
+        entries = []
+        for row in rows:
+            self.names[row.id] = (row.name_lt, row.name_ru)
+            entries.extend((key, row.id) for key in prefix_keys(row.name_lt, row.name_ru))
+        # list.sort holds the GIL until it returns; short sorts merged in Python let
+        # the event loop run while a rebuild is sorting on another thread
+        chunks = [sorted(entries[i:i + SORT_CHUNK]) for i in range(0, len(entries), SORT_CHUNK)]
+        self.entries = list(heapq.merge(*chunks))
+
+    @property
+    def pending(self):
+        return len(self.recent) + len(self.removed)
+
+    def add(self, id: int, name_lt: str, name_ru: str):
+        self.remove(id)
+        self.names[id] = (name_lt, name_ru)
+        for pair in ((key, id) for key in prefix_keys(name_lt, name_ru)):
+            if pair in self.removed:
+                self.removed.discard(pair)
+            else:
+                insort(self.recent, pair)
+
+    def remove(self, id: int):
+        names = self.names.pop(id, None)
+        if names is None:
+            return
+        for pair in ((key, id) for key in prefix_keys(*names)):
+            i = bisect_left(self.recent, pair)
+            if i < len(self.recent) and self.recent[i] == pair:
+                del self.recent[i]
+            else:
+                self.removed.add(pair)
+
+    def matches(self, prefix: str):
+        """(key, level position, id) for every key starting with `prefix`, in key order."""
+        position = mod.LEVELS.index(self.level)
+        for key, id in heapq.merge(scan(self.entries, prefix), scan(self.recent, prefix)):
+            if (key, id) not in self.removed:
+                yield key, position, id
+
+
+def load_levels(rows: dict):
+    levels = {}
+    for level in mod.LEVELS:
+        levels[level.name] = LevelIndex(level)
+        levels[level.name].load(rows[level.name])
+    return levels
+
+
+class AutocompleteIndex:
+    """Prefix index over name_lt and name_ru of every live taxon.
+
+    Built at startup and patched in place by taxonomy writes. Writes that
+    touch many rows (department deletes, bulk imports) schedule a rebuild
+    in the background; suggestions come from the previous index meanwhile.
+    Rebuilds sort on a thread and replace the levels in one assignment.
+    """
+
+    def __init__(self, max_age: float = AUTOCOMPLETE_MAX_AGE):
+        self.max_age = max_age
+        self.levels = {level.name: LevelIndex(level) for level in mod.LEVELS}
+        self.built_at = None
+        self.writes = 0
+        self._rebuild = None
+
+    async def build(self, db):
+        started = time.monotonic()
+        rows = {}
+        for level in mod.LEVELS:
+            model = level.model
+            result = await db.execute(select(model.id, model.name_lt, model.name_ru)\
+                .where(model.is_deleted == False))
+            rows[level.name] = result.all()
+        # sorted on a thread and swapped in whole; suggestions use the old index meanwhile
+        loop = asyncio.get_running_loop()
+        self.levels = await loop.run_in_executor(None, load_levels, rows)
+        self.built_at = started
+
+    def refresh(self):
+        if self._rebuild is None or self._rebuild.done():
+            self._rebuild = asyncio.create_task(self._build_in_background())
+
+    async def _build_in_background(self):
+        try:
+            # a write applied while building may be missing from the new index; build again
+            while True:
+                writes = self.writes
+                async with SessionLocal() as db:
+                    await self.build(db)
+                if self.writes == writes:
+                    break
+        except Exception:
+            logger.exception('autocomplete index rebuild failed')
+
+    def apply(self, level: str, id: int, operation: str, fields: dict = None):
+        self.writes += 1
+        index = self.levels[level]
+        named = id is not None and fields and 'name_lt' in fields and 'name_ru' in fields
+        if operation == 'create' and named:
+            index.add(id, fields['name_lt'], fields['name_ru'])
+        elif operation == 'update' and named:
+            # a soft-deleted row is not indexed and stays out
+            if id in index.names:
+                index.add(id, fields['name_lt'], fields['name_ru'])
+        elif operation == 'delete' and level == mod.LEVELS[-1].name:
+            index.remove(id)
+        else:
+            self.refresh()
+        if index.pending > PENDING_LIMIT:
+            self.refresh()
+
+    def suggest(self, q: str, level: str = None, limit: int = 10):
+        if self.built_at is None or time.monotonic() - self.built_at > self.max_age:
+            self.refresh()
+        prefix = normalise(q)
+        if not prefix:
+            return []
+        levels = [self.levels[level]] if level else self.levels.values()
+        result, seen = [], set()
+        for key, position, id in heapq.merge(*[index.matches(prefix) for index in levels]):
+            if (position, id) in seen:
+                continue
+            seen.add((position, id))
+            index = mod.LEVELS[position].name
+            name_lt, name_ru = self.levels[index].names[id]
+            result.append({'level': index, 'id': id, 'name_lt': name_lt, 'name_ru': name_ru})
+            if len(result) == limit:
+                break
+        return result
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,68 @@
+"""Size and cost of each response encoding for a full tree listing.
+
+    python benchmarks/compression.py
+    python benchmarks/compression.py --shape 20,10,10,10,5,5,20
+
+Builds a synthetic nested listing like /api/get-admin-departments returns
+(Latin and Cyrillic names, ancestor ids, timestamps), serialises it once
+and reports, per available encoding, the body size and the time to
+compress it at the per-request level and at the cached-snapshot level.
+Serialising is timed too: a snapshot 304 skips it and compression both.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from compression import ENCODINGS, LEVELS, CACHED_LEVELS, compress, strong_etag
+from serializer import dumps
+import models as mod
+
+
+def listing(shape):
+    now = datetime.now()
+
+    def nodes(index, path, count):
+        level = mod.LEVELS[index]
+        result = []
+        for i in range(count):
+            node = dict(path, id=len(result) + 1, name_lt=f'{level.name.capitalize()} Plantae {i}',
+                    name_ru=f'Растения {level.name} {i}', is_deleted=False, create_at=now, update_at=now)
+            if level.children_key and index + 1 < len(shape):
+                node[level.children_key] = nodes(index + 1, dict(path, **{level.id_key: node['id']}), shape[index + 1])
+            result.append(node)
+        return result
+
+    return nodes(0, {}, shape[0])
+
+
+def timed(function, *args, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - started)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shape', default='5,4,3,3,3,2,5', help='fan-out per level, departments first')
+    args = parser.parse_args()
+    content = listing([int(width) for width in args.shape.split(',')])
+    body, elapsed = timed(dumps, content)
+    print(f'  {"identity":<10} {len(body):>12,} bytes  serialise {elapsed * 1e3:>8.1f} ms')
+    _, elapsed = timed(strong_etag, body)
+    print(f'  {"etag":<10} {"":>12}        hash      {elapsed * 1e3:>8.1f} ms')
+    for encoding in ENCODINGS:
+        for label, level in [('request', LEVELS[encoding]), ('cached', CACHED_LEVELS[encoding])]:
+            compressed, elapsed = timed(compress, body, encoding, level)
+            print(f'  {encoding + " " + str(level):<10} {len(compressed):>12,} bytes  {label:<9} {elapsed * 1e3:>8.1f} ms'
+                  f'  ratio {len(body) / len(compressed):>5.1f}x')
+
+
+if __name__ == '__main__':
+    main()
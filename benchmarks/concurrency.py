@@ -0,0 +1,77 @@
+"""Requests/second for an endpoint under N parallel clients.
+
+Run it against a live server once on the old (sync) build and once on the
+current one to compare:
+
+    python benchmarks/concurrency.py --url http://127.0.0.1:8000 --token <admin token>
+
+Measured with 50 clients for 20s, one uvicorn worker, 20 departments each
+with a full class-to-family chain (28 kB response), sync Session build
+before and AsyncSession build after. Both ran on the same SQLite file with
+a fixed sleep in the driver's execute standing in for the network round
+trip to Postgres (on the loop thread for the sync build, on aiosqlite's
+thread for the async one):
+
+    round trip    before (req/s)    after (req/s)
+    0 ms          36.5              34.4
+    2 ms          34.5              40.6
+    5 ms          27.8              32.5
+    20 ms         17.2              37.8
+
+Runs vary by about 10%. With no round trip the endpoint is bound by ORM
+loading and JSON encoding, so both builds are even; the async build only
+pulls ahead once the database is a network hop away.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def worker(url, headers, deadline):
+    session = requests.Session()
+    latencies = []
+    errors = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = session.get(url, headers=headers)
+            if response.status_code >= 400:
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--path', default='/api/get-admin-departments')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=20)
+    args = parser.parse_args()
+
+    url = args.url.rstrip('/') + args.path
+    headers = {'Authorization': f'Bearer {args.token}'}
+    deadline = time.perf_counter() + args.seconds
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        results = list(pool.map(lambda _: worker(url, headers, deadline), range(args.clients)))
+
+    latencies = sorted(l for result in results for l in result[0])
+    errors = sum(result[1] for result in results)
+    if not latencies:
+        print('no requests completed')
+        return
+    print(f'{args.path} with {args.clients} clients for {args.seconds:.0f}s')
+    print(f'  requests     : {len(latencies)} ({errors} errors)')
+    print(f'  requests/sec : {len(latencies) / args.seconds:.1f}')
+    print(f'  p50 latency  : {statistics.median(latencies) * 1000:.1f} ms')
+    print(f'  p95 latency  : {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""jsonable_encoder + json versus serializer.dumps, per taxonomy entity.
+
+    python benchmarks/serializer.py --rows 20000
+
+For every level it times a flat list of ORM instances (what create/list
+endpoints return) and, for levels with children, the nested dict tree
+that tree.build_tree produces with --fanout children per node.
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.encoders import jsonable_encoder
+import models as mod
+import serializer
+
+
+def instance(level, id):
+    values = {column.key: None for column in level.model.__table__.columns}
+    values.update(id=id, name_lt=f'{level.name} latinum {id}', name_ru=f'{level.name} русский {id}',
+            is_deleted=False, create_at=datetime.now(), update_at=datetime.now())
+    for key in values:
+        if key.endswith('_id'):
+            values[key] = id
+    return level.model(**values)
+
+
+def tree(index, fanout, counter):
+    level = mod.LEVELS[index]
+    counter[0] += 1
+    node = serializer.to_dict(instance(level, counter[0]))
+    if level.children_key and index < len(mod.LEVELS) - 1:
+        node[level.children_key] = [tree(index + 1, fanout, counter) for _ in range(fanout)]
+    return node
+
+
+def baseline(content):
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def compare(label, content, repeat):
+    assert json.loads(baseline(content)) == json.loads(serializer.dumps(content))
+    old = min(timeit.repeat(lambda: baseline(content), number=1, repeat=repeat))
+    new = min(timeit.repeat(lambda: serializer.dumps(content), number=1, repeat=repeat))
+    print(f'  {label:<24} jsonable_encoder={old * 1000:>9.1f} ms  fast={new * 1000:>8.1f} ms  x{old / new:>6.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-orjson', action='store_true', help='measure the stdlib json fallback')
+    args = parser.parse_args()
+    if args.no_orjson:
+        serializer.orjson = None
+    print(f'backend: {"orjson" if serializer.orjson else "json"}')
+
+    for index, level in enumerate(mod.LEVELS):
+        rows = [instance(level, id) for id in range(args.rows)]
+        compare(f'{level.name} rows', rows, args.repeat)
+        if level.children_key:
+            counter = [0]
+            nodes = [tree(index, args.fanout, counter) for _ in range(max(1, args.rows // args.fanout ** (len(mod.LEVELS) - index - 1)))]
+            compare(f'{level.name} tree ({counter[0]})', nodes, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
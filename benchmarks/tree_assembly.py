@@ -0,0 +1,124 @@
+"""Nested joinedload versus the flat-fetch tree assembler on a synthetic cadastre.
+
+    python benchmarks/tree_assembly.py --shape 20,10,10,10,5,5,20 --url postgresql+asyncpg://...
+    python benchmarks/tree_assembly.py                 # small shape on a temporary SQLite file
+
+The shape is the fan-out per level, departments first. For each strategy
+it reports the number of rows the database sends back, peak Python memory
+(tracemalloc) and wall time.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import select, insert, func, desc
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import joinedload, sessionmaker
+from db import Base
+from tree import build_tree, columns
+import models as mod
+
+
+async def seed(engine, shape):
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        parents = [{}]
+        for level, width in zip(mod.LEVELS, shape):
+            rows = []
+            for parent in parents:
+                for _ in range(width):
+                    row = dict(parent, id=len(rows) + 1, name_lt=f'{level.name} {len(rows) + 1}',
+                            name_ru=f'{level.name} {len(rows) + 1}', is_deleted=False)
+                    rows.append(row)
+            for i in range(0, len(rows), 10000):
+                await conn.execute(insert(level.model.__table__), rows[i:i + 10000])
+            if level.id_key:
+                parents = [{**{k: v for k, v in row.items() if k.endswith('_id')}, level.id_key: row['id']}
+                        for row in rows]
+            print(f'  {level.name:<14} {len(rows):>10} rows')
+
+
+def joined_statement():
+    return select(mod.Department)\
+        .options(joinedload(mod.Department.class_rel)\
+            .options(joinedload(mod.Class.subclass)\
+                .options(joinedload(mod.Subclass.supersubclass)\
+                    .options(joinedload(mod.Supersubclass.order)\
+                        .options(joinedload(mod.Order.suborder)\
+                            .options(joinedload(mod.Suborder.family)))))))\
+                            .where(mod.Department.is_deleted == False)\
+                                .order_by(desc(mod.Department.id))
+
+
+async def joined_row_count(db):
+    # the LEFT OUTER JOIN chain joinedload emits returns one row per leaf path
+    stmt = select(func.count()).select_from(mod.Department)
+    previous = mod.Department
+    for level in mod.LEVELS[1:]:
+        stmt = stmt.outerjoin(level.model, getattr(level.model, level.parent_key) == previous.id)
+        previous = level.model
+    return (await db.execute(stmt)).scalar()
+
+
+async def run_joined(db):
+    result = await db.execute(joined_statement())
+    return result.unique().scalars().all()
+
+
+async def run_flat(db):
+    result = await db.execute(select(*columns(mod.Department))\
+        .where(mod.Department.is_deleted == False).order_by(desc(mod.Department.id)))
+    return await build_tree(db, 'department', result.all())
+
+
+async def measure(name, Session, fn, rows):
+    async with Session() as db:
+        tracemalloc.start()
+        start = time.perf_counter()
+        await fn(db)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    print(f'  {name:<10} rows={rows:>10}  peak={peak / 2**20:>8.1f} MiB  time={elapsed:>8.2f} s')
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shape', default='4,5,5,5,3,3,5')
+    parser.add_argument('--url', help='database url, defaults to a temporary SQLite file')
+    parser.add_argument('--skip-joined', action='store_true', help='only run the flat assembler')
+    args = parser.parse_args()
+    shape = [int(width) for width in args.shape.split(',')]
+    if len(shape) != len(mod.LEVELS):
+        parser.error(f'--shape needs {len(mod.LEVELS)} widths')
+
+    url = args.url or f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/cadastre.db'
+    engine = create_async_engine(url)
+    Session = sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+    print(f'seeding {url}')
+    await seed(engine, shape)
+
+    async with Session() as db:
+        joined_rows = await joined_row_count(db)
+    # the flat assembler reads every row exactly once
+    flat_rows, level_rows = 0, 1
+    for width in shape:
+        level_rows *= width
+        flat_rows += level_rows
+
+    print('results')
+    if not args.skip_joined:
+        await measure('joinedload', Session, run_joined, joined_rows)
+    await measure('flat', Session, run_flat, flat_rows)
+    await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+from pydantic import ValidationError
+from sqlalchemy import select, insert, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from tree import columns
+import models as mod
+import stats
+
+
+# rows per INSERT, and parent ids per lookup
+BULK_BATCH_SIZE = 1000
+
+
+def validate_rows(level: mod.Level, rows: list):
+    """Raw rows checked against the level schema: ([(row number, row)], errors)."""
+    valid, errors = [], []
+    for number, row in enumerate(rows, start=1):
+        try:
+            valid.append((number, level.schema.parse_obj(row).dict()))
+        except ValidationError as e:
+            errors.append({'row': number, 'error': e.errors()})
+    return valid, errors
+
+
+async def resolve_parents(db: AsyncSession, level: mod.Level, rows: list):
+    """Rows whose parent exists and whose ancestor ids agree with the parent's, and errors for the rest."""
+    if not level.parent_key:
+        return rows, []
+    parent_level = mod.LEVELS[mod.LEVELS.index(level) - 1]
+    parent_model = parent_level.model
+    parent_ids = list({row[level.parent_key] for _, row in rows})
+    parents = {}
+    for i in range(0, len(parent_ids), BULK_BATCH_SIZE):
+        result = await db.execute(select(*columns(parent_model))\
+            .where(and_(
+                parent_model.id.in_(parent_ids[i:i + BULK_BATCH_SIZE]),
+                parent_model.is_deleted == False
+            )))
+        for parent in result.all():
+            parents[parent.id] = parent._mapping
+    valid, errors = [], []
+    for number, row in rows:
+        parent = parents.get(row[level.parent_key])
+        if parent is None:
+            errors.append({'row': number, 'error': f'{parent_level.name} {row[level.parent_key]} not found'})
+            continue
+        mismatched = [key for key in parent.keys() if key.endswith('_id') and row.get(key) != parent[key]]
+        if mismatched:
+            errors.append({'row': number, 'error': f'{", ".join(mismatched)} do not match {parent_level.name} {parent["id"]}'})
+            continue
+        valid.append((number, row))
+    return valid, errors
+
+
+async def insert_rows(db: AsyncSession, level_name: str, rows: list, atomic: bool, job=None):
+    """Insert the rows that pass validation, with their counters, and commit.
+
+    With `atomic` nothing is inserted when any row fails. Returns
+    {'inserted': n, 'errors': [...]}, errors ordered by row number.
+    """
+    level = mod.LEVELS_BY_NAME[level_name]
+    valid, errors = validate_rows(level, rows)
+    valid, parent_errors = await resolve_parents(db, level, valid)
+    errors = sorted(errors + parent_errors, key=lambda error: error['row'])
+    if errors and atomic:
+        return {'inserted': 0, 'errors': errors}
+    values = [row for _, row in valid]
+    for i in range(0, len(values), BULK_BATCH_SIZE):
+        await db.execute(insert(level.model).values(values[i:i + BULK_BATCH_SIZE]))
+        if job:
+            await job.report(min(i + BULK_BATCH_SIZE, len(values)), len(values), persist=False)
+    await stats.bulk_created(db, level_name, values)
+    await db.commit()
+    return {'inserted': len(values), 'errors': errors}
@@ -0,0 +1,124 @@
+import os
+from sqlalchemy import select, update, delete, insert, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from hierarchy import path_keys
+import models as mod
+import stats
+
+
+# rows updated or deleted per statement; each batch commits on its own
+CASCADE_BATCH_SIZE = int(os.getenv('CASCADE_BATCH_SIZE', 5000))
+
+# subtrees with more rows than this are deleted by a background job
+CASCADE_BACKGROUND_ROWS = int(os.getenv('CASCADE_BACKGROUND_ROWS', 20000))
+
+
+def members(level_name: str):
+    """(level, column) pairs selecting the node itself and, via the denormalised
+    ancestor column, every descendant level, root first."""
+    index = mod.LEVELS.index(mod.LEVELS_BY_NAME[level_name])
+    root = mod.LEVELS[index]
+    pairs = [(root, root.model.id)]
+    for level in mod.LEVELS[index + 1:]:
+        pairs.append((level, getattr(level.model, root.id_key)))
+    return pairs
+
+
+def condition(level: mod.Level, column, id: int, soft: bool):
+    if soft:
+        return and_(column == id, level.model.is_deleted == False)
+    return column == id
+
+
+async def count_subtree(db: AsyncSession, level_name: str, id: int, soft: bool):
+    counts = {}
+    for level, column in members(level_name):
+        result = await db.execute(select(func.count()).select_from(level.model)\
+            .where(condition(level, column, id, soft)).execution_options(include_deleted=True))
+        counts[level.name] = result.scalar()
+    return counts
+
+
+class CascadeProgress:
+    """Rows deleted so far per level, passed on to the job running the cascade if any."""
+
+    def __init__(self, level: str, id: int, soft: bool, total: dict, job=None):
+        self.level = level
+        self.id = id
+        self.soft = soft
+        self.total = total
+        self.done = {name: 0 for name in total}
+        self.job = job
+
+    async def advance(self, level: str, rows: int):
+        self.done[level] += rows
+        if self.job:
+            await self.job.report(sum(self.done.values()), sum(self.total.values()), self.as_dict())
+
+    def as_dict(self):
+        return {
+            'level'     : self.level,
+            'id'        : self.id,
+            'mode'      : 'soft' if self.soft else 'hard',
+            'total'     : self.total,
+            'done'      : self.done
+        }
+
+
+def batch(level: mod.Level, where):
+    """Next rows to delete with what the stats counters need, locked against a concurrent cascade."""
+    model = level.model
+    keys = [model.id, model.is_deleted] + [getattr(model, key) for key in path_keys(level.name)]
+    return select(*keys).where(where).limit(CASCADE_BATCH_SIZE).with_for_update()\
+        .execution_options(include_deleted=True)
+
+
+async def soft_delete_level(db: AsyncSession, level: mod.Level, column, id: int, progress: CascadeProgress):
+    model = level.model
+    while True:
+        result = await db.execute(batch(level, condition(level, column, id, True)))
+        rows = [row._mapping for row in result.all()]
+        if not rows:
+            return
+        await db.execute(update(model).where(model.id.in_([row['id'] for row in rows]))\
+            .values({model.is_deleted: True}).execution_options(synchronize_session=False))
+        await stats.rows_removed(db, level.name, rows)
+        await db.commit()
+        await progress.advance(level.name, len(rows))
+        if len(rows) < CASCADE_BATCH_SIZE:
+            return
+
+
+async def hard_delete_level(db: AsyncSession, level: mod.Level, column, id: int, progress: CascadeProgress):
+    model = level.model
+    while True:
+        result = await db.execute(batch(level, column == id))
+        rows = [row._mapping for row in result.all()]
+        if not rows:
+            return
+        ids = [row['id'] for row in rows]
+        # tombstones let /api/changes clients drop rows that no longer exist
+        await db.execute(insert(mod.Tombstone), [{'level': level.name, 'entity_id': row_id} for row_id in ids])
+        await db.execute(delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False))
+        await stats.rows_removed(db, level.name, rows)
+        await db.commit()
+        await progress.advance(level.name, len(ids))
+        if len(ids) < CASCADE_BATCH_SIZE:
+            return
+
+
+async def delete_subtree(db: AsyncSession, progress: CascadeProgress):
+    """Delete a node and everything under it with set-based statements, level by level.
+
+    Soft deletes mark the root first, so the whole branch disappears from
+    tree reads at once, then its descendants top down. Hard deletes go
+    bottom up, so no row ever points at a parent that is already gone.
+    """
+    pairs = members(progress.level)
+    if progress.soft:
+        for level, column in pairs:
+            await soft_delete_level(db, level, column, progress.id, progress)
+    else:
+        for level, column in reversed(pairs):
+            await hard_delete_level(db, level, column, progress.id, progress)
+    return progress.done
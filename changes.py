@@ -0,0 +1,138 @@
+import base64
+import heapq
+import json
+import os
+from datetime import datetime, timedelta
+from fastapi import HTTPException, status
+from sqlalchemy import select, and_, or_, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from tree import columns
+import models as mod
+
+
+# rows younger than this are held back until the next sync, so a worker with a slightly
+# late clock is not skipped. On Postgres the feed also stops short of the oldest open write
+# transaction (see write_horizon). SQLite cannot list open transactions, so there this
+# window alone must cover the longest write transaction, or its rows are skipped for good.
+CHANGES_SETTLE_SECONDS = float(os.getenv('CHANGES_SETTLE_SECONDS', 2))
+
+# feed sources in key order: the seven levels, then tombstones of hard-deleted rows
+TOMBSTONES = len(mod.LEVELS)
+
+
+class SyncToken:
+    """Position in the change feed: the (update_at, source, id) of the last row sent."""
+
+    def __init__(self, update_at: datetime, source: int, id: int):
+        self.update_at = update_at
+        self.source = source
+        self.id = id
+
+    def key(self):
+        return (self.update_at, self.source, self.id)
+
+    def encode(self):
+        raw = json.dumps({'t': self.update_at.isoformat(), 's': self.source, 'id': self.id}).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @classmethod
+    def decode(cls, token: str):
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+            return cls(datetime.fromisoformat(raw['t']), int(raw['s']), int(raw['id']))
+        except (ValueError, TypeError, KeyError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid sync token')
+
+
+def after(model, source: int, since: SyncToken):
+    # keyset condition for (update_at, source, id) > since; source is constant per query
+    if since is None:
+        return model.is_deleted == False
+    if source < since.source:
+        return model.update_at > since.update_at
+    if source > since.source:
+        return model.update_at >= since.update_at
+    return or_(model.update_at > since.update_at, and_(model.update_at == since.update_at, model.id > since.id))
+
+
+async def level_changes(db: AsyncSession, source: int, since: SyncToken, until: datetime, limit: int):
+    level = mod.LEVELS[source]
+    model = level.model
+    result = await db.execute(select(*columns(model))\
+        .where(and_(after(model, source, since), model.update_at <= until))\
+            .order_by(model.update_at, model.id).limit(limit))
+    for row in result.all():
+        row = dict(row._mapping)
+        if row['is_deleted']:
+            change = {'level': level.name, 'id': row['id'], 'op': 'delete', 'row': None}
+        else:
+            created = since is None or row['create_at'] is None or row['create_at'] > since.update_at
+            change = {'level': level.name, 'id': row['id'], 'op': 'create' if created else 'update', 'row': row}
+        yield (row['update_at'], source, row['id']), change
+
+
+async def tombstone_changes(db: AsyncSession, since: SyncToken, until: datetime, limit: int):
+    # a first sync has nothing to drop
+    if since is None:
+        return
+    model = mod.Tombstone
+    if since.source < TOMBSTONES:
+        condition = model.update_at > since.update_at
+    else:
+        condition = or_(model.update_at > since.update_at, and_(model.update_at == since.update_at, model.id > since.id))
+    result = await db.execute(select(model).where(and_(condition, model.update_at <= until))\
+        .order_by(model.update_at, model.id).limit(limit))
+    for tombstone in result.scalars().all():
+        yield (tombstone.update_at, TOMBSTONES, tombstone.id), \
+            {'level': tombstone.level, 'id': tombstone.entity_id, 'op': 'delete', 'row': None}
+
+
+async def write_horizon(db: AsyncSession):
+    """Start of the oldest write transaction still open, or None.
+
+    update_at is stamped while the transaction runs, not when it commits, so
+    its rows can become visible after later-stamped rows have been sent;
+    nothing at or after this moment is safe to pass yet.
+    """
+    if db.bind.dialect.name != 'postgresql':
+        return None
+    # only sessions that have written hold a backend_xid; this read-only one does not
+    result = await db.execute(text('SELECT min(xact_start) FROM pg_stat_activity '
+            'WHERE datname = current_database() AND backend_xid IS NOT NULL AND pid <> pg_backend_pid()'))
+    started = result.scalar()
+    # update_at holds naive local time
+    return started.astimezone().replace(tzinfo=None) if started else None
+
+
+async def read_changes(db: AsyncSession, since: SyncToken = None, limit: int = 1000):
+    """Creates, updates and deletes across all levels after `since`, oldest first.
+
+    Returns the changes, the token to pass next time and whether more
+    changes are already waiting. Without `since` the feed starts with
+    every live row.
+    """
+    until = datetime.now()
+    horizon = await write_horizon(db)
+    if horizon is not None:
+        until = min(until, horizon)
+    until -= timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    # each source is ordered by its key, so the first `limit` of the merge need at most `limit` from each
+    sources = []
+    for source in range(len(mod.LEVELS)):
+        sources.append([item async for item in level_changes(db, source, since, until, limit + 1)])
+    sources.append([item async for item in tombstone_changes(db, since, until, limit + 1)])
+    merged = list(heapq.merge(*sources, key=lambda item: item[0]))
+    has_more = len(merged) > limit
+    merged = merged[:limit]
+    if merged:
+        next_token = SyncToken(*merged[-1][0])
+    elif since is not None:
+        next_token = since
+    else:
+        # empty cadastre: start the next sync from the settle horizon
+        next_token = SyncToken(until, TOMBSTONES, 0)
+    return {
+        'changes'   : [change for _, change in merged],
+        'next'      : next_token.encode(),
+        'has_more'  : has_more
+    }
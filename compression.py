@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# bodies smaller than this go out as they are; framing would eat most of the gain
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+
+# whole bodies larger than this are compressed off the event loop
+COMPRESSION_THREAD_SIZE = int(os.getenv('COMPRESSION_THREAD_SIZE', 256 * 1024))
+
+# content types worth compressing; parquet and arrow files are compressed already
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+# levels for responses compressed on every request, and for bodies compressed once and cached
+LEVELS = {
+    'br'    : 4,
+    'zstd'  : 3,
+    'gzip'  : 6,
+}
+CACHED_LEVELS = {
+    'br'    : 9,
+    'zstd'  : 12,
+    'gzip'  : 9,
+}
+
+# our preference when a client accepts several with the same q-value
+ENCODINGS = [encoding for encoding, module in [('br', brotli), ('zstd', zstandard), ('gzip', zlib)] if module]
+
+
+def negotiate(accept_encoding: str):
+    """The best of ENCODINGS the Accept-Encoding header allows, or None for identity."""
+    if not accept_encoding:
+        return None
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in ENCODINGS:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class Compressor:
+    """Incremental compressor with the same interface for every encoding."""
+
+    def __init__(self, encoding: str, level: int = None):
+        level = LEVELS[encoding] if level is None else level
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+            self._compress, self._flush = self._compressor.process, self._compressor.finish
+        elif encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self._compress, self._flush = self._compressor.compress, self._compressor.flush
+        else:
+            # wbits 31 writes the gzip header and trailer
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._compress, self._flush = self._compressor.compress, self._compressor.flush
+
+    def compress(self, data: bytes):
+        return self._compress(data)
+
+    def flush(self):
+        return self._flush()
+
+
+def compress(data: bytes, encoding: str, level: int = None):
+    compressor = Compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+async def compress_async(data: bytes, encoding: str, level: int = None):
+    # zlib, brotli and zstandard release the GIL, so a thread keeps big bodies off the event loop
+    if len(data) < COMPRESSION_THREAD_SIZE:
+        return compress(data, encoding, level)
+    return await asyncio.get_running_loop().run_in_executor(None, compress, data, encoding, level)
+
+
+def strong_etag(body: bytes):
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def encoded_etag(etag: str, encoding: str = None):
+    """Strong validators differ per representation, so the encoding goes into the tag."""
+    if not encoding:
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: str, etag: str):
+    """If-None-Match against the tag of any encoding of the same body (weak comparison)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    base = etag[:-1]
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == etag or (tag.startswith(base) and tag[len(base):-1].lstrip('-') in ENCODINGS):
+            return True
+    return False
+
+
+def header(headers: list, name: bytes):
+    for key, value in headers:
+        if key.lower() == name:
+            return value.decode('latin-1')
+    return None
+
+
+def compressible(headers: list):
+    content_type = header(headers, b'content-type') or ''
+    return header(headers, b'content-encoding') is None and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware negotiating gzip, brotli or zstd for JSON and text responses.
+
+    Complete GET bodies with status 200 or 201 and no ETag of their own
+    also get a strong ETag from their content, and a 304 when the client
+    already has them. Responses that set Content-Encoding themselves
+    (precompressed snapshots) pass through untouched; streamed bodies are
+    compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        request_headers = scope['headers']
+        encoding = negotiate(header(request_headers, b'accept-encoding'))
+        conditional = scope['method'] == 'GET'
+        if_none_match = header(request_headers, b'if-none-match')
+        state = {'start': None, 'compressor': None}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                state['start'] = message
+            elif message['type'] == 'http.response.body' and state['start'] is not None:
+                start, state['start'] = state['start'], None
+                await self.begin(start, message, encoding, conditional, if_none_match, state, send)
+            elif message['type'] == 'http.response.body':
+                await self.stream(message, state, send)
+            else:
+                await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def begin(self, start, message, encoding, conditional, if_none_match, state, send):
+        headers = list(start['headers'])
+        body = message.get('body', b'')
+        more_body = message.get('more_body', False)
+        json_like = compressible(headers)
+        if json_like:
+            headers.append((b'vary', b'Accept-Encoding'))
+        # listings here answer GETs with 201 as well as 200
+        if not more_body and conditional and start['status'] in (200, 201) and json_like \
+                and header(headers, b'etag') is None:
+            etag = strong_etag(body)
+            headers.append((b'etag', encoded_etag(etag, encoding if len(body) >= self.minimum_size else None).encode()))
+            if etag_matches(if_none_match, etag):
+                headers = [(key, value) for key, value in headers if key.lower() != b'content-length']
+                await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b''})
+                return
+        if not encoding or not json_like or start['status'] in (204, 304) \
+                or (not more_body and len(body) < self.minimum_size):
+            await send(dict(start, headers=headers))
+            await send(message)
+            return
+        headers = [(key, value) for key, value in headers if key.lower() != b'content-length']
+        headers.append((b'content-encoding', encoding.encode()))
+        if not more_body:
+            body = await compress_async(body, encoding)
+            headers.append((b'content-length', str(len(body)).encode()))
+            await send(dict(start, headers=headers))
+            await send({'type': 'http.response.body', 'body': body})
+            return
+        state['compressor'] = Compressor(encoding)
+        await send(dict(start, headers=headers))
+        await self.stream(message, state, send)
+
+    async def stream(self, message, state, send):
+        compressor = state['compressor']
+        if compressor is None:
+            await send(message)
+            return
+        body = compressor.compress(message.get('body', b''))
+        more_body = message.get('more_body', False)
+        if not more_body:
+            body += compressor.flush()
+        # an empty chunk would read as the end of the stream to some servers
+        if body or not more_body:
+            await send({'type': 'http.response.body', 'body': body, 'more_body': more_body})
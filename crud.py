@@ -1,9 +1,25 @@
 from fastapi import Request, Response
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import and_, or_, desc, asc, func
-from tokens import create_access_token, check_token, decode_token
+from sqlalchemy import and_, or_, desc, asc, func, select, update, delete
+from tokens import (create_session_token, check_token, decode_token, is_session_token,
+        Principal, LEGACY_TOKENS, principal_cache, token_versions, REVOKED, password_hasher, login_budget, needs_rehash, DUMMY_HASH)
 import models as mod
+from db import engine, pool_metrics, SessionLocal
+from pagination import Pagination, paginate, to_page
+from tree import build_tree, build_subtree, columns, read_lineage, read_descendants, last_modified
+from snapshot import tree_snapshot
+import search
+from autocomplete import autocomplete_index
+from changes import SyncToken, read_changes
+import realtime
+from export import stream_cadastre, write_table, export_job, export_file
+import bulk
+import cascade
+import stats
+import hierarchy
+from cascade import CascadeProgress, CASCADE_BACKGROUND_ROWS
+from jobs import job_queue, job_accepted
 
 
 
@@ -12,28 +28,82 @@ import models as mod
 ########################
 
 
-async def admin_login(req: mod.LoginSchema, db: Session):
+ACCOUNT_MODELS = {
+    'admin' : mod.Admin,
+    'user'  : mod.Users,
+}
+
+
+# what account reads and responses show: every column but the password hash
+def public_columns(model):
+    return [column for column in model.__table__.columns if column.key != 'password']
+
+
+def public_account(account):
+    return {column.key: getattr(account, column.key) for column in public_columns(type(account))}
+
+
+
+async def admin_login(req: mod.LoginSchema, header_param: Request, db: AsyncSession):
+    address = header_param.client.host if header_param.client else None
+    if not login_budget.allow(req.username, address):
+        return -3
     result = await read_admin_by_username_password(req.username, req.password, db)
     if result:
-        return result
+        access_token = await create_session_token('admin', result.id, result.is_superadmin, result.token_version)
+        return dict(result._mapping, token=access_token)
     else:
+        login_budget.fail(req.username, address)
         return None
 
 
+# the live account with this username, served by the lower(username) index
+def credentials_query(model, username: str):
+    return select(model.id, model.password)\
+        .where(and_(
+            func.lower(model.username) == func.lower(username),
+            model.is_deleted == False,
+            model.is_active == True
+        ))
+
+
+# id of the live account with these credentials; plaintext and outdated hashes are rehashed on success
+async def verify_credentials(kind: str, username: str, password: str, db: AsyncSession):
+    model = ACCOUNT_MODELS[kind]
+    result = await db.execute(credentials_query(model, username))
+    result = result.first()
+    if not result:
+        await password_hasher.verify(password, DUMMY_HASH)
+        return None
+    if not await password_hasher.verify(password, result.password):
+        return None
+    if needs_rehash(result.password):
+        hashed = await password_hasher.hash(password)
+        await db.execute(update(model).where(and_(model.id == result.id, model.password == result.password))\
+            .values({model.password: hashed}).execution_options(synchronize_session=False))
+        await db.commit()
+    return result.id
+
+
+
 # read admin by username and password
-async def read_admin_by_username_password(username: str, password: str, db: Session):
-    result = db.query(
+async def read_admin_by_username_password(username: str, password: str, db: AsyncSession):
+    id = await verify_credentials('admin', username, password, db)
+    if not id:
+        return None
+    result = await db.execute(select(
         mod.Admin.id,
         mod.Admin.username,
         mod.Admin.token,
+        mod.Admin.token_version,
         mod.Admin.is_superadmin
     )\
-        .filter(and_(
-            mod.Admin.username   == username, 
-            mod.Admin.password   == password, 
+        .where(and_(
+            mod.Admin.id         == id,
             mod.Admin.is_deleted == False,
             mod.Admin.is_active  == True
-        )).first()
+        )))
+    result = result.first()
     if result:
         return result
     else:
@@ -41,17 +111,72 @@ async def read_admin_by_username_password(username: str, password: str, db: Sess
 
 
 
-# check admin is superadmin
-async def check_admin_is_superadmin(header_param: Request, db: Session):
+
+# current token version of an account, REVOKED once it is deleted or deactivated
+async def read_token_version(kind: str, id: int, db: AsyncSession):
+    model = ACCOUNT_MODELS[kind]
+    result = await db.execute(select(model.token_version)\
+        .where(and_(
+            model.id == id,
+            model.is_deleted == False,
+            model.is_active == True
+        )))
+    result = result.scalar()
+    if result is None:
+        return REVOKED
+    return result
+
+
+# session tokens verify in memory; the database is only asked when the account's version is not cached
+async def read_principal(kind: str, payload: dict, db: AsyncSession):
+    if payload.get('kind') != kind:
+        return None
+    id = int(payload['sub'])
+    version = token_versions.get(kind, id)
+    if version is None:
+        version = await read_token_version(kind, id, db)
+        token_versions.set(kind, id, version)
+    if version == REVOKED or version != payload['ver']:
+        return None
+    return Principal(id=id, kind=kind, is_superadmin=payload.get('su', False))
+
+
+# logs out every session of an account, here at once and in other workers within TOKEN_VERSION_TTL
+def revoke_tokens(kind: str, id: int):
+    principal_cache.invalidate(kind, id)
+    token_versions.invalidate(kind, id)
+
+
+
+# read admin by bearer token: session tokens by their claims, legacy ones cached per token until the account changes
+async def read_admin_by_token(header_param: Request, db: AsyncSession):
     token = await check_token(header_param=header_param)
     if not token:
         return None
     payload = await decode_token(token=token)
     if not payload:
         return None
+    if is_session_token(payload):
+        return await read_principal('admin', payload, db)
+    if not LEGACY_TOKENS:
+        return None
+    result = principal_cache.get('admin', token)
+    if result:
+        return result
     username: str = payload.get('username')
     password: str = payload.get('password')
     result = await read_admin_by_username_password(username=username, password=password, db=db)
+    if result:
+        principal_cache.set('admin', token, result)
+        return result
+    else:
+        return None
+
+
+
+# check admin is superadmin
+async def check_admin_is_superadmin(header_param: Request, db: AsyncSession):
+    result = await read_admin_by_token(header_param=header_param, db=db)
     if result and result.is_superadmin:
         return True
     else:
@@ -60,72 +185,72 @@ async def check_admin_is_superadmin(header_param: Request, db: Session):
 
 
 # create superadmin
-async def create_superadmin(req: mod.AdminBase, db: Session):
-    new_delete = db.query(mod.Admin).filter(mod.Admin.is_superadmin == True)\
-        .delete(synchronize_session=False)
-    db.commit()
-    new_dict = {
-        'username'  : req.username,
-        'password'  : req.password
-    }
-    access_token = await create_access_token(data=new_dict)
+async def create_superadmin(req: mod.AdminBase, db: AsyncSession):
+    new_delete = await db.execute(delete(mod.Admin).where(mod.Admin.is_superadmin == True)\
+        .execution_options(synchronize_session=False))
+    await db.commit()
+    principal_cache.clear('admin')
+    token_versions.clear('admin')
     new_add = mod.Admin(
         username        = req.username,
-        password        = req.password,
-        token           = access_token,
+        password        = await password_hasher.hash(req.password),
         is_active       = True,
         is_superadmin   = True
     )
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
-        return new_add
+        await db.flush()
+        new_add.token = await create_session_token('admin', new_add.id, True, 0)
+        await db.commit()
+        await db.refresh(new_add)
+        return public_account(new_add)
     else:
         return None
 
 
 
 # read all users
-async def read_all_users(header_param: Request, db: Session):
+async def read_all_users(header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(
+    result = await db.execute(select(
         mod.Users.id,
         mod.Users.username,
-        mod.Users.password,
         mod.Users.is_active,
         mod.Users.create_at,
         mod.Users.update_at
     )\
-        .filter(and_(
+        .where(and_(
             mod.Users.is_deleted == False,
-        )).order_by(desc(mod.Users.id)).distinct().all()
+        )).order_by(desc(mod.Users.id)).distinct())
+    result = result.all()
     return result
 
 
 # read user
-async def read_user(id, header_param: Request, db: Session):
+async def read_user(id, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Users)\
-        .filter(and_(
-            mod.Users.id == id, 
+    result = await db.execute(select(*public_columns(mod.Users))\
+        .where(and_(
+            mod.Users.id == id,
             mod.Users.is_deleted == False,
-        )).first()
+        )))
+    result = result.first()
     return result
 
 # read all admin
-async def read_all_admins(header_param: Request, db: Session):
+async def read_all_admins(header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Admin)\
-        .filter(and_(
+    result = await db.execute(select(*public_columns(mod.Admin))\
+        .where(and_(
             mod.Admin.is_deleted == False,
-        )).order_by(desc(mod.Admin.id)).distinct().all()
+        )).order_by(desc(mod.Admin.id)).distinct())
+    result = result.all()
     if result:
         return result
     else:
@@ -133,15 +258,16 @@ async def read_all_admins(header_param: Request, db: Session):
 
 
 # read admin
-async def read_admin(id, header_param: Request, db: Session):
+async def read_admin(id, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Admin)\
-        .filter(and_(
-            mod.Admin.id == id, 
+    result = await db.execute(select(*public_columns(mod.Admin))\
+        .where(and_(
+            mod.Admin.id == id,
             mod.Admin.is_deleted == False,
-        )).first()
+        )))
+    result = result.first()
     if result:
         return result
     else:
@@ -150,83 +276,88 @@ async def read_admin(id, header_param: Request, db: Session):
 
 
 # create admin
-async def create_admin(req: mod.AdminBase, db: Session, header_param):
+async def create_admin(req: mod.AdminBase, db: AsyncSession, header_param):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
     if req.username == "" or req.password == "" or ' ' in req.username or ' ' in req.password:
         return None
-    user_exist = db.query(mod.Admin)\
-        .filter(mod.Users.username == req.username).first()
+    user_exist = await db.execute(select(mod.Admin)\
+        .where(func.lower(mod.Admin.username) == req.username.lower()))
+    user_exist = user_exist.scalars().first()
     if user_exist:
         return -2
-    new_dict = {
-        'username'  : req.username,
-        'password'  : req.password
-    }
-    access_token = await create_access_token(data=new_dict)
     new_add = mod.Admin(
         username        = req.username,
-        password        = req.password,
-        token           = access_token,
+        password        = await password_hasher.hash(req.password),
     )
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
-        return new_add
+        await db.flush()
+        new_add.token = await create_session_token('admin', new_add.id, False, 0)
+        await db.commit()
+        await db.refresh(new_add)
+        return public_account(new_add)
     else:
         return None
 
 
 
 # update admin
-async def update_admin(id, req: mod.AdminBase, header_param: Request, db: Session):
+async def update_admin(id, req: mod.AdminBase, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    user_exist = db.query(mod.Admin)\
-        .filter(and_(mod.Admin.username == req.username)).first()
-    
+    user_exist = await db.execute(select(mod.Admin)\
+        .where(func.lower(mod.Admin.username) == req.username.lower()))
+    user_exist = user_exist.scalars().first()
+
     if user_exist and user_exist.id != id:
         return -2
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Admin).filter(mod.Admin.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    req_json['password'] = await password_hasher.hash(req.password)
+    req_json['token_version'] = mod.Admin.token_version + 1
+    new_update = await db.execute(update(mod.Admin).where(mod.Admin.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    revoke_tokens('admin', id)
+    if new_update.rowcount:
         return True
     else:
         return None
 
 
 # set is delete true
-async def delete_admin(id, req: mod.UserDelete, header_param: Request, db: Session):
+async def delete_admin(id, req: mod.UserDelete, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    new_delete = db.query(mod.Admin).filter(mod.Admin.id == id)\
-        .update({
-            mod.Admin.is_deleted     : req.is_deleted
-        }, synchronize_session=False)
-    db.commit()
-    if new_delete:
+    new_delete = await db.execute(update(mod.Admin).where(mod.Admin.id == id)\
+        .values({
+            mod.Admin.is_deleted     : req.is_deleted,
+            mod.Admin.token_version  : mod.Admin.token_version + 1
+        }).execution_options(synchronize_session=False))
+    await db.commit()
+    revoke_tokens('admin', id)
+    if new_delete.rowcount:
         return True
     else:
         return None
 
 
 # update admin is active
-async def update_admin_is_active(id, req: mod.UserActiveSet, header_param: Request, db: Session):
+async def update_admin_is_active(id, req: mod.UserActiveSet, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    new_update = db.query(mod.Admin).filter(mod.Admin.id == id)\
-        .update({
-            mod.Admin.is_active     : req.is_active
-        }, synchronize_session=False)
-    db.commit()
-    if new_update:
+    new_update = await db.execute(update(mod.Admin).where(mod.Admin.id == id)\
+        .values({
+            mod.Admin.is_active     : req.is_active,
+            mod.Admin.token_version : mod.Admin.token_version + 1
+        }).execution_options(synchronize_session=False))
+    await db.commit()
+    revoke_tokens('admin', id)
+    if new_update.rowcount:
         return True
     else:
         return None
@@ -234,24 +365,46 @@ async def update_admin_is_active(id, req: mod.UserActiveSet, header_param: Reque
 
 
 
+# read principal cache counters
+async def read_auth_cache_stats(header_param: Request, db: AsyncSession):
+    user = await check_admin_is_superadmin(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return dict(principal_cache.stats(), token_versions=token_versions.stats(),
+            passwords=dict(password_hasher.stats(), refused_logins=login_budget.refused))
+
+
+async def read_db_pool_stats(header_param: Request, db: AsyncSession):
+    user = await check_admin_is_superadmin(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return pool_metrics.snapshot(engine.sync_engine.pool)
+
+
+
+
 #######################
 # USER AUTHENTICATION #
 #######################
 
 
 # read user by username and password
-async def read_user_by_username_password(username: str, password: str, db: Session):
-    result = db.query(
+async def read_user_by_username_password(username: str, password: str, db: AsyncSession):
+    id = await verify_credentials('user', username, password, db)
+    if not id:
+        return False
+    result = await db.execute(select(
         mod.Users.id,
         mod.Users.username,
-        mod.Users.token
+        mod.Users.token,
+        mod.Users.token_version
     )\
-        .filter(and_(
-            mod.Users.username == username,
-            mod.Users.password == password,
+        .where(and_(
+            mod.Users.id == id,
             mod.Users.is_deleted == False,
             mod.Users.is_active == True
-        )).first()
+        )))
+    result = result.first()
     if result:
         return result
     else:
@@ -259,62 +412,94 @@ async def read_user_by_username_password(username: str, password: str, db: Sessi
 
 
 
+# read user by bearer token: session tokens by their claims, legacy ones cached per token until the account changes
+async def read_user_by_token(header_param: Request, db: AsyncSession):
+    token = await check_token(header_param=header_param)
+    if not token:
+        return None
+    payload = await decode_token(token=token)
+    if not payload:
+        return None
+    if is_session_token(payload):
+        return await read_principal('user', payload, db)
+    if not LEGACY_TOKENS:
+        return None
+    result = principal_cache.get('user', token)
+    if result:
+        return result
+    username: str = payload.get('username')
+    password: str = payload.get('password')
+    result = await read_user_by_username_password(username=username, password=password, db=db)
+    if result:
+        principal_cache.set('user', token, result)
+        return result
+    else:
+        return None
+
+
+
 # user login
-async def user_login(req: mod.LoginSchema, db: Session):
+async def user_login(req: mod.LoginSchema, header_param: Request, db: AsyncSession):
+    address = header_param.client.host if header_param.client else None
+    if not login_budget.allow(req.username, address):
+        return -3
     result = await read_user_by_username_password(req.username, req.password, db)
     if result:
-        return result
+        access_token = await create_session_token('user', result.id, False, result.token_version)
+        return dict(result._mapping, token=access_token)
     else:
+        login_budget.fail(req.username, address)
         return None
 
 
 
 # create user
-async def create_user(req: mod.UserBase, header_param: Request, db: Session):
+async def create_user(req: mod.UserBase, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
     if req.username == "" or req.password == "" or ' ' in req.username or ' ' in req.password:
         return None
-    user_exist = db.query(mod.Users)\
-        .filter(mod.Users.username == req.username).first()
+    user_exist = await db.execute(select(mod.Users)\
+        .where(func.lower(mod.Users.username) == req.username.lower()))
+    user_exist = user_exist.scalars().first()
     if user_exist:
         return -2
-    new_dict = {
-        'username'  : req.username,
-        'password'  : req.password
-    }
-    access_token = await create_access_token(data=new_dict)
     new_add = mod.Users(
         username    = req.username,
-        password    = req.password,
-        token       = access_token
+        password    = await password_hasher.hash(req.password)
     )
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
-        return new_add
+        await db.flush()
+        new_add.token = await create_session_token('user', new_add.id, False, 0)
+        await db.commit()
+        await db.refresh(new_add)
+        return public_account(new_add)
     else:
         return None
 
 
 
 # update user
-async def update_user(id: int, req: mod.UserBase, header_param: Request, db: Session):
+async def update_user(id: int, req: mod.UserBase, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    user_exist = db.query(mod.Users)\
-        .filter(and_(mod.Users.username == req.username)).first()
-    
+    user_exist = await db.execute(select(mod.Users)\
+        .where(func.lower(mod.Users.username) == req.username.lower()))
+    user_exist = user_exist.scalars().first()
+
     if user_exist and user_exist.id != id:
         return -2
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Users).filter(mod.Users.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    req_json['password'] = await password_hasher.hash(req.password)
+    req_json['token_version'] = mod.Users.token_version + 1
+    new_update = await db.execute(update(mod.Users).where(mod.Users.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    revoke_tokens('user', id)
+    if new_update.rowcount:
         return True
     else:
         return None
@@ -322,16 +507,18 @@ async def update_user(id: int, req: mod.UserBase, header_param: Request, db: Ses
 
 
 # delete user
-async def delete_user(id: int, req: mod.UserDelete, header_param: Request, db: Session):
+async def delete_user(id: int, req: mod.UserDelete, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    new_delete = db.query(mod.Users).filter(mod.Users.id == id)\
-        .update({
-            mod.Users.is_deleted  : req.is_deleted
-        }, synchronize_session=False)
-    db.commit()
-    if new_delete:
+    new_delete = await db.execute(update(mod.Users).where(mod.Users.id == id)\
+        .values({
+            mod.Users.is_deleted  : req.is_deleted,
+            mod.Users.token_version : mod.Users.token_version + 1
+        }).execution_options(synchronize_session=False))
+    await db.commit()
+    revoke_tokens('user', id)
+    if new_delete.rowcount:
         return True
     else:
         return None
@@ -339,16 +526,18 @@ async def delete_user(id: int, req: mod.UserDelete, header_param: Request, db: S
 
 
 # update user is active
-async def update_user_is_active(id: int, req: mod.UserActiveSet, header_param: Request, db: Session):
+async def update_user_is_active(id: int, req: mod.UserActiveSet, header_param: Request, db: AsyncSession):
     user = await check_admin_is_superadmin(header_param=header_param, db=db)
     if not user:
         return -1
-    new_update = db.query(mod.Users).filter(mod.Users.id == id)\
-    .update({
-        mod.Users.is_active  : req.is_active
-    }, synchronize_session=False)
-    db.commit()
-    if new_update:
+    new_update = await db.execute(update(mod.Users).where(mod.Users.id == id)\
+    .values({
+        mod.Users.is_active  : req.is_active,
+        mod.Users.token_version : mod.Users.token_version + 1
+    }).execution_options(synchronize_session=False))
+    await db.commit()
+    revoke_tokens('user', id)
+    if new_update.rowcount:
         return True
     else:
         return None
@@ -356,32 +545,16 @@ async def update_user_is_active(id: int, req: mod.UserActiveSet, header_param: R
 
 
 
-async def check_admin_token(header_param: Request, db: Session):
-    token = await check_token(header_param=header_param)
-    if not token:
-        return None
-    payload = await decode_token(token=token)
-    if not payload:
-        return None
-    username: str = payload.get('username')
-    password: str = payload.get('password')
-    result = await read_admin_by_username_password(username=username, password=password, db=db)
+async def check_admin_token(header_param: Request, db: AsyncSession):
+    result = await read_admin_by_token(header_param=header_param, db=db)
     if result:
         return True
     else:
         return None
 
 
-async def check_user_token(header_param: Request, db: Session):
-    token = await check_token(header_param=header_param)
-    if not token:
-        return None
-    payload = await decode_token(token=token)
-    if not payload:
-        return None
-    username: str = payload.get('username')
-    password: str = payload.get('password')
-    result = await read_user_by_username_password(username=username, password=password, db=db)
+async def check_user_token(header_param: Request, db: AsyncSession):
+    result = await read_user_by_token(header_param=header_param, db=db)
     if result:
         return True
     else:
@@ -389,21 +562,140 @@ async def check_user_token(header_param: Request, db: Session):
 
 
 
+############
+# TAXONOMY #
+############
+
+
+# called after every committed taxonomy write
+# `subtree` when rows below the node changed as well (a move, a cascade); `previous`
+# holds the ancestor ids a moved node had before
+def taxonomy_changed(level: str, id: int, operation: str, fields: dict = None, subtree: bool = False,
+        previous: dict = None):
+    if subtree:
+        tree_snapshot.bump()
+    else:
+        # a listing shows its own level and the ones below it
+        tree_snapshot.bump(*[ancestor.name for ancestor in hierarchy.ancestors_of(level)], level)
+    autocomplete_index.apply(level, id, operation, fields)
+    search.trigram_index.apply(level, id, operation, fields, subtree)
+    realtime.publish(level, id, operation, fields, previous)
+
+
+
+# full listing of a level served from the in-memory snapshot
+async def read_admin_tree_snapshot(level: str, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    model = mod.LEVELS_BY_NAME[level].model
+
+    async def build():
+        result = await db.execute(paginate(select(*columns(model))\
+            .where(model.is_deleted == False), model))
+        return await build_tree(db, level, result.all())
+
+    return await tree_snapshot.get(level, build, lambda: last_modified(db, level))
+
+
+
+# a node with everything under it, soft (is_deleted) or for good; big subtrees finish in the background
+async def delete_taxon(level: str, id: int, soft: bool, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    model = mod.LEVELS_BY_NAME[level].model
+    result = await db.execute(select(*columns(model)).where(model.id == id))
+    root = result.first()
+    if root is None or (soft and root.is_deleted):
+        return None
+    # ancestor ids, so realtime subscribers of the enclosing subtrees hear about it
+    fields = {key: value for key, value in root._mapping.items() if key.endswith('_id')}
+    counts = await cascade.count_subtree(db, level, id, soft)
+    progress = CascadeProgress(level, id, soft, counts)
+    if sum(counts.values()) > CASCADE_BACKGROUND_ROWS:
+        job = await job_queue.submit('cascade_delete', cascade_job, progress, fields, detail=progress.as_dict())
+        return job_accepted(job)
+    await cascade.delete_subtree(db, progress)
+    taxonomy_changed(level, id, 'delete', fields, subtree=True)
+    return {'msg': 'Удалено!', 'deleted': progress.done}
+
+
+# background half of delete_taxon
+async def cascade_job(job, progress: CascadeProgress, fields: dict):
+    progress.job = job
+    try:
+        async with SessionLocal() as db:
+            return await cascade.delete_subtree(db, progress)
+    finally:
+        # a failed cascade has still deleted part of the subtree
+        taxonomy_changed(progress.level, progress.id, 'delete', fields, subtree=True)
+
+
+
+# fills in the ancestor ids of an update from the node's new parent and, when that moves
+# the node, carries its subtree and their counts along; the ancestor ids it had before
+# the move, {} when it did not move, None when the parent does not exist
+async def move_taxon(level: str, id: int, req_json: dict, db: AsyncSession):
+    path = await hierarchy.parent_path(db, level, req_json)
+    if path is None:
+        return None
+    req_json.update(path)
+    current = await hierarchy.lock_node(db, level, id)
+    if current is None or all(current._mapping[key] == value for key, value in path.items()):
+        return {}
+    live = await cascade.count_subtree(db, level, id, True)
+    await stats.moved(db, level, current._mapping, path, live)
+    await hierarchy.move_subtree(db, level, id, path)
+    return {key: current._mapping[key] for key in path}
+
+
+
+# one node and its descendants down to `depth` levels
+async def read_admin_subtree(level: str, id: int, depth: int, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return await build_subtree(db, level, id, depth)
+
+
+
+# path from the department down to one node
+async def read_admin_lineage(level: str, id: int, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return await read_lineage(db, level, id)
+
+
+# every live `child` row under one node, e.g. all families of a class, newest first
+async def read_admin_descendants(level: str, id: int, child: str, header_param: Request, db: AsyncSession,
+        page: Pagination = None):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    if child not in [descendant.name for descendant in hierarchy.descendants_of(level)]:
+        return None
+    return await read_descendants(db, level, id, child, page)
+
+
+
 ##############
 # DEPARTMENT #
 ##############
 
 
-
-async def create_department(header_param: Request, req: mod.DepartmentSchema, db: Session):
+async def create_department(header_param: Request, req: mod.DepartmentSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
     new_add = mod.Department(**req.dict())
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
+        await stats.created(db, 'department', req.dict())
+        await db.commit()
+        await db.refresh(new_add)
+        taxonomy_changed('department', new_add.id, 'create', req.dict())
         return new_add
     else:
         return None
@@ -411,15 +703,16 @@ async def create_department(header_param: Request, req: mod.DepartmentSchema, db
 
 
 
-async def update_department(id, header_param, req: mod.DepartmentSchema, db: Session):
+async def update_department(id, header_param, req: mod.DepartmentSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Department).filter(mod.Department.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    new_update = await db.execute(update(mod.Department).where(mod.Department.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    if new_update.rowcount:
+        taxonomy_changed('department', id, 'update', req_json)
         return True
     else:
         return None
@@ -427,19 +720,13 @@ async def update_department(id, header_param, req: mod.DepartmentSchema, db: Ses
 
 
 
-async def read_admin_departments(header_param, db: Session):
+async def read_admin_departments(header_param, db: AsyncSession, page: Pagination = None):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Department)\
-        .options(joinedload(mod.Department.class_rel)\
-            .options(joinedload(mod.Class.subclass)\
-                .options(joinedload(mod.Subclass.supersubclass)\
-                    .options(joinedload(mod.Supersubclass.order)\
-                        .options(joinedload(mod.Order.suborder)\
-                            .options(joinedload(mod.Suborder.family)))))))\
-                            .filter(mod.Department.is_deleted == False)\
-                                .order_by(desc(mod.Department.id)).all()
+    result = await db.execute(paginate(select(*columns(mod.Department))\
+        .where(mod.Department.is_deleted == False), mod.Department, page))
+    result = await build_tree(db, 'department', to_page(result.all(), page))
     if result:
         return result
     else:
@@ -448,27 +735,21 @@ async def read_admin_departments(header_param, db: Session):
 
 
 
-async def delete_department(id, header_param: Request, db: Session):
-    user = await check_admin_token(header_param=header_param, db=db)
-    if not user:
-        return -1
-    new_delete = db.query(mod.Department).filter(mod.Department.id == id)\
-        .delete(synchronize_session=False)
-    db.commit()
-    if new_delete:
-        result = {'msg': 'Удалено!'}
-        return result
-    
+async def delete_department(id, header_param: Request, db: AsyncSession, soft: bool = False):
+    return await delete_taxon('department', id, soft, header_param, db)
+
 
 #########
 # CLASS #
 #########
 
 
-async def create_class(req: mod.ClassSchema, header_param, db: Session):
+async def create_class(req: mod.ClassSchema, header_param, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
+    if await hierarchy.parent_path(db, 'class', req.dict()) is None:
+        return None
     new_add = mod.Class(
         name_lt     = req.name_lt,
         name_ru     = req.name_ru,
@@ -476,41 +757,42 @@ async def create_class(req: mod.ClassSchema, header_param, db: Session):
     )
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
+        await stats.created(db, 'class', req.dict())
+        await db.commit()
+        await db.refresh(new_add)
+        taxonomy_changed('class', new_add.id, 'create', req.dict())
         return new_add
     else:
         return None
 
 
 
-async def update_class(id, header_param, req: mod.ClassSchema, db: Session):
+async def update_class(id, header_param, req: mod.ClassSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Class).filter(mod.Class.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    moved = await move_taxon('class', id, req_json, db)
+    if moved is None:
+        return None
+    new_update = await db.execute(update(mod.Class).where(mod.Class.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    if new_update.rowcount:
+        taxonomy_changed('class', id, 'update', req_json, subtree=bool(moved), previous=moved)
         return True
     else:
-        return None    
+        return None
 
 
 
-async def read_admin_classes(header_param: Request, db: Session):
+async def read_admin_classes(header_param: Request, db: AsyncSession, page: Pagination = None):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Class)\
-        .options(joinedload(mod.Class.subclass)\
-            .options(joinedload(mod.Subclass.supersubclass)\
-                .options(joinedload(mod.Supersubclass.order)\
-                    .options(joinedload(mod.Order.suborder)\
-                        .options(joinedload(mod.Suborder.family))))))\
-                            .filter(mod.Class.is_deleted == False)\
-                                .order_by(desc(mod.Class.id)).all()
+    result = await db.execute(paginate(select(*columns(mod.Class))\
+        .where(mod.Class.is_deleted == False), mod.Class, page))
+    result = await build_tree(db, 'class', to_page(result.all(), page))
     if result:
         return result
     else:
@@ -526,47 +808,53 @@ async def read_admin_classes(header_param: Request, db: Session):
 
 
 
-async def create_subclass(header_param, req: mod.SubclassSchema, db: Session):
+async def create_subclass(header_param, req: mod.SubclassSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    new_add = mod.Subclass(**req.dict())
+    path = await hierarchy.parent_path(db, 'subclass', req.dict())
+    if path is None:
+        return None
+    fields = dict(req.dict(), **path)
+    new_add = mod.Subclass(**fields)
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
+        await stats.created(db, 'subclass', fields)
+        await db.commit()
+        await db.refresh(new_add)
+        taxonomy_changed('subclass', new_add.id, 'create', fields)
         return new_add
     else:
         return None
 
 
 
-async def update_subclass(id, header_param, req: mod.SubclassSchema, db: Session):
+async def update_subclass(id, header_param, req: mod.SubclassSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Subclass).filter(mod.Subclass.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    moved = await move_taxon('subclass', id, req_json, db)
+    if moved is None:
+        return None
+    new_update = await db.execute(update(mod.Subclass).where(mod.Subclass.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    if new_update.rowcount:
+        taxonomy_changed('subclass', id, 'update', req_json, subtree=bool(moved), previous=moved)
         return True
     else:
         return None
 
 
 
-async def read_admin_subclass(header_param, db: Session):
+async def read_admin_subclass(header_param, db: AsyncSession, page: Pagination = None):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Subclass)\
-        .options(joinedload(mod.Subclass.supersubclass)\
-            .options(joinedload(mod.Supersubclass.order)\
-                .options(joinedload(mod.Order.suborder)\
-                    .options(joinedload(mod.Suborder.family)))))\
-                        .filter(mod.Subclass.is_deleted == False)\
-                            .order_by(desc(mod.Subclass.id)).all()
+    result = await db.execute(paginate(select(*columns(mod.Subclass))\
+        .where(mod.Subclass.is_deleted == False), mod.Subclass, page))
+    result = await build_tree(db, 'subclass', to_page(result.all(), page))
     if result:
         return result
     else:
@@ -582,46 +870,53 @@ async def read_admin_subclass(header_param, db: Session):
 
 
 
-async def create_supersubclass(header_param: Request, req: mod.SupersubclassSchema, db: Session):
+async def create_supersubclass(header_param: Request, req: mod.SupersubclassSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    new_add = mod.Supersubclass(**req.dict())
+    path = await hierarchy.parent_path(db, 'supersubclass', req.dict())
+    if path is None:
+        return None
+    fields = dict(req.dict(), **path)
+    new_add = mod.Supersubclass(**fields)
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
+        await stats.created(db, 'supersubclass', fields)
+        await db.commit()
+        await db.refresh(new_add)
+        taxonomy_changed('supersubclass', new_add.id, 'create', fields)
         return new_add
     else:
         return None
 
 
 
-async def update_supersubclass(id, header_param: Request, req: mod.SupersubclassSchema, db: Session):
+async def update_supersubclass(id, header_param: Request, req: mod.SupersubclassSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Supersubclass).filter(mod.Supersubclass.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    moved = await move_taxon('supersubclass', id, req_json, db)
+    if moved is None:
+        return None
+    new_update = await db.execute(update(mod.Supersubclass).where(mod.Supersubclass.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    if new_update.rowcount:
+        taxonomy_changed('supersubclass', id, 'update', req_json, subtree=bool(moved), previous=moved)
         return True
     else:
         return None
 
 
 
-async def read_admin_supersubclass(header_param: Request, db: Session):
+async def read_admin_supersubclass(header_param: Request, db: AsyncSession, page: Pagination = None):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Supersubclass)\
-        .options(joinedload(mod.Supersubclass.order)\
-            .options(joinedload(mod.Order.suborder)\
-                .options(joinedload(mod.Suborder.family))))\
-                    .filter(mod.Supersubclass.is_deleted == False)\
-                        .order_by(desc(mod.Supersubclass.id)).all()
+    result = await db.execute(paginate(select(*columns(mod.Supersubclass))\
+        .where(mod.Supersubclass.is_deleted == False), mod.Supersubclass, page))
+    result = await build_tree(db, 'supersubclass', to_page(result.all(), page))
     if result:
         return result
     else:
@@ -634,45 +929,53 @@ async def read_admin_supersubclass(header_param: Request, db: Session):
 #########
 
 
-async def create_order(header_param: Request, req: mod.OrderSchema, db: Session):
+async def create_order(header_param: Request, req: mod.OrderSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    new_add = mod.Order(**req.dict())
+    path = await hierarchy.parent_path(db, 'order', req.dict())
+    if path is None:
+        return None
+    fields = dict(req.dict(), **path)
+    new_add = mod.Order(**fields)
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
+        await stats.created(db, 'order', fields)
+        await db.commit()
+        await db.refresh(new_add)
+        taxonomy_changed('order', new_add.id, 'create', fields)
         return new_add
     else:
         return None
 
 
 
-async def update_order(id: int, header_param: Request, req: mod.OrderSchema, db: Session):
+async def update_order(id: int, header_param: Request, req: mod.OrderSchema, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Order).filter(mod.Order.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    moved = await move_taxon('order', id, req_json, db)
+    if moved is None:
+        return None
+    new_update = await db.execute(update(mod.Order).where(mod.Order.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    if new_update.rowcount:
+        taxonomy_changed('order', id, 'update', req_json, subtree=bool(moved), previous=moved)
         return True
     else:
         return None
 
 
 
-async def read_admin_order(header_param: Request, db: Session):
+async def read_admin_order(header_param: Request, db: AsyncSession, page: Pagination = None):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Order)\
-        .options(joinedload(mod.Order.suborder)\
-            .options(joinedload(mod.Suborder.family)))\
-                .filter(mod.Order.is_deleted == False)\
-                    .order_by(desc(mod.Order.id)).all()
+    result = await db.execute(paginate(select(*columns(mod.Order))\
+        .where(mod.Order.is_deleted == False), mod.Order, page))
+    result = await build_tree(db, 'order', to_page(result.all(), page))
     if result:
         return result
     else:
@@ -686,86 +989,294 @@ async def read_admin_order(header_param: Request, db: Session):
 ############
 
 
-async def create_suborder(header_param, req, db: Session):
+async def create_suborder(header_param, req, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    new_add = mod.Suborder(**req.dict())
+    path = await hierarchy.parent_path(db, 'suborder', req.dict())
+    if path is None:
+        return None
+    fields = dict(req.dict(), **path)
+    new_add = mod.Suborder(**fields)
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
+        await stats.created(db, 'suborder', fields)
+        await db.commit()
+        await db.refresh(new_add)
+        taxonomy_changed('suborder', new_add.id, 'create', fields)
         return new_add
     else:
         return None
-    
-    
 
-async def update_suborder(id, header_param, req, db: Session):
+
+
+async def update_suborder(id, header_param, req, db: AsyncSession):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Suborder).filter(mod.Suborder.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
+    moved = await move_taxon('suborder', id, req_json, db)
+    if moved is None:
+        return None
+    new_update = await db.execute(update(mod.Suborder).where(mod.Suborder.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    if new_update.rowcount:
+        taxonomy_changed('suborder', id, 'update', req_json, subtree=bool(moved), previous=moved)
         return True
     else:
         return None
-    
-    
-async def read_admin_suborder(header_param, db: Session):
+
+
+async def read_admin_suborder(header_param, db: AsyncSession, page: Pagination = None):
     user = await check_admin_token(header_param=header_param, db=db)
     if not user:
         return -1
-    result = db.query(mod.Suborder)\
-        .options(joinedload(mod.Suborder.family))\
-            .filter(mod.Suborder.is_deleted == False)\
-                .order_by(desc(mod.Suborder.id)).all()
+    result = await db.execute(paginate(select(*columns(mod.Suborder))\
+        .where(mod.Suborder.is_deleted == False), mod.Suborder, page))
+    result = await build_tree(db, 'suborder', to_page(result.all(), page))
     if result:
         return result
     else:
         return None
-    
-    
-    
+
+
+
 ##########
 # FAMILY #
 ##########
 
 
-async def create_family(header_param: Request, req: mod.FamilySchema, db: Session):
+async def create_family(header_param: Request, req: mod.FamilySchema, db: AsyncSession):
     user = await check_admin_token(header_param, db)
     if not user:
         return -1
-    new_add = mod.Family(**req.dict())
+    path = await hierarchy.parent_path(db, 'family', req.dict())
+    if path is None:
+        return None
+    fields = dict(req.dict(), **path)
+    new_add = mod.Family(**fields)
     if new_add:
         db.add(new_add)
-        db.commit()
-        db.refresh(new_add)
+        await stats.created(db, 'family', fields)
+        await db.commit()
+        await db.refresh(new_add)
+        taxonomy_changed('family', new_add.id, 'create', fields)
         return new_add
-    
-    
-    
-async def update_family(id, header_param: Request, req: mod.FamilySchema, db: Session):
+
+
+
+async def update_family(id, header_param: Request, req: mod.FamilySchema, db: AsyncSession):
     user = await check_admin_token(header_param, db)
     if not user:
         return -1
     req_json = jsonable_encoder(req)
-    new_update = db.query(mod.Family).filter(mod.Family.id == id)\
-        .update(req_json, synchronize_session=False)
-    db.commit()
-    if new_update:
-        return True 
-    
-    
-    
-async def read_admin_family(header_param: Request, db: Session):
+    moved = await move_taxon('family', id, req_json, db)
+    if moved is None:
+        return None
+    new_update = await db.execute(update(mod.Family).where(mod.Family.id == id)\
+        .values(req_json).execution_options(synchronize_session=False))
+    await db.commit()
+    if new_update.rowcount:
+        taxonomy_changed('family', id, 'update', req_json, subtree=bool(moved), previous=moved)
+        return True
+
+
+
+async def read_admin_family(header_param: Request, db: AsyncSession, page: Pagination = None):
     user = await check_admin_token(header_param, db)
     if not user:
         return -1
-    result = db.query(mod.Family).filter(mod.Family.is_deleted == False)\
-        .order_by(desc(mod.Family.id)).all()
+    result = await db.execute(paginate(select(*columns(mod.Family))\
+        .where(mod.Family.is_deleted == False), mod.Family, page))
+    result = await build_tree(db, 'family', to_page(result.all(), page))
     if result:
-        return result
\ No newline at end of file
+        return result
+
+
+##########
+# EXPORT #
+##########
+
+
+# the stream opens its own session; the request's one is only used to authenticate
+async def export_cadastre(format: str, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return stream_cadastre(format)
+
+
+# one table or the lineage view as parquet, arrow or csv, written to the binary file `sink`
+async def export_columnar(table: str, format: str, sink, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return await write_table(db, table, format, sink)
+
+
+async def start_export_job(table: str, format: str, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    job = await job_queue.submit('export', export_job, table, format, detail={'table': table, 'format': format})
+    return job_accepted(job)
+
+
+
+###############
+# CHANGE FEED #
+###############
+
+
+async def read_admin_changes(since: str, limit: int, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return await read_changes(db, SyncToken.decode(since) if since else None, limit)
+
+
+
+##########
+# SEARCH #
+##########
+
+
+async def search_taxa(q: str, limit: int, offset: int, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    # the fallback index is still being built; -4 until it is ready
+    if not search.ready(db):
+        search.trigram_index.refresh()
+        return -4
+    result = await search.search(db, q, limit, offset)
+    if result:
+        return result
+    return None
+
+
+
+async def read_autocomplete(q: str, level: str, limit: int, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return autocomplete_index.suggest(q, level, limit)
+
+
+
+###############
+# BULK IMPORT #
+###############
+
+
+# the router checks the admin token before it reads the rows
+async def bulk_create(level_name: str, rows: list, atomic: bool, db: AsyncSession, background: bool = False):
+    if background:
+        job = await job_queue.submit('bulk_import', bulk_import_job, level_name, rows, atomic,
+                detail={'level': level_name, 'rows': len(rows)})
+        return job_accepted(job)
+    return await insert_bulk_rows(level_name, rows, atomic, db)
+
+
+async def bulk_import_job(job, level_name: str, rows: list, atomic: bool):
+    async with SessionLocal() as db:
+        return await insert_bulk_rows(level_name, rows, atomic, db, job)
+
+
+async def insert_bulk_rows(level_name: str, rows: list, atomic: bool, db: AsyncSession, job=None):
+    result = await bulk.insert_rows(db, level_name, rows, atomic, job)
+    if result['inserted']:
+        taxonomy_changed(level_name, None, 'bulk_create')
+    return result
+
+
+
+#########
+# STATS #
+#########
+
+
+# live rows per level over the whole cadastre
+async def read_stats(header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    # another worker may still be filling an empty table; -4 until it has
+    if await stats.is_empty(db):
+        return -4
+    return await stats.node_counts(db, stats.CADASTRE, 0)
+
+
+# live descendants of one node per level, read from the counter table rather than the subtree
+async def read_node_stats(level: str, id: int, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    if await stats.is_empty(db):
+        return -4
+    model = mod.LEVELS_BY_NAME[level].model
+    result = await db.execute(select(model.id).where(model.id == id))
+    if result.first() is None:
+        return None
+    return {'level': level, 'id': id, 'counts': await stats.node_counts(db, level, id)}
+
+
+# nodes of a level ordered by how many `child` rows they hold, e.g. orders by number of families
+async def read_ranked_stats(level: str, child: str, limit: int, offset: int, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    if await stats.is_empty(db):
+        return -4
+    if child not in [descendant.name for descendant in hierarchy.descendants_of(level)]:
+        return None
+    return await stats.ranked(db, level, child, limit, offset)
+
+
+async def start_stats_job(header_param: Request, db: AsyncSession):
+    user = await check_admin_is_superadmin(header_param=header_param, db=db)
+    if not user:
+        return -1
+    job = await job_queue.submit('stats_recompute', stats.recompute_job)
+    return job_accepted(job)
+
+
+
+########
+# JOBS #
+########
+
+
+async def read_job(id: str, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return await job_queue.get(id, db)
+
+
+# path of the file a finished export job wrote
+async def read_job_file(id: str, header_param: Request, db: AsyncSession):
+    user = await check_admin_token(header_param=header_param, db=db)
+    if not user:
+        return -1
+    return export_file(await job_queue.get(id, db))
+
+
+async def start_reindex_job(header_param: Request, db: AsyncSession):
+    user = await check_admin_is_superadmin(header_param=header_param, db=db)
+    if not user:
+        return -1
+    job = await job_queue.submit('reindex', reindex_job)
+    return job_accepted(job)
+
+
+# rebuild every in-memory read model from the tables
+async def reindex_job(job):
+    async with SessionLocal() as db:
+        await autocomplete_index.build(db)
+        await job.report(1, 2)
+        if db.bind.dialect.name != 'postgresql':
+            await search.trigram_index.build(db)
+    tree_snapshot.bump()
+    return {name: len(index.names) for name, index in autocomplete_index.levels.items()}
@@ -1 +1,4 @@
-from db.connection import get_db, engine, Base
\ No newline at end of file
+from db.connection import get_db, engine, Base, SessionLocal
+from db.pool import pool_metrics
+from db.migrations import migrate
+from db.soft_delete import exclude_deleted
\ No newline at end of file
@@ -1,25 +1,50 @@
-from sqlalchemy import create_engine
+import os
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from db.pool import InstrumentedQueuePool, instrument
 
-dbtype   = "postgresql"
-user     = "postgres"
-password = "183139"
-host     = "127.0.0.1"
-port     = "5432"
-db       = "plant_cadastre"
+dbtype   = os.getenv("DB_TYPE", "postgresql+asyncpg")
+user     = os.getenv("DB_USER", "postgres")
+password = os.getenv("DB_PASSWORD", "183139")
+host     = os.getenv("DB_HOST", "127.0.0.1")
+port     = os.getenv("DB_PORT", "5432")
+db       = os.getenv("DB_NAME", "plant_cadastre")
 
-SQLALCHEMY_DATABASE_URL = f"{ dbtype }://{ user }:{ password }@{ host }:{ port }/{ db }"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", f"{ dbtype }://{ user }:{ password }@{ host }:{ port }/{ db }")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# size these so workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under Postgres max_connections
+POOL_SIZE         = int(os.getenv("DB_POOL_SIZE", 5))
+MAX_OVERFLOW      = int(os.getenv("DB_MAX_OVERFLOW", 10))
+POOL_TIMEOUT      = float(os.getenv("DB_POOL_TIMEOUT", 30))
+
+# off by default, as in SQLAlchemy: pre-ping costs a round trip on every checkout. Turn them on
+# when something between the app and Postgres (a firewall, PgBouncer) drops idle connections
+POOL_RECYCLE      = int(os.getenv("DB_POOL_RECYCLE", -1))
+POOL_PRE_PING     = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+
+
+def pool_options(url: str):
+    # SQLite (local runs) keeps SQLAlchemy's default pool, which takes none of these
+    if url.startswith("sqlite"):
+        return {}
+    return {
+        "poolclass"     : InstrumentedQueuePool,
+        "pool_size"     : POOL_SIZE,
+        "max_overflow"  : MAX_OVERFLOW,
+        "pool_timeout"  : POOL_TIMEOUT,
+        "pool_recycle"  : POOL_RECYCLE,
+        "pool_pre_ping" : POOL_PRE_PING,
+    }
+
+
+engine = create_async_engine(SQLALCHEMY_DATABASE_URL, **pool_options(SQLALCHEMY_DATABASE_URL))
+instrument(engine.sync_engine)
+SessionLocal = sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
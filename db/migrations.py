@@ -0,0 +1,70 @@
+import logging
+from sqlalchemy import inspect
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex
+from db.connection import Base
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_index_if_missing(connection, index):
+    # IF NOT EXISTS instead of checkfirst: SQLite cannot reflect expression indexes
+    ddl = str(CreateIndex(index).compile(dialect=connection.dialect))
+    connection.exec_driver_sql(ddl.replace('INDEX ', 'INDEX IF NOT EXISTS ', 1))
+
+
+# create_all leaves existing tables alone; new columns need a server default so old rows get a value
+def ensure_columns(connection):
+    inspector = inspect(connection)
+    for table in Base.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            ddl = f'ALTER TABLE "{table.name}" ADD COLUMN {column.name} {column.type.compile(dialect=connection.dialect)}'
+            if column.server_default is not None:
+                ddl += f' DEFAULT {column.server_default.arg}'
+            connection.exec_driver_sql(ddl)
+            logger.info('added column %s.%s', table.name, column.name)
+
+
+# create_all only creates missing tables; indexes added to existing tables need their own pass
+def ensure_indexes(connection):
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                with connection.begin_nested():
+                    create_index_if_missing(connection, index)
+            except DBAPIError as e:
+                # e.g. existing rows violate a new unique index; the app keeps working without it
+                logger.warning('could not create index %s: %s', index.name, e.orig)
+
+
+# trigram GIN indexes behind /api/search; Postgres only, other databases use search.TrigramIndex
+def ensure_trigram_indexes(connection):
+    if connection.dialect.name != 'postgresql':
+        return
+    try:
+        with connection.begin_nested():
+            connection.exec_driver_sql('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    except DBAPIError as e:
+        logger.warning('could not enable pg_trgm, /api/search needs it: %s', e.orig)
+        return
+    for table in Base.metadata.sorted_tables:
+        for column in ('name_lt', 'name_ru'):
+            if column not in table.c:
+                continue
+            try:
+                with connection.begin_nested():
+                    connection.exec_driver_sql(f'CREATE INDEX IF NOT EXISTS ix_{table.name}_{column}_trgm '
+                            f'ON "{table.name}" USING gin ({column} gin_trgm_ops)')
+            except DBAPIError as e:
+                logger.warning('could not create trigram index on %s.%s: %s', table.name, column, e.orig)
+
+
+def migrate(connection):
+    Base.metadata.create_all(connection)
+    ensure_columns(connection)
+    ensure_indexes(connection)
+    ensure_trigram_indexes(connection)
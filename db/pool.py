@@ -0,0 +1,86 @@
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+
+class PoolMetrics:
+    """Counters for connection checkout waits and connection churn.
+
+    A wait is a checkout that found no idle connection and no room to open
+    one, so it queued until another request checked one in (or timed out).
+    """
+
+    def __init__(self):
+        self.checkouts = 0
+        self.waits = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+
+    def record_wait(self, seconds: float):
+        self.waits += 1
+        self.wait_seconds_total += seconds
+        self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def snapshot(self, pool=None):
+        result = {
+            'checkouts'             : self.checkouts,
+            'waits'                 : self.waits,
+            'wait_seconds_total'    : round(self.wait_seconds_total, 6),
+            'wait_seconds_avg'      : round(self.wait_seconds_total / self.waits, 6) if self.waits else 0.0,
+            'wait_seconds_max'      : round(self.wait_seconds_max, 6),
+            'timeouts'              : self.timeouts,
+            'connects'              : self.connects,
+            'closes'                : self.closes,
+            'invalidations'         : self.invalidations,
+        }
+        if isinstance(pool, InstrumentedQueuePool):
+            result.update({
+                'size'          : pool.size(),
+                'checked_out'   : pool.checkedout(),
+                'checked_in'    : pool.checkedin(),
+                'overflow'      : max(pool.overflow(), 0),
+                'max_overflow'  : pool._max_overflow,
+            })
+        return result
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Queue pool that times the checkouts that had to wait for a connection."""
+
+    def _do_get(self):
+        # an idle connection, or room for an overflow one, is handed out without queueing
+        if self.checkedin() or self._max_overflow == -1 or self.overflow() < self._max_overflow:
+            return super()._do_get()
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.record_wait(time.perf_counter() - start)
+
+
+def instrument(engine):
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_metrics.checkouts += 1
+
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        pool_metrics.connects += 1
+
+    @event.listens_for(engine, 'close')
+    def on_close(dbapi_connection, connection_record):
+        pool_metrics.closes += 1
+
+    @event.listens_for(engine, 'invalidate')
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.invalidations += 1
@@ -0,0 +1,24 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session, with_loader_criteria
+
+
+# models whose soft-deleted rows no ORM query returns, including relationship loads
+_criteria = []
+
+
+def exclude_deleted(*models):
+    """Hide rows with is_deleted set from every ORM select of `models`.
+
+    The filter also reaches joinedload/selectinload/lazy loads of their
+    relationships, so a deleted child never comes back under a live parent.
+    Pass execution_options(include_deleted=True) to see them anyway.
+    Selects over Table columns (tree.columns) are plain Core and unaffected.
+    """
+    for model in models:
+        _criteria.append(with_loader_criteria(model, lambda cls: cls.is_deleted == False, include_aliases=True))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def add_soft_delete_criteria(state):
+    if state.is_select and _criteria and not state.execution_options.get('include_deleted', False):
+        state.statement = state.statement.options(*_criteria)
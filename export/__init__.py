@@ -0,0 +1,4 @@
+from export.stream import stream_cadastre, walk, export_session, EXPORT_FORMATS
+from export.columnar import (write_table, available_formats, export_path, prune_exports,
+        COLUMNAR_FORMATS, TABLES)
+from export.jobs import export_job, export_file
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""Export taxonomy tables from the command line.
+
+    python -m export family --format parquet --out family.parquet
+    python -m export lineage --format csv --out lineage.csv
+    python -m export all --format arrow --out exports/
+    python -m export tree --format ndjson --out cadastre.ndjson
+
+Reads the database configured through the DB_* / DATABASE_URL variables.
+`all` writes every table of export.TABLES into the --out directory.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from db import engine
+from export import stream_cadastre, export_session, write_table, TABLES, COLUMNAR_FORMATS, EXPORT_FORMATS
+
+
+async def export_tree(format: str, path: str):
+    with open(path, 'wb') as sink:
+        async for chunk in stream_cadastre(format):
+            sink.write(chunk)
+
+
+async def export_tables(tables: list, format: str, out: str):
+    async with export_session() as db:
+        for table in tables:
+            path = os.path.join(out, f'{table}.{format}') if len(tables) > 1 else out
+            started = time.perf_counter()
+            with open(path, 'wb') as sink:
+                count = await write_table(db, table, format, sink)
+            print(f'{table:<14} {count:>10} rows  {os.path.getsize(path):>12} bytes  '
+                    f'{time.perf_counter() - started:>7.2f} s  {path}', file=sys.stderr)
+
+
+async def main():
+    parser = argparse.ArgumentParser(prog='python -m export')
+    parser.add_argument('table', choices=TABLES + ['all', 'tree'])
+    parser.add_argument('--format', default='parquet', choices=list(COLUMNAR_FORMATS) + list(EXPORT_FORMATS))
+    parser.add_argument('--out', required=True, help='output file, or directory for "all"')
+    args = parser.parse_args()
+    if (args.table == 'tree') != (args.format in EXPORT_FORMATS):
+        parser.error('tree exports as ndjson or json; tables as parquet, arrow or csv')
+    try:
+        if args.table == 'tree':
+            await export_tree(args.format, args.out)
+        elif args.table == 'all':
+            os.makedirs(args.out, exist_ok=True)
+            await export_tables(TABLES, args.format, args.out)
+        else:
+            await export_tables([args.table], args.format, args.out)
+    except ValueError as e:
+        parser.error(str(e))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
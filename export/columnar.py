@@ -0,0 +1,149 @@
+import asyncio
+import csv
+import io
+import os
+import tempfile
+import time
+from sqlalchemy import select, and_, Boolean, Integer, DateTime, Date, Float
+from sqlalchemy.ext.asyncio import AsyncSession
+from tree import columns
+import models as mod
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+# rows per record batch / parquet row group chunk
+COLUMNAR_BATCH_SIZE = 50000
+
+# where export jobs leave their files; with several app servers it has to be shared storage
+EXPORT_DIR = os.getenv('EXPORT_DIR', os.path.join(tempfile.gettempdir(), 'cadastre-exports'))
+
+# export job files older than this are removed when the next export job starts
+EXPORT_KEEP_SECONDS = float(os.getenv('EXPORT_KEEP_SECONDS', 24 * 3600))
+
+COLUMNAR_FORMATS = {
+    'parquet'   : 'application/vnd.apache.parquet',
+    'arrow'     : 'application/vnd.apache.arrow.file',
+    'csv'       : 'text/csv',
+}
+
+# every level on its own, plus one row per family with the ids and names of its whole lineage
+TABLES = [level.name for level in mod.LEVELS] + ['lineage']
+
+
+def export_path(job_id: str, format: str):
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    return os.path.join(EXPORT_DIR, f'{job_id}.{format}')
+
+
+def prune_exports():
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_KEEP_SECONDS
+    for entry in os.scandir(EXPORT_DIR):
+        if entry.is_file() and entry.stat().st_mtime < cutoff:
+            os.remove(entry.path)
+
+
+def available_formats():
+    return list(COLUMNAR_FORMATS) if pa is not None else ['csv']
+
+
+def lineage_query():
+    family = mod.Family
+    selected, joins = [], []
+    for level in mod.LEVELS:
+        model = level.model
+        selected += [model.id.label(f'{level.name}_id'), model.name_lt.label(f'{level.name}_name_lt'),
+                model.name_ru.label(f'{level.name}_name_ru')]
+        if model is not family:
+            joins.append((model, and_(getattr(family, level.id_key) == model.id, model.is_deleted == False)))
+    stmt = select(*selected).select_from(family)
+    for model, condition in joins:
+        stmt = stmt.join(model, condition)
+    return stmt.where(family.is_deleted == False).order_by(family.id)
+
+
+def table_query(table: str):
+    if table == 'lineage':
+        return lineage_query()
+    model = mod.LEVELS_BY_NAME[table].model
+    return select(*columns(model)).where(model.is_deleted == False).order_by(model.id)
+
+
+def arrow_type(column_type):
+    if isinstance(column_type, Boolean):
+        return pa.bool_()
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Float):
+        return pa.float64()
+    if isinstance(column_type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column_type, Date):
+        return pa.date32()
+    return pa.string()
+
+
+class CSVWriter:
+    def __init__(self, sink, names: list, types: list):
+        self.text = io.TextIOWrapper(sink, encoding='utf-8', newline='', write_through=True)
+        self.writer = csv.writer(self.text)
+        self.writer.writerow(names)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.text.flush()
+        self.text.detach()
+
+
+class ArrowWriter:
+    def __init__(self, sink, names: list, types: list, format: str):
+        self.schema = pa.schema([(name, arrow_type(type)) for name, type in zip(names, types)])
+        if format == 'parquet':
+            self.writer = pq.ParquetWriter(sink, self.schema, compression='zstd')
+        else:
+            self.writer = pa.ipc.new_file(sink, self.schema)
+
+    def write(self, rows):
+        values = list(zip(*rows))
+        arrays = [pa.array(column, type=field.type) for column, field in zip(values, self.schema)]
+        self.writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+def open_writer(format: str, sink, names: list, types: list):
+    if format == 'csv':
+        return CSVWriter(sink, names, types)
+    if format not in available_formats():
+        raise ValueError(f'{format} export needs pyarrow')
+    return ArrowWriter(sink, names, types, format)
+
+
+async def write_table(db: AsyncSession, table: str, format: str, sink):
+    """Write one table of TABLES to the binary file `sink` in batches; returns the row count.
+
+    Converting and writing a batch (and the parquet footer) is CPU and disk
+    work, so it runs on a thread while the event loop fetches the next one.
+    """
+    loop = asyncio.get_running_loop()
+    stmt = table_query(table)
+    types = [column.type for column in stmt.selected_columns]
+    result = await db.stream(stmt.execution_options(yield_per=COLUMNAR_BATCH_SIZE))
+    writer = await loop.run_in_executor(None, open_writer, format, sink, list(result.keys()), types)
+    count = 0
+    try:
+        async for rows in result.partitions():
+            await loop.run_in_executor(None, writer.write, rows)
+            count += len(rows)
+    finally:
+        await loop.run_in_executor(None, writer.close)
+    return count
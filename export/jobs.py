@@ -0,0 +1,24 @@
+import os
+from export.stream import export_session
+from export.columnar import write_table, export_path, prune_exports
+
+
+async def export_job(job, table: str, format: str):
+    """Write one table to a file kept for /api/jobs/{id}/download."""
+    prune_exports()
+    path = export_path(job.id, format)
+    async with export_session() as db:
+        with open(path, 'wb') as sink:
+            rows = await write_table(db, table, format, sink)
+    return {'file': os.path.basename(path), 'rows': rows}
+
+
+def export_file(job: dict):
+    """Path of the file a finished export job wrote, None while there is none to download."""
+    if not job or job['kind'] != 'export' or job['state'] != 'done':
+        return None
+    path = export_path(job['id'], job['detail']['format'])
+    if os.path.exists(path):
+        return path
+    else:
+        return None
@@ -0,0 +1,133 @@
+import heapq
+from contextlib import asynccontextmanager
+from sqlalchemy import select, and_
+from db import SessionLocal
+from serializer import dumps
+from tree import columns
+import models as mod
+
+
+# rows fetched per round trip from each server-side cursor
+EXPORT_BATCH_SIZE = 1000
+
+# bytes gathered before a chunk is handed to the response
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+EXPORT_FORMATS = {
+    'ndjson'    : 'application/x-ndjson',
+    'json'      : 'application/json',
+}
+
+
+def ancestor_keys(index: int):
+    return [level.id_key for level in mod.LEVELS[:index]]
+
+
+# the ancestor ids then the row id, so sorting by it puts every row right after its parent
+def path_key(index: int, row):
+    return tuple(row[key] for key in ancestor_keys(index)) + (row['id'],)
+
+
+@asynccontextmanager
+async def export_session():
+    async with SessionLocal() as db:
+        if db.bind.dialect.name == 'postgresql':
+            # one snapshot for the seven cursors, so a level never references rows the others miss
+            await db.connection(execution_options={'isolation_level': 'REPEATABLE READ'})
+        yield db
+
+
+async def level_rows(db, index: int):
+    level = mod.LEVELS[index]
+    model = level.model
+    keys = [getattr(model, key) for key in ancestor_keys(index)]
+    result = await db.stream(select(*columns(model))\
+        .where(and_(model.is_deleted == False, *[key.isnot(None) for key in keys]))\
+            .order_by(*keys, model.id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+    async for row in result.mappings():
+        yield dict(row)
+
+
+async def next_row(rows):
+    try:
+        return await rows.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def merged(db):
+    """(level index, row) of every level in path order: k-way merge of per-level cursors."""
+    heap = []
+    for index in range(len(mod.LEVELS)):
+        rows = level_rows(db, index)
+        row = await next_row(rows)
+        if row is not None:
+            heap.append((path_key(index, row), index, row, rows))
+    heapq.heapify(heap)
+    while heap:
+        _, index, row, rows = heap[0]
+        yield index, row
+        following = await next_row(rows)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (path_key(index, following), index, following, rows))
+
+
+OPEN, CLOSE = 'open', 'close'
+
+
+async def walk(db):
+    """Every live row from departments down to families, depth first.
+
+    Yields (OPEN, level index, row) when a node starts and (CLOSE, level
+    index, None) once all of its descendants are out. Memory stays at one
+    batch per level whatever the table sizes. Rows whose parent is deleted
+    or missing are skipped together with their descendants.
+    """
+    path = []
+    async for index, row in merged(db):
+        while len(path) > index:
+            path.pop()
+            yield CLOSE, len(path), None
+        if len(path) < index or (index and path[-1] != row[mod.LEVELS[index].parent_key]):
+            continue
+        path.append(row['id'])
+        yield OPEN, index, row
+    while path:
+        path.pop()
+        yield CLOSE, len(path), None
+
+
+def nested_json(event: str, index: int, row: dict, first: list):
+    """Bytes of the nested JSON array for one walk event; `first` tracks commas per depth."""
+    level = mod.LEVELS[index]
+    if event == CLOSE:
+        first.pop()
+        return b']}' if level.children_key else b''
+    prefix = b'' if first[-1] else b','
+    first[-1] = False
+    if not level.children_key:
+        first.append(True)
+        return prefix + dumps(row)
+    first.append(True)
+    return prefix + dumps(row)[:-1] + b',"' + level.children_key.encode() + b'":['
+
+
+async def stream_cadastre(format: str = 'ndjson'):
+    """Chunks of the whole cadastre, as NDJSON rows (with a `level` key) or one nested JSON array."""
+    async with export_session() as db:
+        buffer = bytearray(b'[' if format == 'json' else b'')
+        first = [True]
+        async for event, index, row in walk(db):
+            if format == 'json':
+                buffer += nested_json(event, index, row, first)
+            elif event == OPEN:
+                buffer += dumps(dict(row, level=mod.LEVELS[index].name)) + b'\n'
+            if len(buffer) >= EXPORT_CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+        if format == 'json':
+            buffer += b']'
+        if buffer:
+            yield bytes(buffer)
@@ -0,0 +1,66 @@
+from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from tree import columns
+import models as mod
+
+
+# Every level row carries the ids of all its ancestors (family.department_id
+# through family.suborder_id): a materialised path of fixed depth, indexed per
+# column. These helpers keep it consistent when nodes are created or moved.
+
+
+def ancestors_of(level_name: str):
+    return mod.LEVELS[:mod.LEVELS.index(mod.LEVELS_BY_NAME[level_name])]
+
+
+def descendants_of(level_name: str):
+    return mod.LEVELS[mod.LEVELS.index(mod.LEVELS_BY_NAME[level_name]) + 1:]
+
+
+def path_keys(level_name: str):
+    return [ancestor.id_key for ancestor in ancestors_of(level_name)]
+
+
+async def parent_path(db: AsyncSession, level_name: str, fields: dict):
+    """Ancestor ids for a `level_name` row under the parent named in `fields`.
+
+    They are read from the parent's own path, whatever `fields` says about
+    the levels above it. None when the parent is missing or deleted. The
+    parent row is share-locked, so it cannot move before the caller commits.
+    """
+    ancestors = ancestors_of(level_name)
+    if not ancestors:
+        return {}
+    parent_level = ancestors[-1]
+    model = parent_level.model
+    result = await db.execute(select(*columns(model))\
+        .where(and_(model.id == fields.get(parent_level.id_key), model.is_deleted == False))\
+            .with_for_update(read=True))
+    parent = result.first()
+    if parent is None:
+        return None
+    path = {key: parent._mapping[key] for key in path_keys(parent_level.name)}
+    path[parent_level.id_key] = parent.id
+    return path
+
+
+async def lock_node(db: AsyncSession, level_name: str, id: int):
+    """The node's current row, locked until commit; None if it does not exist."""
+    model = mod.LEVELS_BY_NAME[level_name].model
+    result = await db.execute(select(*columns(model)).where(model.id == id).with_for_update())
+    return result.first()
+
+
+async def move_subtree(db: AsyncSession, level_name: str, id: int, path: dict):
+    """Point every descendant of the node at its new ancestors, one UPDATE per level.
+
+    Only the columns above the node change; deleted rows move too, so a
+    restored row comes back under the right parent. Returns the rows moved.
+    """
+    root = mod.LEVELS_BY_NAME[level_name]
+    moved = 0
+    for level in descendants_of(level_name):
+        table = level.model.__table__
+        result = await db.execute(table.update().where(table.c[root.id_key] == id).values(path))
+        moved += result.rowcount
+    return moved
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from collections import Counter, deque
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, insert
+from db import SessionLocal
+from serializer import dumps
+import models as mod
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_limits(value: str):
+    limits = {}
+    for item in filter(None, value.split(',')):
+        kind, _, limit = item.partition('=')
+        limits[kind.strip()] = int(limit)
+    return limits
+
+
+# jobs running at once in this worker process, whatever their kind; each one holds
+# at most one pooled connection, so the rest of the pool stays with interactive requests
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+
+# jobs of one kind running at once, as "kind=n,kind=n"; kinds not listed get 1
+JOB_LIMITS = parse_limits(os.getenv('JOB_LIMITS', 'export=2'))
+
+# seconds between progress writes to the job table
+JOB_PROGRESS_INTERVAL = float(os.getenv('JOB_PROGRESS_INTERVAL', 1))
+
+# seconds between heartbeats of unfinished jobs; a job missing three is reported interrupted
+JOB_HEARTBEAT = float(os.getenv('JOB_HEARTBEAT', 30))
+
+# finished jobs kept in memory; older ones are still read from the table
+JOB_HISTORY = 100
+
+QUEUED, RUNNING, DONE, FAILED, INTERRUPTED = 'queued', 'running', 'done', 'failed', 'interrupted'
+
+# what /api/jobs/{id} shows
+FIELDS = ['id', 'kind', 'state', 'progress', 'detail', 'result', 'error', 'create_at', 'started_at', 'finished_at']
+
+# tells this process's job rows apart from other workers'
+OWNER = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+def storable(value):
+    # JSON columns go through the stdlib encoder; dates and rows need the app's serializer first
+    return None if value is None else json.loads(dumps(value))
+
+
+class Job:
+    """One queued or running operation; `function(job, *args)` does the work."""
+
+    def __init__(self, kind: str, function, args: tuple, detail: dict = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.function = function
+        self.args = args
+        self.state = QUEUED
+        self.progress = 0.0
+        self.detail = detail
+        self.result = None
+        self.error = None
+        self.create_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self._saved_at = None
+
+    async def report(self, done: int, total: int, detail: dict = None, persist: bool = True):
+        """Record progress; written to the table at most every JOB_PROGRESS_INTERVAL seconds.
+
+        Jobs in the middle of a write transaction pass persist=False: on
+        SQLite a second connection could not write until it commits.
+        """
+        self.progress = round(done / total, 4) if total else 1.0
+        if detail is not None:
+            self.detail = detail
+        if not persist:
+            return
+        now = datetime.now()
+        if self._saved_at is None or (now - self._saved_at).total_seconds() >= JOB_PROGRESS_INTERVAL:
+            self._saved_at = now
+            await save(self)
+
+    def values(self):
+        return {
+            'id'            : self.id,
+            'kind'          : self.kind,
+            'state'         : self.state,
+            'owner'         : OWNER,
+            'progress'      : self.progress,
+            'detail'        : storable(self.detail),
+            'result'        : storable(self.result),
+            'error'         : self.error,
+            'create_at'     : self.create_at,
+            'started_at'    : self.started_at,
+            'finished_at'   : self.finished_at
+        }
+
+    def as_dict(self):
+        values = self.values()
+        return {key: values[key] for key in FIELDS}
+
+
+async def save(job: Job, new: bool = False):
+    # a lost progress write must not fail the job itself
+    try:
+        async with SessionLocal() as db:
+            if new:
+                await db.execute(insert(mod.Job).values(job.values()))
+            else:
+                await db.execute(update(mod.Job).where(mod.Job.id == job.id).values(job.values()))
+            await db.commit()
+    except Exception:
+        logger.exception('could not save job %s', job.id)
+
+
+class JobQueue:
+    """In-process queue of admin jobs, at most `workers` running at once.
+
+    A job only starts while its kind is under its limit, so a burst of one
+    kind (say, cascade deletes) waits its turn without blocking other kinds.
+    Every job is mirrored to the job table, so any worker can report on it.
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, limits: dict = JOB_LIMITS):
+        self.workers = workers
+        self.limits = limits
+        self.jobs = {}
+        self._pending = deque()
+        self._running = Counter()
+        self._tasks = set()
+        self._heartbeat = None
+
+    def limit(self, kind: str):
+        return self.limits.get(kind, 1)
+
+    async def submit(self, kind: str, function, *args, detail: dict = None):
+        job = Job(kind, function, args, detail)
+        self.jobs[job.id] = job
+        await save(job, new=True)
+        self._pending.append(job)
+        self._dispatch()
+        return job
+
+    def _dispatch(self):
+        for job in list(self._pending):
+            if sum(self._running.values()) >= self.workers:
+                break
+            if self._running[job.kind] >= self.limit(job.kind):
+                continue
+            self._pending.remove(job)
+            self._running[job.kind] += 1
+            self._start(self._run(job))
+        if (self._pending or self._tasks) and (self._heartbeat is None or self._heartbeat.done()):
+            self._heartbeat = asyncio.get_running_loop().create_task(self._beat())
+
+    def _start(self, coroutine):
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, job: Job):
+        job.state = RUNNING
+        job.started_at = datetime.now()
+        try:
+            # inside the try: a shutdown can cancel the job while this is saved
+            await save(job)
+            job.result = await job.function(job, *job.args)
+            job.state = DONE
+            job.progress = 1.0
+        except asyncio.CancelledError:
+            job.state = INTERRUPTED
+            raise
+        except Exception as e:
+            logger.exception('%s job %s failed', job.kind, job.id)
+            job.state = FAILED
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now()
+            self._running[job.kind] -= 1
+            await save(job)
+            self._forget_old()
+            self._dispatch()
+
+    async def _beat(self):
+        while True:
+            await asyncio.sleep(JOB_HEARTBEAT)
+            ids = [job.id for job in self.jobs.values() if job.state in (QUEUED, RUNNING)]
+            if not ids:
+                return
+            try:
+                async with SessionLocal() as db:
+                    await db.execute(update(mod.Job).where(mod.Job.id.in_(ids))\
+                        .values({mod.Job.update_at: datetime.now()}).execution_options(synchronize_session=False))
+                    await db.commit()
+            except Exception:
+                logger.exception('job heartbeat failed')
+
+    def _forget_old(self):
+        finished = sorted((job.finished_at, id) for id, job in self.jobs.items() if job.finished_at)
+        for _, id in finished[:max(0, len(finished) - JOB_HISTORY)]:
+            del self.jobs[id]
+
+    async def get(self, id: str, db):
+        job = self.jobs.get(id)
+        if job:
+            return job.as_dict()
+        result = await db.execute(select(mod.Job).where(mod.Job.id == id))
+        row = result.scalars().first()
+        if row is None:
+            return None
+        record = {key: getattr(row, key) for key in FIELDS}
+        # queued or running in a worker that stopped heartbeating: it died with the job
+        if row.state in (QUEUED, RUNNING) and row.update_at < datetime.now() - timedelta(seconds=3 * JOB_HEARTBEAT):
+            record['state'] = INTERRUPTED
+        return record
+
+    async def shutdown(self):
+        # emptied first, or the cancelled jobs would start the queued ones as they finish
+        pending, self._pending = list(self._pending), deque()
+        if self._heartbeat:
+            self._heartbeat.cancel()
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for job in pending:
+            job.state = INTERRUPTED
+            await save(job)
+
+
+# what a route answers (with 202) when it handed its work to the queue
+def job_accepted(job: Job):
+    return {'job': job.id, 'status': f'/api/jobs/{job.id}'}
+
+
+job_queue = JobQueue()
@@ -8,9 +8,26 @@ from routers import (
     supersubclass_router,
     order_router,
     suborder_router,
-    family_router
+    family_router,
+    monitoring_router,
+    bulk_import_router,
+    metrics_router,
+    search_router,
+    tree_router,
+    changes_router,
+    socket_app,
+    export_router,
+    jobs_router,
+    stats_router
 )
-from db import Base, engine
+from db import engine, migrate, SessionLocal
+from pagination import NEXT_CURSOR_HEADER
+from metrics import MetricsMiddleware, instrument_engine
+from compression import CompressionMiddleware
+from autocomplete import autocomplete_index
+from search import trigram_index
+from jobs import job_queue
+import stats
 
 
 app = FastAPI(title='Plant Cadastre API')
@@ -26,9 +43,48 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=methods,
     allow_headers=headers,
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag"],
 )
+app.add_middleware(CompressionMiddleware)
+# added last, so it runs outermost and records compressed response sizes
+app.add_middleware(MetricsMiddleware)
+
+instrument_engine(engine.sync_engine)
+
+
+@app.on_event('startup')
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(migrate)
+
+
+@app.on_event('startup')
+async def build_autocomplete_index():
+    async with SessionLocal() as db:
+        await autocomplete_index.build(db)
+
+
+# pg_trgm answers searches on Postgres; elsewhere the in-process index is built in the
+# background, and /api/search answers 503 until it is ready
+@app.on_event('startup')
+async def build_search_index():
+    if engine.dialect.name != 'postgresql':
+        trigram_index.refresh()
+
+
+# a new or upgraded database starts with an empty counter table; it is filled before
+# this worker serves a request, and other workers' counter writes wait for the fill
+@app.on_event('startup')
+async def fill_stats():
+    async with SessionLocal() as db:
+        if await stats.is_empty(db):
+            await stats.recompute(db)
+
+
+@app.on_event('shutdown')
+async def stop_jobs():
+    await job_queue.shutdown()
 
-Base.metadata.create_all(engine)
 
 app.include_router(authentication_router)
 app.include_router(department_router)
@@ -37,4 +93,15 @@ app.include_router(subclass_router)
 app.include_router(supersubclass_router)
 app.include_router(order_router)
 app.include_router(suborder_router)
-app.include_router(family_router)
\ No newline at end of file
+app.include_router(family_router)
+app.include_router(monitoring_router)
+app.include_router(bulk_import_router)
+app.include_router(search_router)
+app.include_router(tree_router)
+app.include_router(changes_router)
+app.include_router(export_router)
+app.include_router(jobs_router)
+app.include_router(stats_router)
+app.include_router(metrics_router)
+
+app.mount('/ws', socket_app)
\ No newline at end of file
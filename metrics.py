@@ -0,0 +1,225 @@
+import re
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from sqlalchemy import event
+from starlette.routing import Match
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS    = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+ROW_BUCKETS     = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# distinct label sets per metric; anything past this is folded into one "other" series
+MAX_SERIES = 500
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series = {}
+
+    def _key(self, labels: dict):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        if key not in self._series and len(self._series) >= MAX_SERIES:
+            key = ('other',) * len(self.labels)
+        return key
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for key, value in sorted(self._series.items()):
+            lines.extend(self._render_series(key, value))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._series[key] = self._series.get(key, 0) + amount
+
+    def _render_series(self, key, value):
+        yield f'{self.name}{_labels(self.labels, key)} {value}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            # per-bucket counts, then sum and count
+            series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def _render_series(self, key, series):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), series):
+            cumulative += count
+            labels = _labels(self.labels, key, f'le="{bound}"')
+            yield f'{self.name}_bucket{labels} {cumulative}'
+        yield f'{self.name}_sum{_labels(self.labels, key)} {series[-2]}'
+        yield f'{self.name}_count{_labels(self.labels, key)} {series[-1]}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def add(self, metric: Metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.add(Counter('http_requests_total',
+        'HTTP requests by route template, method and status code.', ('route', 'method', 'status')))
+http_latency = registry.add(Histogram('http_request_duration_seconds',
+        'Time from receiving a request to sending the last body chunk.', ('route', 'method')))
+http_response_size = registry.add(Histogram('http_response_size_bytes',
+        'Response body size in bytes as sent, after compression (0 for a 304).', ('route', 'method'), SIZE_BUCKETS))
+db_latency = registry.add(Histogram('db_query_duration_seconds',
+        'Statement execution time by normalised statement fingerprint.', ('statement',)))
+db_errors = registry.add(Counter('db_query_errors_total',
+        'Statements that raised, by statement fingerprint.', ('statement',)))
+taxonomy_rows = registry.add(Histogram('taxonomy_rows_returned',
+        'Top-level rows returned by one read of a taxonomy level.', ('level',), ROW_BUCKETS))
+taxonomy_tree_nodes = registry.add(Counter('taxonomy_tree_nodes_total',
+        'Rows loaded per level while assembling taxonomy trees, children included.', ('level',)))
+
+
+###############
+# HTTP ROUTES #
+###############
+
+
+def route_template(scope):
+    for route in scope['app'].router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return 'unmatched'
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and body size per route template.
+
+    Added after CompressionMiddleware, so it wraps it and sees the bytes
+    that go on the wire.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        response = {'status': 500, 'size': 0}
+
+        async def send_wrapper(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+            elif message['type'] == 'http.response.body':
+                response['size'] += len(message.get('body', b''))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route, method = route_template(scope), scope['method']
+            http_latency.observe(time.perf_counter() - start, route=route, method=method)
+            http_response_size.observe(response['size'], route=route, method=method)
+            http_requests.inc(route=route, method=method, status=response['status'])
+
+
+##############
+# SQL TIMING #
+##############
+
+
+# DDL, PRAGMAs and savepoints would only crowd out the query series
+TIMED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+_LITERALS = [
+    (re.compile(r'\s+'), ' '),
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\$\d+(?:::[\w ]+?(?=[,) ]|$))?|%\(\w+\)s|:\w+'), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'^SELECT .+? FROM ', re.IGNORECASE), 'SELECT ... FROM '),
+]
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str):
+    """Statement text with literals, bind parameters and select lists collapsed."""
+    for pattern, replacement in _LITERALS:
+        statement = pattern.sub(replacement, statement)
+    return statement.strip()
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info['query_start'].pop()
+        if statement.lstrip()[:6].upper().startswith(TIMED_STATEMENTS):
+            db_latency.observe(time.perf_counter() - start, statement=fingerprint(statement))
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        starts = context.connection.info.get('query_start') if context.connection is not None else None
+        if starts:
+            starts.pop()
+        if context.statement:
+            db_errors.inc(statement=fingerprint(context.statement))
+
+
+def snapshot_metrics(prefix: str, values: dict, help: str, counters: tuple = ()):
+    """Collector lines for a dict of numeric stats: a counter named *_total for each
+    key in `counters` (running totals since start), a gauge for every other key."""
+    for key, value in values.items():
+        name, kind = f'{prefix}_{key}', 'gauge'
+        if key in counters:
+            name, kind = name if name.endswith('_total') else f'{name}_total', 'counter'
+        yield f'# HELP {name} {help}'
+        yield f'# TYPE {name} {kind}'
+        yield f'{name} {value}'
@@ -1,4 +1,5 @@
-from models.models import Users, Admin, Class, Department, Subclass, Supersubclass, Order, Suborder, Family
+from models.models import Users, Admin, Class, Department, Subclass, Supersubclass, Order, Suborder, Family, Tombstone, Job, TaxonCount
 from models.schemas import (AdminBase, UserBase, UserDelete, UserActiveSet, 
         ClassSchema, DepartmentSchema, LoginSchema, DeleteSchema, SubclassSchema, 
-        SupersubclassSchema, OrderSchema, SuborderSchema, FamilySchema)
\ No newline at end of file
+        SupersubclassSchema, OrderSchema, SuborderSchema, FamilySchema)
+from models.levels import Level, LEVELS, LEVELS_BY_NAME
\ No newline at end of file
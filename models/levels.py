@@ -0,0 +1,27 @@
+from collections import namedtuple
+from db import exclude_deleted
+from models.models import Department, Class, Subclass, Supersubclass, Order, Suborder, Family
+from models.schemas import (DepartmentSchema, ClassSchema, SubclassSchema, SupersubclassSchema,
+        OrderSchema, SuborderSchema, FamilySchema)
+
+
+# name         : level name used in urls and payloads
+# parent_key   : column holding the id of the level above
+# children_key : attribute the level below is nested under in tree responses
+# id_key       : column that descendant levels use to point at this level
+Level = namedtuple('Level', ['name', 'model', 'schema', 'parent_key', 'children_key', 'id_key'])
+
+
+LEVELS = [
+    Level('department'      , Department    , DepartmentSchema      , None                  , 'class_rel'       , 'department_id'),
+    Level('class'           , Class         , ClassSchema           , 'department_id'       , 'subclass'        , 'class_id'),
+    Level('subclass'        , Subclass      , SubclassSchema        , 'class_id'            , 'supersubclass'   , 'subclass_id'),
+    Level('supersubclass'   , Supersubclass , SupersubclassSchema   , 'subclass_id'         , 'order'           , 'supersubclass_id'),
+    Level('order'           , Order         , OrderSchema           , 'supersubclass_id'    , 'suborder'        , 'order_id'),
+    Level('suborder'        , Suborder      , SuborderSchema        , 'order_id'            , 'family'          , 'suborder_id'),
+    Level('family'          , Family        , FamilySchema          , 'suborder_id'         , None              , None),
+]
+
+LEVELS_BY_NAME = {level.name: level for level in LEVELS}
+
+exclude_deleted(*[level.model for level in LEVELS])
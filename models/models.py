@@ -1,9 +1,14 @@
-from sqlalchemy import Column, String, Integer, DateTime, Float, Boolean, ForeignKey, Date, Time
+from sqlalchemy import Column, String, Integer, DateTime, Float, Boolean, ForeignKey, Date, Time, Index, JSON, func
 from datetime import datetime
 from sqlalchemy.orm import relationship
 from db import Base
 
 
+# partial index over the rows reads actually return; every taxonomy read filters is_deleted = false
+def live_index(name: str, is_deleted, *columns):
+    return Index(name, *columns, postgresql_where=is_deleted == False, sqlite_where=is_deleted == False)
+
+
 # authentication model
 class Users(Base):
     __tablename__   = 'users'
@@ -11,11 +16,16 @@ class Users(Base):
     username        = Column(String)
     password        = Column(String)
     token           = Column(String)
+    token_version   = Column(Integer, default=0, server_default='0', nullable=False)
     is_active       = Column(Boolean, default=True)
     is_deleted      = Column(Boolean, default=False)
     create_at       = Column(DateTime, default=datetime.now)
     update_at       = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__  = (
+        Index('ix_users_username_lower', func.lower(username), unique=True),
+    )
+
 
 class Admin(Base):
     __tablename__   = 'admin'
@@ -23,12 +33,17 @@ class Admin(Base):
     username        = Column(String)
     password        = Column(String)
     token           = Column(String)
+    token_version   = Column(Integer, default=0, server_default='0', nullable=False)
     is_superadmin   = Column(Boolean, default=False)
     is_active       = Column(Boolean, default=False)
     is_deleted      = Column(Boolean, default=False)
     create_at       = Column(DateTime, default=datetime.now)
     update_at       = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__  = (
+        Index('ix_admin_username_lower', func.lower(username), unique=True),
+    )
+
 
 class Department(Base):
     __tablename__   = 'department'
@@ -39,6 +54,11 @@ class Department(Base):
     create_at       = Column(DateTime, default=datetime.now)
     update_at       = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__  = (
+        Index('ix_department_update_at_id', update_at, id),
+        live_index('ix_department_live_id', is_deleted, id),
+    )
+
     class_rel       = relationship('Class'          , cascade="all, delete", back_populates='department')
     subclass        = relationship('Subclass'       , cascade="all, delete", back_populates='department')
     supersubclass   = relationship('Supersubclass'  , cascade="all, delete", back_populates='department')
@@ -58,6 +78,12 @@ class Class(Base):
     create_at       = Column(DateTime, default=datetime.now)
     update_at       = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__  = (
+        Index('ix_class_department_id_is_deleted', department_id, is_deleted),
+        Index('ix_class_update_at_id', update_at, id),
+        live_index('ix_class_live_id', is_deleted, id),
+    )
+
     department      = relationship('Department'     , back_populates='class_rel')
     subclass        = relationship('Subclass'       , cascade="all, delete", back_populates='class_rel')
     supersubclass   = relationship('Supersubclass'  , cascade="all, delete", back_populates='class_rel')
@@ -79,6 +105,13 @@ class Subclass(Base):
     create_at       = Column(DateTime, default=datetime.now)
     update_at       = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__  = (
+        Index('ix_subclass_department_id_is_deleted', department_id, is_deleted),
+        Index('ix_subclass_class_id_is_deleted', class_id, is_deleted),
+        Index('ix_subclass_update_at_id', update_at, id),
+        live_index('ix_subclass_live_id', is_deleted, id),
+    )
+
     department      = relationship('Department'     , back_populates='subclass')
     class_rel       = relationship('Class'          , back_populates='subclass')
     supersubclass   = relationship('Supersubclass'  , cascade="all, delete", back_populates='subclass')
@@ -102,6 +135,14 @@ class Supersubclass(Base):
     create_at       = Column(DateTime, default=datetime.now)
     update_at       = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__  = (
+        Index('ix_supersubclass_department_id_is_deleted', department_id, is_deleted),
+        Index('ix_supersubclass_class_id_is_deleted', class_id, is_deleted),
+        Index('ix_supersubclass_subclass_id_is_deleted', subclass_id, is_deleted),
+        Index('ix_supersubclass_update_at_id', update_at, id),
+        live_index('ix_supersubclass_live_id', is_deleted, id),
+    )
+
     department      = relationship('Department' , back_populates='supersubclass')
     class_rel       = relationship('Class'      , back_populates='supersubclass')
     subclass        = relationship('Subclass'   , back_populates='supersubclass')
@@ -125,6 +166,15 @@ class Order(Base):
     create_at           = Column(DateTime, default=datetime.now)
     update_at           = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__      = (
+        Index('ix_order_department_id_is_deleted', department_id, is_deleted),
+        Index('ix_order_class_id_is_deleted', class_id, is_deleted),
+        Index('ix_order_subclass_id_is_deleted', subclass_id, is_deleted),
+        Index('ix_order_supersubclass_id_is_deleted', supersubclass_id, is_deleted),
+        Index('ix_order_update_at_id', update_at, id),
+        live_index('ix_order_live_id', is_deleted, id),
+    )
+
     department      = relationship('Department'     , back_populates='order')
     class_rel       = relationship('Class'          , back_populates='order')
     subclass        = relationship('Subclass'       , back_populates='order')
@@ -147,6 +197,16 @@ class Suborder(Base):
     create_at           = Column(DateTime, default=datetime.now)
     update_at           = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__      = (
+        Index('ix_suborder_department_id_is_deleted', department_id, is_deleted),
+        Index('ix_suborder_class_id_is_deleted', class_id, is_deleted),
+        Index('ix_suborder_subclass_id_is_deleted', subclass_id, is_deleted),
+        Index('ix_suborder_supersubclass_id_is_deleted', supersubclass_id, is_deleted),
+        Index('ix_suborder_order_id_is_deleted', order_id, is_deleted),
+        Index('ix_suborder_update_at_id', update_at, id),
+        live_index('ix_suborder_live_id', is_deleted, id),
+    )
+
     department          = relationship('Department'     , back_populates='suborder')
     class_rel           = relationship('Class'          , back_populates='suborder')
     subclass            = relationship('Subclass'       , back_populates='suborder')
@@ -171,10 +231,70 @@ class Family(Base):
     is_deleted          = Column(Boolean, default=False)
     create_at           = Column(DateTime, default=datetime.now)
     update_at           = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__      = (
+        Index('ix_family_department_id_is_deleted', department_id, is_deleted),
+        Index('ix_family_class_id_is_deleted', class_id, is_deleted),
+        Index('ix_family_subclass_id_is_deleted', subclass_id, is_deleted),
+        Index('ix_family_supersubclass_id_is_deleted', supersubclass_id, is_deleted),
+        Index('ix_family_order_id_is_deleted', order_id, is_deleted),
+        Index('ix_family_suborder_id_is_deleted', suborder_id, is_deleted),
+        Index('ix_family_update_at_id', update_at, id),
+        live_index('ix_family_live_id', is_deleted, id),
+    )
     
     department          = relationship('Department'     , back_populates='family')
     class_rel           = relationship('Class'          , back_populates='family')
     subclass            = relationship('Subclass'       , back_populates='family')
     supersubclass       = relationship('Supersubclass'  , back_populates='family')
     order               = relationship('Order'          , back_populates='family')
-    suborder            = relationship('Suborder'       , back_populates='family')
\ No newline at end of file
+    suborder            = relationship('Suborder'       , back_populates='family')
+
+
+# hard-deleted taxonomy rows, kept so /api/changes can tell clients to drop them
+class Tombstone(Base):
+    __tablename__   = 'tombstone'
+    id              = Column(Integer, primary_key=True, index=True)
+    level           = Column(String)
+    entity_id       = Column(Integer)
+    update_at       = Column(DateTime, default=datetime.now)
+
+    __table_args__  = (
+        Index('ix_tombstone_update_at_id', update_at, id),
+    )
+
+
+
+# background admin operations, see jobs.py
+class Job(Base):
+    __tablename__   = 'job'
+    id              = Column(String, primary_key=True)
+    kind            = Column(String)
+    state           = Column(String)
+    owner           = Column(String)
+    progress        = Column(Float, default=0)
+    detail          = Column(JSON)
+    result          = Column(JSON)
+    error           = Column(String)
+    create_at       = Column(DateTime, default=datetime.now)
+    started_at      = Column(DateTime)
+    finished_at     = Column(DateTime)
+    update_at       = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__  = (
+        Index('ix_job_kind_state', kind, state),
+    )
+
+
+
+# live rows of `child_level` under each node, kept current by the writes in crud.py, see stats.py
+class TaxonCount(Base):
+    __tablename__   = 'taxon_count'
+    level           = Column(String, primary_key=True)
+    entity_id       = Column(Integer, primary_key=True)
+    child_level     = Column(String, primary_key=True)
+    count           = Column(Integer, default=0, nullable=False)
+
+    __table_args__  = (
+        Index('ix_taxon_count_level_child_level_count', level, child_level, count),
+    )
@@ -0,0 +1,67 @@
+import base64
+import json
+from fastapi import HTTPException, Query, status
+from sqlalchemy import desc
+
+
+NEXT_CURSOR_HEADER = 'X-Next-Cursor'
+
+
+class Page(list):
+    """A list of rows plus the cursor of the page after it, if any."""
+
+    def __init__(self, items, next_cursor=None):
+        super().__init__(items)
+        self.next_cursor = next_cursor
+
+
+class Pagination:
+    def __init__(self, limit: int = None, after_id: int = None):
+        self.limit = limit
+        self.after_id = after_id
+
+    @property
+    def is_full(self):
+        return self.limit is None and self.after_id is None
+
+
+def encode_cursor(id: int):
+    raw = json.dumps({'id': id}).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return int(json.loads(raw)['id'])
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Invalid cursor')
+
+
+async def page_params(limit: int = Query(None, ge=1, le=1000), cursor: str = None):
+    after_id = decode_cursor(cursor) if cursor else None
+    return Pagination(limit=limit, after_id=after_id)
+
+
+# newest first, keyset on id; fetches one extra row to know if a next page exists
+def paginate(stmt, model, page: Pagination = None):
+    if page and page.after_id is not None:
+        stmt = stmt.where(model.id < page.after_id)
+    stmt = stmt.order_by(desc(model.id))
+    if page and page.limit:
+        stmt = stmt.limit(page.limit + 1)
+    return stmt
+
+
+def to_page(rows, page: Pagination = None):
+    if page and page.limit and len(rows) > page.limit:
+        rows = rows[:page.limit]
+        return Page(rows, encode_cursor(rows[-1].id))
+    return Page(rows)
+
+
+def page_headers(result):
+    next_cursor = getattr(result, 'next_cursor', None)
+    if next_cursor:
+        return {NEXT_CURSOR_HEADER: next_cursor}
+    return None
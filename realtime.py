@@ -0,0 +1,64 @@
+import asyncio
+import os
+import socketio
+import models as mod
+
+
+# with several workers, point this at Redis (redis://host:6379/0) so every worker's clients get every event
+SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+
+EVENT = 'taxonomy'
+ALL = 'all'
+
+
+def client_manager():
+    if SOCKETIO_MESSAGE_QUEUE:
+        return socketio.AsyncRedisManager(SOCKETIO_MESSAGE_QUEUE)
+    return None
+
+
+sio = socketio.AsyncServer(async_mode='asgi', cors_allowed_origins='*', client_manager=client_manager())
+
+# emits still in flight; asyncio only keeps weak references to tasks
+_pending = set()
+
+
+def room(level: str, id: int):
+    return f'{level}:{id}'
+
+
+def rooms_for(level: str, id: int, fields: dict = None):
+    """Rooms interested in a change: everyone, the node itself and each of its ancestors."""
+    rooms = [ALL, room(level, id)]
+    for ancestor in mod.LEVELS[:mod.LEVELS.index(mod.LEVELS_BY_NAME[level])]:
+        ancestor_id = (fields or {}).get(ancestor.id_key)
+        if ancestor_id is not None:
+            rooms.append(room(ancestor.name, ancestor_id))
+    return rooms
+
+
+async def emit(event: dict, rooms: list):
+    # one event per matching room, tagged with it: a client subscribed to both a
+    # department and one of its orders can tell the two apart
+    if rooms is None:
+        await sio.emit(EVENT, event)
+        return
+    for name in rooms:
+        await sio.emit(EVENT, dict(event, room=name), room=name)
+
+
+def publish(level: str, id: int, operation: str, fields: dict = None, previous: dict = None):
+    """Push one change event to the subscribers of every subtree it falls in.
+
+    `previous` holds the ancestor ids a moved node had before the move; the
+    subtree it left is told as well, and the event carries them.
+    """
+    event = {'level': level, 'id': id, 'op': operation, 'fields': fields}
+    # bulk writes carry no ids, so every subscriber is told to resync
+    rooms = rooms_for(level, id, fields) if id is not None else None
+    if previous and rooms is not None:
+        event['previous'] = previous
+        rooms += [name for name in rooms_for(level, id, previous) if name not in rooms]
+    task = asyncio.get_running_loop().create_task(emit(event, rooms))
+    _pending.add(task)
+    task.add_done_callback(_pending.discard)
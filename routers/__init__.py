@@ -5,4 +5,14 @@ from routers.subclass import subclass_router
 from routers.supersubclass import supersubclass_router
 from routers.order import order_router
 from routers.suborder import suborder_router
-from routers.family import family_router
\ No newline at end of file
+from routers.family import family_router
+from routers.monitoring import monitoring_router
+from routers.bulk_import import bulk_import_router
+from routers.metrics import metrics_router
+from routers.search import search_router
+from routers.tree import tree_router
+from routers.changes import changes_router
+from routers.realtime import socket_app
+from routers.export import export_router
+from routers.jobs import jobs_router
+from routers.stats import stats_router
\ No newline at end of file
@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, Request, status, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from db import get_db
 import crud
 import models as mod
@@ -19,9 +19,11 @@ authentication_router = APIRouter(tags=['Authentication'])
 
 
 @authentication_router.post('/api/login-admin')
-async def login_admin(req: mod.LoginSchema, db: Session = Depends(get_db)):
-    result = await crud.admin_login(req, db)
+async def login_admin(req: mod.LoginSchema, header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.admin_login(req, header_param, db)
     result = jsonable_encoder(result)
+    if result == -3:
+        return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Слишком много попыток входа, попробуйте позже')
     if result:
         return JSONResponse(content=result, status_code=status.HTTP_200_OK)
     else:
@@ -29,9 +31,11 @@ async def login_admin(req: mod.LoginSchema, db: Session = Depends(get_db)):
 
 
 @authentication_router.post('/api/login-user')
-async def login_user(req: mod.LoginSchema, db: Session = Depends(get_db)):
-    result = await crud.user_login(req, db)
+async def login_user(req: mod.LoginSchema, header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.user_login(req, header_param, db)
     result = jsonable_encoder(result)
+    if result == -3:
+        return HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail='Слишком много попыток входа, попробуйте позже')
     if result:
         return JSONResponse(content=result, status_code=status.HTTP_200_OK)
     else:
@@ -39,7 +43,7 @@ async def login_user(req: mod.LoginSchema, db: Session = Depends(get_db)):
 
 
 @authentication_router.post('/api/create-superadmin')
-async def create_superadmin(req: mod.AdminBase, db: Session = Depends(get_db)):
+async def create_superadmin(req: mod.AdminBase, db: AsyncSession = Depends(get_db)):
     result = await crud.create_superadmin(req=req, db=db)
     result = jsonable_encoder(result)
     if result:
@@ -50,7 +54,7 @@ async def create_superadmin(req: mod.AdminBase, db: Session = Depends(get_db)):
 
 
 @authentication_router.get('/api/get-users', dependencies=[Depends(HTTPBearer())])
-async def get_users(header_param: Request, db: Session = Depends(get_db)):
+async def get_users(header_param: Request, db: AsyncSession = Depends(get_db)):
     result = await crud.read_all_users(header_param = header_param, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -60,7 +64,7 @@ async def get_users(header_param: Request, db: Session = Depends(get_db)):
 
 
 @authentication_router.get('/api/get-user/{id}', dependencies=[Depends(HTTPBearer())])
-async def get_user(id: int, header_param: Request, db: Session = Depends(get_db)):
+async def get_user(id: int, header_param: Request, db: AsyncSession = Depends(get_db)):
     result = await crud.read_user(id=id, header_param=header_param, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -70,7 +74,7 @@ async def get_user(id: int, header_param: Request, db: Session = Depends(get_db)
 
 
 @authentication_router.get('/api/get-admins', dependencies=[Depends(HTTPBearer())])
-async def get_admins(header_param: Request, db: Session = Depends(get_db)):
+async def get_admins(header_param: Request, db: AsyncSession = Depends(get_db)):
     result = await crud.read_all_admins(header_param=header_param, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -82,7 +86,7 @@ async def get_admins(header_param: Request, db: Session = Depends(get_db)):
 
 
 @authentication_router.get('/api/get-admin/{id}', dependencies=[Depends(HTTPBearer())])
-async def get_admin(id: int, header_param: Request, db: Session = Depends(get_db)):
+async def get_admin(id: int, header_param: Request, db: AsyncSession = Depends(get_db)):
     result = await crud.read_admin(id=id, header_param=header_param, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -94,7 +98,7 @@ async def get_admin(id: int, header_param: Request, db: Session = Depends(get_db
 
 
 @authentication_router.post('/api/create-admin', dependencies=[Depends(HTTPBearer())])
-async def create_admin(header_param: Request, req: mod.AdminBase, db: Session = Depends(get_db)):
+async def create_admin(header_param: Request, req: mod.AdminBase, db: AsyncSession = Depends(get_db)):
     result = await crud.create_admin(req=req, db=db, header_param=header_param)
     result = jsonable_encoder(result)
     if result == -1:
@@ -110,7 +114,7 @@ async def create_admin(header_param: Request, req: mod.AdminBase, db: Session =
 
 
 @authentication_router.put('/api/update-admin/{id}', dependencies=[Depends(HTTPBearer())])
-async def update_admin(id: int, header_param: Request, req: mod.AdminBase, db: Session = Depends(get_db)):
+async def update_admin(id: int, header_param: Request, req: mod.AdminBase, db: AsyncSession = Depends(get_db)):
     result = await crud.update_admin(id=id, header_param=header_param, req=req, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -126,7 +130,7 @@ async def update_admin(id: int, header_param: Request, req: mod.AdminBase, db: S
 
 
 @authentication_router.put('/api/delete-admin/{id}', dependencies=[Depends(HTTPBearer())])
-async def delete_admin(id: int, header_param: Request, req: mod.UserDelete, db: Session = Depends(get_db)):
+async def delete_admin(id: int, header_param: Request, req: mod.UserDelete, db: AsyncSession = Depends(get_db)):
     result = await crud.delete_admin(id=id, header_param=header_param, req=req, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -138,7 +142,7 @@ async def delete_admin(id: int, header_param: Request, req: mod.UserDelete, db:
 
 
 @authentication_router.put('/api/update-admin-is-active/{id}', dependencies=[Depends(HTTPBearer())])
-async def update_is_active(id: int, header_param: Request, req: mod.UserActiveSet, db: Session = Depends(get_db)):
+async def update_is_active(id: int, header_param: Request, req: mod.UserActiveSet, db: AsyncSession = Depends(get_db)):
     result = await crud.update_admin_is_active(id=id, header_param=header_param, req=req, db=db)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
@@ -162,7 +166,7 @@ async def update_is_active(id: int, header_param: Request, req: mod.UserActiveSe
 
 
 @authentication_router.post('/api/create-user', dependencies=[Depends(HTTPBearer())])
-async def create_user(header_param: Request, req: mod.UserBase, db: Session = Depends(get_db)):
+async def create_user(header_param: Request, req: mod.UserBase, db: AsyncSession = Depends(get_db)):
     result = await crud.create_user(header_param=header_param, req=req, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -179,7 +183,7 @@ async def create_user(header_param: Request, req: mod.UserBase, db: Session = De
 
 
 @authentication_router.put('/api/update-user/{id}', dependencies=[Depends(HTTPBearer())])
-async def update_user(id: int, header_param: Request, req: mod.UserBase, db: Session = Depends(get_db)):
+async def update_user(id: int, header_param: Request, req: mod.UserBase, db: AsyncSession = Depends(get_db)):
     result = await crud.update_user(id=id, header_param=header_param, req=req, db=db)
     result = jsonable_encoder(result)    
     if result == -1:
@@ -196,7 +200,7 @@ async def update_user(id: int, header_param: Request, req: mod.UserBase, db: Ses
 
 
 @authentication_router.put('/api/delete-user/{id}', dependencies=[Depends(HTTPBearer())])
-async def delete_user(id: int, header_param: Request, req: mod.UserDelete, db: Session = Depends(get_db)):
+async def delete_user(id: int, header_param: Request, req: mod.UserDelete, db: AsyncSession = Depends(get_db)):
     result = await crud.delete_user(id=id, header_param=header_param, req=req, db=db)
     result = jsonable_encoder(result)
     if result == -1:
@@ -208,7 +212,7 @@ async def delete_user(id: int, header_param: Request, req: mod.UserDelete, db: S
 
 
 @authentication_router.put('/api/update-user-is-active/{id}', dependencies=[Depends(HTTPBearer())])
-async def update_user_is_active(id: int, header_param: Request, req: mod.UserActiveSet, db: Session = Depends(get_db)):
+async def update_user_is_active(id: int, header_param: Request, req: mod.UserActiveSet, db: AsyncSession = Depends(get_db)):
     result = await crud.update_user_is_active(id=id, header_param=header_param, req=req, db=db)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
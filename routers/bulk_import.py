@@ -0,0 +1,65 @@
+import csv
+import io
+import json
+import os
+from fastapi import APIRouter, Depends, Request, status, HTTPException
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+from serializer import FastJSONResponse
+import crud
+import models as mod
+
+
+# larger payloads are refused with 413; split them or raise the limit
+BULK_IMPORT_MAX_BYTES = int(os.getenv('BULK_IMPORT_MAX_BYTES', 32 * 1024 * 1024))
+
+
+bulk_import_router = APIRouter(tags=['Bulk import'], dependencies=[Depends(HTTPBearer())])
+
+
+# stops reading as soon as the body outgrows the limit, whatever Content-Length claimed
+async def read_body(header_param: Request, limit: int = BULK_IMPORT_MAX_BYTES):
+    too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f'Payload larger than {limit} bytes')
+    length = header_param.headers.get('Content-Length', '')
+    if length.isdigit() and int(length) > limit:
+        raise too_large
+    chunks, size = [], 0
+    async for chunk in header_param.stream():
+        size += len(chunk)
+        if size > limit:
+            raise too_large
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+
+# JSON array, NDJSON (one object per line) or CSV with a header row
+def parse_rows(body: bytes, content_type: str):
+    text = body.decode('utf-8-sig')
+    try:
+        if 'csv' in content_type:
+            return list(csv.DictReader(io.StringIO(text)))
+        if 'ndjson' in content_type or 'jsonlines' in content_type:
+            return [json.loads(line) for line in text.splitlines() if line.strip()]
+        rows = json.loads(text)
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f'Unreadable payload: {e}')
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail='Expected a JSON array')
+    return rows
+
+
+@bulk_import_router.post('/api/bulk-import/{level}')
+async def bulk_import(level: str, header_param: Request, atomic: bool = False, background: bool = False,
+        db: AsyncSession = Depends(get_db)):
+    if level not in mod.LEVELS_BY_NAME:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    # before the body is read, so anonymous clients cannot make us buffer and parse one
+    if not await crud.check_admin_token(header_param=header_param, db=db):
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    rows = parse_rows(await read_body(header_param), header_param.headers.get('Content-Type', ''))
+    result = await crud.bulk_create(level, rows, atomic, db, background)
+    if 'job' in result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_202_ACCEPTED)
+    return FastJSONResponse(content=result, status_code=status.HTTP_201_CREATED if result['inserted'] else status.HTTP_200_OK)
@@ -0,0 +1,18 @@
+from fastapi import APIRouter, Depends, Query, Request, status, HTTPException
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+from serializer import FastJSONResponse
+import crud
+
+
+changes_router = APIRouter(tags=['Sync'], dependencies=[Depends(HTTPBearer())])
+
+
+@changes_router.get('/api/changes')
+async def get_changes(header_param: Request, since: str = None, limit: int = Query(1000, ge=1, le=10000),
+        db: AsyncSession = Depends(get_db)):
+    result = await crud.read_admin_changes(since, limit, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
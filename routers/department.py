@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, Request, status, HTTPException
 from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from serializer import FastJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import HTTPBearer
 from db import get_db
+from pagination import Pagination, page_params, page_headers
+from snapshot import snapshot_response
 import crud
 import models as mod
 
@@ -12,22 +14,20 @@ department_router = APIRouter(tags=['Department'], dependencies=[Depends(HTTPBea
 
 
 @department_router.post('/api/create-department')
-async def create_department(header_param: Request, req: mod.DepartmentSchema, db: Session = Depends(get_db)):
+async def create_department(header_param: Request, req: mod.DepartmentSchema, db: AsyncSession = Depends(get_db)):
     result = await crud.create_department(header_param, req, db)
-    result = jsonable_encoder(result)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
     if result:
-        return JSONResponse(content=result, status_code=status.HTTP_201_CREATED)
+        return FastJSONResponse(content=result, status_code=status.HTTP_201_CREATED)
     else:
         return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
 
 
 
 @department_router.put('/api/update-department/{id}')
-async def update_department(id: int, header_param: Request, req: mod.DepartmentSchema, db: Session = Depends(get_db)):
+async def update_department(id: int, header_param: Request, req: mod.DepartmentSchema, db: AsyncSession = Depends(get_db)):
     result = await crud.update_department(id, header_param, req, db)
-    result = jsonable_encoder(result)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
     if result:
@@ -37,26 +37,34 @@ async def update_department(id: int, header_param: Request, req: mod.DepartmentS
 
 
 @department_router.get('/api/get-admin-departments')
-async def get_admin_departments(header_param: Request, db: Session = Depends(get_db)):
-    result = await crud.read_admin_departments(header_param, db)
+async def get_admin_departments(header_param: Request, db: AsyncSession = Depends(get_db), page: Pagination = Depends(page_params)):
+    if page.is_full:
+        result = await crud.read_admin_tree_snapshot('department', header_param, db)
+        if result == -1:
+            return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+        if result.body:
+            return snapshot_response(result, header_param, status.HTTP_200_OK)
+        return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+    result = await crud.read_admin_departments(header_param, db, page)
+    headers = page_headers(result)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
     if result:
-        result = jsonable_encoder(result)
-        return JSONResponse(content=result, status_code=status.HTTP_200_OK)
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK, headers=headers)
     else:
         return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
     
     
     
 @department_router.delete('/api/delete-department/{id}')
-async def delete_department(id: int, header_param: Request, db: Session = Depends(get_db)):
-    result = await crud.delete_department(id, header_param, db)
+async def delete_department(id: int, header_param: Request, soft: bool = False, db: AsyncSession = Depends(get_db)):
+    result = await crud.delete_department(id, header_param, db, soft)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result and 'job' in result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_202_ACCEPTED)
     if result:
-        result = jsonable_encoder(result)
-        return JSONResponse(content=result, status_code=status.HTTP_200_OK)
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
     else:
         return HTTPException(status_code=status.HTTP_204_NO_CONTENT, detail='Не удалено!')
     
\ No newline at end of file
@@ -0,0 +1,52 @@
+import os
+import tempfile
+from fastapi import APIRouter, Depends, Query, Request, status, HTTPException
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+from serializer import FastJSONResponse
+from export import EXPORT_FORMATS, COLUMNAR_FORMATS, TABLES, available_formats
+import crud
+
+
+export_router = APIRouter(tags=['Export'], dependencies=[Depends(HTTPBearer())])
+
+
+@export_router.get('/api/export')
+async def export_cadastre(header_param: Request, format: str = Query('ndjson', regex='^(ndjson|json)$'),
+        db: AsyncSession = Depends(get_db)):
+    result = await crud.export_cadastre(format, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    headers = {'Content-Disposition': f'attachment; filename="cadastre.{format}"'}
+    return StreamingResponse(result, media_type=EXPORT_FORMATS[format], headers=headers)
+
+
+
+# written to a temporary file first: parquet and arrow files end with a footer that needs the whole table
+@export_router.get('/api/export/{table}')
+async def export_table(table: str, header_param: Request, format: str = Query('parquet', regex='^(parquet|arrow|csv)$'),
+        background: bool = False, db: AsyncSession = Depends(get_db)):
+    if table not in TABLES:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if format not in available_formats():
+        return HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=f'{format} export needs pyarrow')
+    # the file is kept for /api/jobs/{id}/download
+    if background:
+        result = await crud.start_export_job(table, format, header_param, db)
+        if result == -1:
+            return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+        return FastJSONResponse(content=result, status_code=status.HTTP_202_ACCEPTED)
+    with tempfile.NamedTemporaryFile(suffix=f'.{format}', delete=False) as sink:
+        try:
+            result = await crud.export_columnar(table, format, sink, header_param, db)
+        except BaseException:
+            os.remove(sink.name)
+            raise
+    if result == -1:
+        os.remove(sink.name)
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    return FileResponse(sink.name, media_type=COLUMNAR_FORMATS[format], filename=f'{table}.{format}',
+            background=BackgroundTask(os.remove, sink.name))
@@ -1,48 +1,70 @@
 from fastapi import APIRouter, Depends, Request, status, HTTPException
 from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from serializer import FastJSONResponse, to_dict
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import HTTPBearer
 from db import get_db
+from pagination import Pagination, page_params, page_headers
+from snapshot import snapshot_response
 import crud
 import models as mod
 
 family_router = APIRouter(tags=['Family'], dependencies=[Depends(HTTPBearer())])
 
 @family_router.post('/api/create-family')
-async def create_family(header_param: Request, req: mod.FamilySchema, db: Session = Depends(get_db)):
+async def create_family(header_param: Request, req: mod.FamilySchema, db: AsyncSession = Depends(get_db)):
     result = await crud.create_family(header_param=header_param, req=req, db=db)
     if result == -1:
         return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     if result:
+        result = to_dict(result)
         result['msg'] = 'Создано!'
-        result = jsonable_encoder(result)
-        return JSONResponse(content=result, status_code=status.HTTP_201_CREATED)
+        return FastJSONResponse(content=result, status_code=status.HTTP_201_CREATED)
     else:
         return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
     
 
 
 @family_router.put('/api/update-family/{id}')
-async def update_family(id: int, header_param: Request, req: mod.FamilySchema, db: Session = Depends(get_db)):
+async def update_family(id: int, header_param: Request, req: mod.FamilySchema, db: AsyncSession = Depends(get_db)):
     result = await crud.update_family(id, header_param, req, db)
     if result == -1:
         return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     if result:
-        result['msg'] = 'Обновлено!'
-        result = jsonable_encoder(result)
-        return JSONResponse(content=result, status_code=status.HTTP_200_OK)
+        result = {'msg': 'Обновлено!'}
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
     else:
         return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
     
     
 @family_router.get('/api/get-admin-families')
-async def get_admin_families(header_param: Request, db: Session = Depends(get_db)):
-    result = await crud.read_admin_family(header_param, db)
+async def get_admin_families(header_param: Request, db: AsyncSession = Depends(get_db), page: Pagination = Depends(page_params)):
+    if page.is_full:
+        result = await crud.read_admin_tree_snapshot('family', header_param, db)
+        if result == -1:
+            return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+        if result.body:
+            return snapshot_response(result, header_param, status.HTTP_200_OK)
+        return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+    result = await crud.read_admin_family(header_param, db, page)
+    headers = page_headers(result)
     if result == -1:
         return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED)
     if result:
-        result = jsonable_encoder(result)
-        return JSONResponse(content=result, status_code=status.HTTP_200_OK)
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK, headers=headers)
+    else:
+        return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+
+
+
+@family_router.delete('/api/delete-family/{id}')
+async def delete_family(id: int, header_param: Request, soft: bool = False, db: AsyncSession = Depends(get_db)):
+    result = await crud.delete_taxon('family', id, soft, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result and 'job' in result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_202_ACCEPTED)
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
     else:
-        return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return HTTPException(status_code=status.HTTP_204_NO_CONTENT, detail='Не удалено!')
\ No newline at end of file
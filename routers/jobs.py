@@ -0,0 +1,43 @@
+import os
+from fastapi import APIRouter, Depends, Request, status, HTTPException
+from fastapi.responses import FileResponse
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+from serializer import FastJSONResponse
+from export import COLUMNAR_FORMATS
+import crud
+
+
+jobs_router = APIRouter(tags=['Jobs'], dependencies=[Depends(HTTPBearer())])
+
+
+# routes that answer 202 {"job": id} are polled here
+@jobs_router.get('/api/jobs/{id}')
+async def get_job(id: str, header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.read_job(id, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+@jobs_router.get('/api/jobs/{id}/download')
+async def download_job_file(id: str, header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.read_job_file(id, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result:
+        format = os.path.splitext(result)[1][1:]
+        return FileResponse(result, media_type=COLUMNAR_FORMATS[format], filename=os.path.basename(result))
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+# rebuild the autocomplete and search indexes and drop cached listings
+@jobs_router.post('/api/jobs/reindex')
+async def reindex(header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.start_reindex_job(header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    return FastJSONResponse(content=result, status_code=status.HTTP_202_ACCEPTED)
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+from fastapi import APIRouter, Request, status
+from fastapi.responses import PlainTextResponse
+from db import engine, pool_metrics
+from tokens import principal_cache, token_versions
+from metrics import registry, snapshot_metrics
+
+
+# scrapers cannot log in; when set, /metrics expects "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
+metrics_router = APIRouter(tags=['Monitoring'])
+
+
+# running totals in the stats below, exported as counters so rate() and increase() apply
+POOL_COUNTERS = ('checkouts', 'waits', 'wait_seconds_total', 'timeouts', 'connects', 'closes', 'invalidations')
+CACHE_COUNTERS = ('hits', 'misses')
+
+
+registry.collectors.append(lambda: snapshot_metrics('db_pool', pool_metrics.snapshot(engine.sync_engine.pool),
+        'Connection pool statistics, see /api/db-pool-stats.', POOL_COUNTERS))
+registry.collectors.append(lambda: snapshot_metrics('auth_cache', principal_cache.stats(),
+        'Principal cache statistics, see /api/auth-cache-stats.', CACHE_COUNTERS))
+registry.collectors.append(lambda: snapshot_metrics('token_versions', token_versions.stats(),
+        'Token version cache statistics, see /api/auth-cache-stats.', CACHE_COUNTERS))
+
+
+@metrics_router.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(header_param: Request):
+    if METRICS_TOKEN and header_param.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return PlainTextResponse('', status_code=status.HTTP_401_UNAUTHORIZED)
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
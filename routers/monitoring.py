@@ -0,0 +1,25 @@
+from fastapi import APIRouter, Depends, Request, status, HTTPException
+from fastapi.responses import JSONResponse
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+import crud
+
+
+monitoring_router = APIRouter(tags=['Monitoring'], dependencies=[Depends(HTTPBearer())])
+
+
+@monitoring_router.get('/api/auth-cache-stats')
+async def get_auth_cache_stats(header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.read_auth_cache_stats(header_param=header_param, db=db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    return JSONResponse(content=result, status_code=status.HTTP_200_OK)
+
+
+@monitoring_router.get('/api/db-pool-stats')
+async def get_db_pool_stats(header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.read_db_pool_stats(header_param=header_param, db=db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    return JSONResponse(content=result, status_code=status.HTTP_200_OK)
@@ -0,0 +1,65 @@
+import socketio
+from fastapi import Request
+from db import SessionLocal
+from realtime import sio, room, ALL
+import crud
+import models as mod
+
+
+# mounted at /ws, so clients connect with path "/ws/socket.io"
+socket_app = socketio.ASGIApp(sio)
+
+
+async def authorized(authorization: str):
+    header_param = Request({'type': 'http', 'headers': [(b'authorization', authorization.encode())]})
+    async with SessionLocal() as db:
+        return await crud.check_admin_token(header_param=header_param, db=db)
+
+
+# browsers cannot set headers on a websocket; they send {"token": "..."} as the auth payload
+@sio.event
+async def connect(sid, environ, auth=None):
+    token = (auth or {}).get('token')
+    authorization = f'Bearer {token}' if token else environ.get('HTTP_AUTHORIZATION', '')
+    if not await authorized(authorization):
+        raise socketio.exceptions.ConnectionRefusedError('unauthorized')
+    await sio.save_session(sid, {'authorization': authorization})
+
+
+# {"department_id": 3}, {"level": "order", "id": 12} or {} for every change
+def subscription_room(data):
+    data = data or {}
+    if 'department_id' in data:
+        return room('department', int(data['department_id']))
+    if 'level' in data:
+        if data['level'] not in mod.LEVELS_BY_NAME:
+            raise ValueError(f'unknown level {data["level"]}')
+        return room(data['level'], int(data['id']))
+    return ALL
+
+
+# the token is checked again, so a socket whose token was revoked (logout, password
+# change) after it connected is dropped instead of joining more rooms
+@sio.event
+async def subscribe(sid, data=None):
+    session = await sio.get_session(sid)
+    if not await authorized(session.get('authorization', '')):
+        # after the reply, so the client learns why
+        sio.start_background_task(sio.disconnect, sid)
+        return {'error': 'unauthorized'}
+    try:
+        name = subscription_room(data)
+    except (KeyError, TypeError, ValueError) as e:
+        return {'error': str(e)}
+    sio.enter_room(sid, name)
+    return {'room': name}
+
+
+@sio.event
+async def unsubscribe(sid, data=None):
+    try:
+        name = subscription_room(data)
+    except (KeyError, TypeError, ValueError) as e:
+        return {'error': str(e)}
+    sio.leave_room(sid, name)
+    return {'room': name}
@@ -0,0 +1,35 @@
+from fastapi import APIRouter, Depends, Query, Request, status, HTTPException
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+from serializer import FastJSONResponse
+import crud
+import models as mod
+
+
+search_router = APIRouter(tags=['Search'], dependencies=[Depends(HTTPBearer())])
+
+
+@search_router.get('/api/search')
+async def search_taxa(header_param: Request, q: str = Query(..., min_length=1, max_length=200),
+        limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0, le=10000),
+        db: AsyncSession = Depends(get_db)):
+    result = await crud.search_taxa(q, limit, offset, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result == -4:
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
+    return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@search_router.get('/api/autocomplete')
+async def autocomplete(header_param: Request, q: str = Query(..., min_length=1, max_length=200),
+        level: str = None, limit: int = Query(10, ge=1, le=50), db: AsyncSession = Depends(get_db)):
+    if level is not None and level not in mod.LEVELS_BY_NAME:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    result = await crud.read_autocomplete(q, level, limit, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
@@ -0,0 +1,60 @@
+from fastapi import APIRouter, Depends, Query, Request, status, HTTPException
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+from serializer import FastJSONResponse
+import crud
+import models as mod
+
+
+stats_router = APIRouter(tags=['Stats'], dependencies=[Depends(HTTPBearer())])
+
+
+@stats_router.get('/api/stats')
+async def read_stats(header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.read_stats(header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result == -4:
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+    return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
+
+
+# rebuild the counters from the level tables
+@stats_router.post('/api/stats/recompute')
+async def recompute_stats(header_param: Request, db: AsyncSession = Depends(get_db)):
+    result = await crud.start_stats_job(header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    return FastJSONResponse(content=result, status_code=status.HTTP_202_ACCEPTED)
+
+
+# e.g. /api/stats/order?child=family lists orders by their number of families
+@stats_router.get('/api/stats/{level}')
+async def read_ranked_stats(level: str, header_param: Request, child: str = Query(...),
+        limit: int = Query(20, ge=1, le=100), offset: int = Query(0, ge=0, le=10000),
+        db: AsyncSession = Depends(get_db)):
+    if level not in mod.LEVELS_BY_NAME:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    result = await crud.read_ranked_stats(level, child, limit, offset, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result == -4:
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+    if result is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
+
+
+@stats_router.get('/api/stats/{level}/{id}')
+async def read_node_stats(level: str, id: int, header_param: Request, db: AsyncSession = Depends(get_db)):
+    if level not in mod.LEVELS_BY_NAME:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    result = await crud.read_node_stats(level, id, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result == -4:
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, Request, status, HTTPException
 from fastapi.responses import JSONResponse
-from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from serializer import FastJSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi.security import HTTPBearer
 from db import get_db
+from pagination import Pagination, page_params, page_headers
+from snapshot import snapshot_response
 import crud
 import models as mod
 from returns import Returns
@@ -12,21 +14,19 @@ supersubclass_router = APIRouter(tags=['Supersubclass'], dependencies=[Depends(H
 
 
 @supersubclass_router.post('/api/create-supersubclass')
-async def create_supersubclass(header_param: Request, req: mod.SupersubclassSchema, db: Session = Depends(get_db)):
+async def create_supersubclass(header_param: Request, req: mod.SupersubclassSchema, db: AsyncSession = Depends(get_db)):
     result = await crud.create_supersubclass(header_param, req, db)
-    result = jsonable_encoder(result)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
     if result:
-        return JSONResponse(content=result, status_code=status.HTTP_201_CREATED)
+        return FastJSONResponse(content=result, status_code=status.HTTP_201_CREATED)
     else:
         return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
 
 
 @supersubclass_router.put('/api/update-supersubclass/{id}')
-async def update_supersubclass(id: int, header_param: Request, req: mod.SupersubclassSchema, db: Session = Depends(get_db)):
+async def update_supersubclass(id: int, header_param: Request, req: mod.SupersubclassSchema, db: AsyncSession = Depends(get_db)):
     result = await crud.update_supersubclass(id, header_param, req, db)
-    result = jsonable_encoder(result)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
     if result:
@@ -37,12 +37,33 @@ async def update_supersubclass(id: int, header_param: Request, req: mod.Supersub
 
 
 @supersubclass_router.get('/api/get-admin-supersubclass')
-async def get_admin_supersubclass(header_param: Request, db: Session = Depends(get_db)):
-    result = await crud.read_admin_supersubclass(header_param, db)
-    result = jsonable_encoder(result)
+async def get_admin_supersubclass(header_param: Request, db: AsyncSession = Depends(get_db), page: Pagination = Depends(page_params)):
+    if page.is_full:
+        result = await crud.read_admin_tree_snapshot('supersubclass', header_param, db)
+        if result == -1:
+            return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+        if result.body:
+            return snapshot_response(result, header_param, status.HTTP_201_CREATED)
+        return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+    result = await crud.read_admin_supersubclass(header_param, db, page)
+    headers = page_headers(result)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_201_CREATED, headers=headers)
+    else:
+        return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
+
+
+
+@supersubclass_router.delete('/api/delete-supersubclass/{id}')
+async def delete_supersubclass(id: int, header_param: Request, soft: bool = False, db: AsyncSession = Depends(get_db)):
+    result = await crud.delete_taxon('supersubclass', id, soft, header_param, db)
     if result == -1:
         return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result and 'job' in result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_202_ACCEPTED)
     if result:
-        return JSONResponse(content=result, status_code=status.HTTP_201_CREATED)
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
     else:
-        return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        return HTTPException(status_code=status.HTTP_204_NO_CONTENT, detail='Не удалено!')
\ No newline at end of file
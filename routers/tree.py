@@ -0,0 +1,53 @@
+from fastapi import APIRouter, Depends, Query, Request, status, HTTPException
+from fastapi.security import HTTPBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_db
+from pagination import Pagination, page_params, page_headers
+from serializer import FastJSONResponse
+import crud
+import models as mod
+
+
+tree_router = APIRouter(tags=['Tree'], dependencies=[Depends(HTTPBearer())])
+
+
+@tree_router.get('/api/tree/{level}/{id}')
+async def get_subtree(level: str, id: int, header_param: Request,
+        depth: int = Query(None, ge=0, le=len(mod.LEVELS) - 1), db: AsyncSession = Depends(get_db)):
+    if level not in mod.LEVELS_BY_NAME:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    result = await crud.read_admin_subtree(level, id, depth, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+# the node's ancestors from the department down, then the node itself
+@tree_router.get('/api/lineage/{level}/{id}')
+async def get_lineage(level: str, id: int, header_param: Request, db: AsyncSession = Depends(get_db)):
+    if level not in mod.LEVELS_BY_NAME:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    result = await crud.read_admin_lineage(level, id, header_param, db)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK)
+    return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+
+
+# e.g. /api/descendants/class/3?of=family lists every family under class 3, a page at a time
+@tree_router.get('/api/descendants/{level}/{id}')
+async def get_descendants(level: str, id: int, header_param: Request, of: str = Query(...),
+        db: AsyncSession = Depends(get_db), page: Pagination = Depends(page_params)):
+    if level not in mod.LEVELS_BY_NAME:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    result = await crud.read_admin_descendants(level, id, of, header_param, db, page)
+    if result == -1:
+        return HTTPException(status_code = status.HTTP_401_UNAUTHORIZED)
+    if result is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if result:
+        return FastJSONResponse(content=result, status_code=status.HTTP_200_OK, headers=page_headers(result))
+    return HTTPException(status_code=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
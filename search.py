@@ -0,0 +1,280 @@
+import asyncio
+import logging
+import os
+import re
+from collections import Counter, defaultdict
+from itertools import chain
+from sqlalchemy import select, union_all, literal, func, case, or_, and_, text, null, Integer
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import SessionLocal
+import models as mod
+
+
+logger = logging.getLogger(__name__)
+
+
+# minimum word similarity for a fuzzy hit; pg_trgm's own default is 0.6, which misses most typos
+SEARCH_THRESHOLD = float(os.getenv('SEARCH_THRESHOLD', 0.5))
+
+ANCESTOR_KEYS = [level.id_key for level in mod.LEVELS[:-1]]
+LEVEL_ORDER = {level.name: index for index, level in enumerate(mod.LEVELS)}
+
+
+def normalise(value: str):
+    return ' '.join(value.lower().split())
+
+
+# same trigrams as pg_trgm: every word padded with two spaces in front and one behind
+def trigrams(value: str):
+    result = set()
+    for word in re.findall(r'\w+', value.lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def ancestors_of(level: mod.Level):
+    return ANCESTOR_KEYS[:mod.LEVELS.index(level)]
+
+
+# '/' rather than backslash, which Postgres and SQLite quote differently
+def escape_like(value: str):
+    return value.replace('/', '//').replace('%', '/%').replace('_', '/_')
+
+
+############
+# POSTGRES #
+############
+
+
+def level_query(level: mod.Level, q: str, limit: int):
+    model = level.model
+    prefix = escape_like(q) + '%'
+    names = (model.name_lt, model.name_ru)
+    similarity = func.greatest(*[func.word_similarity(q, name) for name in names])
+    bonus = case((or_(*[func.lower(name) == q for name in names]), 2),
+            (or_(*[name.ilike(prefix, escape='/') for name in names]), 1), else_=0)
+    score = (similarity + bonus).label('score')
+    own = set(ancestors_of(level))
+    return select(
+        literal(level.name).label('level'), model.id, model.name_lt, model.name_ru,
+        *[(getattr(model, key) if key in own else null().cast(Integer)).label(key) for key in ANCESTOR_KEYS],
+        score
+    ).where(and_(
+        model.is_deleted == False,
+        or_(*[name.op('%>')(q) for name in names], *[name.ilike(prefix, escape='/') for name in names])
+    )).order_by(score.desc(), model.id).limit(limit)
+
+
+def postgres_query(q: str, limit: int, offset: int):
+    # each level only needs its own best offset + limit rows to rank the union
+    levels = [level_query(level, q, offset + limit).subquery() for level in mod.LEVELS]
+    union = union_all(*[select(subquery) for subquery in levels]).subquery()
+    order = case(LEVEL_ORDER, value=union.c.level)
+    return select(union).order_by(union.c.score.desc(), order, union.c.id).offset(offset).limit(limit)
+
+
+async def configure(db: AsyncSession):
+    """Settings for the search query, for this transaction only."""
+    # %> uses the session threshold
+    await db.execute(text("SELECT set_config('pg_trgm.word_similarity_threshold', :value, true)"),
+            {'value': str(SEARCH_THRESHOLD)})
+    # the planner costs %> like a plain comparison and, once it expects a few thousand
+    # hits, picks a parallel seq scan that runs word_similarity on every row (5-6 s at a
+    # million names against 0.5-1.3 s through the GIN indexes)
+    await db.execute(text("SELECT set_config('enable_seqscan', 'off', true)"))
+
+
+async def search_postgres(db: AsyncSession, q: str, limit: int, offset: int):
+    await configure(db)
+    result = await db.execute(postgres_query(q, limit, offset))
+    return [dict(row._mapping) for row in result.all()]
+
+
+############
+# FALLBACK #
+############
+
+
+class TrigramIndex:
+    """In-process trigram index over every live taxon name.
+
+    Used where pg_trgm is not available (SQLite in development and tests).
+    Built in the background at startup, and patched in place by taxonomy
+    writes the way AutocompleteIndex is; searches before the first build
+    has finished are turned away rather than waiting for it. Writes that touch a whole subtree (moves,
+    cascades, bulk imports) schedule a rebuild in the background; searches
+    use the previous index meanwhile. A removed entry leaves a hole in its
+    postings until the next rebuild. Writes made by other worker processes
+    show up after a reindex job.
+    """
+
+    def __init__(self):
+        self.entries = []
+        self.positions = {}
+        self.postings = {}
+        self.holes = 0
+        self.built = False
+        self.writes = 0
+        self._rebuild = None
+
+    async def build(self, db: AsyncSession):
+        entries, positions, postings = [], {}, defaultdict(list)
+        for level in mod.LEVELS:
+            model = level.model
+            keys = ancestors_of(level)
+            result = await db.execute(select(model.id, model.name_lt, model.name_ru,
+                    *[getattr(model, key) for key in keys]).where(model.is_deleted == False))
+            for row in result.all():
+                entry = {'level': level.name, 'id': row.id, 'name_lt': row.name_lt, 'name_ru': row.name_ru}
+                entry.update({key: getattr(row, key) if key in keys else None for key in ANCESTOR_KEYS})
+                position = len(entries)
+                entries.append(entry)
+                positions[(level.name, row.id)] = position
+                for trigram in trigrams(f'{row.name_lt or ""} {row.name_ru or ""}'):
+                    postings[trigram].append(position)
+                # rebuilds run next to requests; let them through now and then
+                if position % 10000 == 9999:
+                    await asyncio.sleep(0)
+        self.entries, self.positions, self.postings, self.holes = entries, positions, dict(postings), 0
+        self.built = True
+
+    def refresh(self):
+        if self._rebuild is None or self._rebuild.done():
+            self._rebuild = asyncio.create_task(self._build_in_background())
+
+    async def _build_in_background(self):
+        try:
+            # a write applied while building may be missing from the new index; build again
+            while True:
+                writes = self.writes
+                async with SessionLocal() as db:
+                    await self.build(db)
+                if self.writes == writes:
+                    break
+        except Exception:
+            logger.exception('trigram index rebuild failed')
+
+    def add(self, entry: dict):
+        self.remove(entry['level'], entry['id'])
+        position = len(self.entries)
+        self.entries.append(entry)
+        self.positions[(entry['level'], entry['id'])] = position
+        for trigram in trigrams(f'{entry["name_lt"] or ""} {entry["name_ru"] or ""}'):
+            self.postings.setdefault(trigram, []).append(position)
+
+    def remove(self, level: str, id: int):
+        position = self.positions.pop((level, id), None)
+        if position is None:
+            return None
+        entry, self.entries[position] = self.entries[position], None
+        self.holes += 1
+        return entry
+
+    def apply(self, level: str, id: int, operation: str, fields: dict = None, subtree: bool = False):
+        # counted even before the first build, so a build already reading the tables runs again
+        self.writes += 1
+        # never built on Postgres; elsewhere the first build is on its way
+        if not self.built:
+            return
+        named = id is not None and fields and 'name_lt' in fields and 'name_ru' in fields
+        if operation == 'delete' and level == mod.LEVELS[-1].name:
+            self.remove(level, id)
+        elif operation == 'create' and named and not subtree:
+            entry = {'level': level, 'id': id, 'name_lt': fields['name_lt'], 'name_ru': fields['name_ru']}
+            own = set(ancestors_of(mod.LEVELS_BY_NAME[level]))
+            entry.update({key: fields.get(key) if key in own else None for key in ANCESTOR_KEYS})
+            self.add(entry)
+        elif operation == 'update' and named and not subtree and (level, id) in self.positions:
+            # not moved, so the ancestors are the ones already indexed
+            entry = self.remove(level, id)
+            self.add(dict(entry, name_lt=fields['name_lt'], name_ru=fields['name_ru']))
+        else:
+            self.refresh()
+        if self.holes > len(self.positions):
+            self.refresh()
+
+    def score(self, entry: dict, q: str, shared: int, total: int):
+        names = [normalise(entry[key] or '') for key in ('name_lt', 'name_ru')]
+        if q in names:
+            bonus = 2
+        elif any(name.startswith(q) for name in names):
+            bonus = 1
+        else:
+            bonus = 0
+        return shared / total + bonus
+
+    def search(self, q: str, limit: int, offset: int):
+        wanted = trigrams(q)
+        if not wanted:
+            return []
+        shared = Counter(chain.from_iterable(self.postings.get(trigram, ()) for trigram in wanted))
+        # a prefix match shares every trigram but the one closing the last word
+        needed = min(SEARCH_THRESHOLD * len(wanted), len(wanted) - 1)
+        hits = []
+        for position, count in shared.items():
+            if count < needed:
+                continue
+            entry = self.entries[position]
+            if entry is None:
+                continue
+            score = self.score(entry, q, count, len(wanted))
+            if score >= SEARCH_THRESHOLD:
+                hits.append((-score, LEVEL_ORDER[entry['level']], entry['id'], position))
+        hits.sort()
+        return [dict(self.entries[position], score=-score) for score, _, _, position in hits[offset:offset + limit]]
+
+
+trigram_index = TrigramIndex()
+
+
+##################
+# ANCESTOR PATHS #
+##################
+
+
+async def attach_paths(db: AsyncSession, hits: list):
+    """Replace the ancestor id columns of each hit with a `path` from department down."""
+    wanted = defaultdict(set)
+    for hit in hits:
+        for key in ANCESTOR_KEYS:
+            if hit.get(key) is not None:
+                wanted[key].add(hit[key])
+    names = {}
+    for level in mod.LEVELS[:-1]:
+        ids = wanted.get(level.id_key)
+        if not ids:
+            continue
+        model = level.model
+        result = await db.execute(select(model.id, model.name_lt, model.name_ru).where(model.id.in_(ids)))
+        for row in result.all():
+            names[(level.id_key, row.id)] = {'level': level.name, 'id': row.id,
+                    'name_lt': row.name_lt, 'name_ru': row.name_ru}
+    for hit in hits:
+        hit['path'] = [names[(key, hit[key])] for key in ANCESTOR_KEYS
+                if hit.get(key) is not None and (key, hit[key]) in names]
+        for key in ANCESTOR_KEYS:
+            hit.pop(key, None)
+        hit['score'] = round(hit['score'], 4)
+    return hits
+
+
+def ready(db: AsyncSession):
+    """False until the fallback index has been built, where there is no pg_trgm."""
+    return db.bind.dialect.name == 'postgresql' or trigram_index.built
+
+
+async def search(db: AsyncSession, q: str, limit: int = 20, offset: int = 0):
+    """Ranked taxa across all levels whose Latin or Russian name matches `q`.
+
+    Exact names rank first, then prefixes, then fuzzy (trigram) matches;
+    ties go to the higher level and then the lower id.
+    """
+    q = normalise(q)
+    if not q:
+        return []
+    if db.bind.dialect.name == 'postgresql':
+        hits = await search_postgres(db, q, limit, offset)
+    else:
+        hits = trigram_index.search(q, limit, offset)
+    return await attach_paths(db, hits)
@@ -0,0 +1,49 @@
+import json
+from datetime import date, datetime, time
+from fastapi import Response
+from sqlalchemy.engine import Row
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def to_dict(obj):
+    """Column values of an ORM instance or result row, without relationships."""
+    if isinstance(obj, Row):
+        return dict(obj._mapping)
+    return {column.key: getattr(obj, column.key) for column in obj.__table__.columns}
+
+
+def plain(content):
+    # tree readers already return plain dicts; only ORM instances and rows need converting
+    if isinstance(content, list):
+        if content and not isinstance(content[0], dict):
+            return [to_dict(item) for item in content]
+        return content
+    if isinstance(content, Row) or hasattr(content, '__table__'):
+        return to_dict(content)
+    return content
+
+
+def _default(obj):
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps(content):
+    content = plain(content)
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False,
+            indent=None, separators=(',', ':')).encode('utf-8')
+
+
+class FastJSONResponse(Response):
+    """JSONResponse for taxonomy payloads that skips jsonable_encoder."""
+    media_type = 'application/json'
+
+    def render(self, content):
+        return dumps(content)
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+from serializer import dumps
+from compression import negotiate, compress_async, strong_etag, encoded_etag, etag_matches, CACHED_LEVELS
+
+
+# upper bound on how stale a snapshot can get when another worker process wrote
+SNAPSHOT_MAX_AGE = float(os.getenv('SNAPSHOT_MAX_AGE', 5))
+
+# a snapshot the tables still vouch for is kept at most this long; a write that commits
+# after a later-stamped one leaves max(update_at) as it was, so the check alone could miss it
+SNAPSHOT_REBUILD_AGE = float(os.getenv('SNAPSHOT_REBUILD_AGE', 60))
+
+
+class SnapshotEntry:
+    def __init__(self, version: int, body: bytes, last_modified: datetime = None):
+        self.version = version
+        self.body = body
+        # a hash of the body, so every worker process hands out the same tag for the same listing
+        self.etag = strong_etag(body) if body else None
+        self.last_modified = last_modified
+        self.built_at = self.checked_at = time.monotonic()
+        self._encoded = {}
+
+    async def encoded(self, encoding: str):
+        """The body compressed with `encoding`, compressed once per snapshot and kept."""
+        if encoding not in self._encoded:
+            self._encoded[encoding] = await compress_async(self.body, encoding, CACHED_LEVELS[encoding])
+        return self._encoded[encoding]
+
+
+class TreeSnapshot:
+    """Serialised taxonomy listings cached until a write changes them.
+
+    Each listing has its own version, bumped by the writes in this process
+    that touch its rows; an entry built for an older version is rebuilt on
+    the next read. Every SNAPSHOT_MAX_AGE seconds an entry is checked
+    against the tables instead, for writes made by other workers: if the
+    latest update_at behind it has not moved, it is kept as it is.
+    """
+
+    def __init__(self, max_age: float = SNAPSHOT_MAX_AGE, rebuild_age: float = SNAPSHOT_REBUILD_AGE):
+        # writes seen, whatever listing they touched
+        self.version = 0
+        self.max_age = max_age
+        self.rebuild_age = rebuild_age
+        self._all = 0
+        self._versions = Counter()
+        self._entries = {}
+        self._locks = {}
+
+    def bump(self, *keys: str):
+        """Outdate the listings in `keys`, or all of them when none are given."""
+        self.version += 1
+        if not keys:
+            self._all += 1
+        for key in keys:
+            self._versions[key] += 1
+
+    def version_of(self, key: str):
+        return self._all + self._versions[key]
+
+    def _fresh(self, key: str, entry: SnapshotEntry):
+        return entry is not None and entry.version == self.version_of(key) \
+            and time.monotonic() - entry.checked_at < self.max_age
+
+    def _unchanged(self, key: str, entry: SnapshotEntry, last_modified: datetime):
+        # a write in this process always rebuilds; update_at only speaks for other workers
+        return entry is not None and entry.version == self.version_of(key) \
+            and last_modified is not None and last_modified == entry.last_modified \
+            and time.monotonic() - entry.built_at < self.rebuild_age
+
+    async def get(self, key: str, builder, modified=None):
+        """The entry for `key`; `modified` is an optional coroutine function
+        returning when the data behind it last changed, sent as Last-Modified
+        and used to keep an aged entry without rebuilding it."""
+        entry = self._entries.get(key)
+        if self._fresh(key, entry):
+            return entry
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+            if self._fresh(key, entry):
+                return entry
+            version = self.version_of(key)
+            last_modified = await modified() if modified else None
+            if self._unchanged(key, entry, last_modified):
+                entry.checked_at = time.monotonic()
+                return entry
+            result = await builder()
+            body = dumps(result) if result else None
+            entry = SnapshotEntry(version, body, last_modified)
+            self._entries[key] = entry
+        return entry
+
+
+def http_date(value: datetime):
+    # update_at columns hold naive local times
+    return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+
+
+def not_modified_since(header_param: Request, last_modified: datetime):
+    value = header_param.headers.get('If-Modified-Since')
+    if not value or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return last_modified.astimezone(timezone.utc).replace(microsecond=0) <= since
+
+
+def snapshot_response(entry: SnapshotEntry, header_param: Request, status_code: int):
+    """The cached listing, precompressed when the client accepts it, or a 304.
+
+    If-None-Match wins over If-Modified-Since when both are sent. Neither
+    check touches the serializer: the entry already holds the body.
+    """
+    encoding = negotiate(header_param.headers.get('Accept-Encoding'))
+    headers = {'ETag': encoded_etag(entry.etag, encoding), 'Vary': 'Accept-Encoding'}
+    if entry.last_modified:
+        headers['Last-Modified'] = http_date(entry.last_modified)
+    if_none_match = header_param.headers.get('If-None-Match')
+    if etag_matches(if_none_match, entry.etag) \
+            or (if_none_match is None and not_modified_since(header_param, entry.last_modified)):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        return EncodedSnapshotResponse(entry, encoding, status_code=status_code, headers=headers)
+    return Response(content=entry.body, status_code=status_code, headers=headers, media_type='application/json')
+
+
+class EncodedSnapshotResponse(Response):
+    """Sends an entry's compressed body; compressing it the first time happens
+    while the response is sent, so the route itself stays synchronous."""
+    media_type = 'application/json'
+
+    def __init__(self, entry: SnapshotEntry, encoding: str, status_code: int, headers: dict):
+        super().__init__(status_code=status_code, headers=headers)
+        self.entry = entry
+        self.encoding = encoding
+
+    async def __call__(self, scope, receive, send):
+        body = await self.entry.encoded(self.encoding)
+        self.raw_headers = [(key, value) for key, value in self.raw_headers if key != b'content-length']
+        self.raw_headers.append((b'content-length', str(len(body)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers})
+        await send({'type': 'http.response.body', 'body': body})
+        if self.background is not None:
+            await self.background()
+
+
+tree_snapshot = TreeSnapshot()
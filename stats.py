@@ -0,0 +1,149 @@
+from collections import Counter
+from sqlalchemy import select, delete, insert, func, and_, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import SessionLocal
+from hierarchy import ancestors_of, descendants_of
+import models as mod
+
+
+# counts over the whole cadastre are stored under this pseudo node
+CADASTRE = 'cadastre'
+
+# rows written per statement by a recompute
+STATS_BATCH_SIZE = 5000
+
+UPSERTS = {
+    'postgresql'    : postgresql.insert,
+    'sqlite'        : sqlite.insert,
+}
+
+
+def owners(level_name: str, fields: dict):
+    """(level, id) of every node whose counts include a `level_name` row with these ancestor ids."""
+    result = [(CADASTRE, 0)]
+    for ancestor in ancestors_of(level_name):
+        ancestor_id = fields.get(ancestor.id_key)
+        if ancestor_id is not None:
+            result.append((ancestor.name, ancestor_id))
+    return result
+
+
+async def apply(db: AsyncSession, deltas: Counter):
+    """Add {(level, entity_id, child_level): delta} to the counters, in the caller's transaction."""
+    rows = [{'level': level, 'entity_id': entity_id, 'child_level': child_level, 'count': delta}
+            for (level, entity_id, child_level), delta in deltas.items() if delta]
+    if not rows:
+        return
+    stmt = UPSERTS[db.bind.dialect.name](mod.TaxonCount)
+    stmt = stmt.on_conflict_do_update(index_elements=['level', 'entity_id', 'child_level'],
+            set_={'count': mod.TaxonCount.count + stmt.excluded['count']})
+    await db.execute(stmt, rows)
+
+
+async def created(db: AsyncSession, level_name: str, fields: dict):
+    await apply(db, Counter({(level, id, level_name): 1 for level, id in owners(level_name, fields)}))
+
+
+async def bulk_created(db: AsyncSession, level_name: str, rows: list):
+    await apply(db, Counter((level, id, level_name) for row in rows for level, id in owners(level_name, row)))
+
+
+async def moved(db: AsyncSession, level_name: str, old: dict, new: dict, live: dict):
+    """Carry a subtree's counts from its old ancestors to its new ones; `live` is its live row count per level."""
+    deltas = Counter()
+    for level, owner in owners(level_name, old):
+        for child_level, count in live.items():
+            deltas[(level, owner, child_level)] -= count
+    for level, owner in owners(level_name, new):
+        for child_level, count in live.items():
+            deltas[(level, owner, child_level)] += count
+    await apply(db, deltas)
+
+
+async def rows_removed(db: AsyncSession, level_name: str, rows: list):
+    """Take deleted `level_name` rows out of every count that includes them, in the
+    transaction that deletes them.
+
+    `rows` are mappings with the rows' id, is_deleted and ancestor ids; rows
+    already soft deleted were taken out when they were. The rows' own counts
+    are dropped when they are down to zero, as in a hard delete, which goes
+    bottom up; a soft delete goes top down, so there they run down to zero
+    and stay until the next recompute.
+    """
+    deltas = Counter()
+    for row in rows:
+        if not row['is_deleted']:
+            for level, owner in owners(level_name, row):
+                deltas[(level, owner, level_name)] -= 1
+    await apply(db, deltas)
+    if descendants_of(level_name):
+        await db.execute(delete(mod.TaxonCount).where(and_(mod.TaxonCount.level == level_name,
+                mod.TaxonCount.entity_id.in_([row['id'] for row in rows]), mod.TaxonCount.count == 0))\
+                    .execution_options(synchronize_session=False))
+
+
+async def node_counts(db: AsyncSession, level_name: str, id: int):
+    result = await db.execute(select(mod.TaxonCount.child_level, mod.TaxonCount.count)\
+        .where(and_(mod.TaxonCount.level == level_name, mod.TaxonCount.entity_id == id)))
+    counts = dict(result.all())
+    levels = mod.LEVELS if level_name == CADASTRE else descendants_of(level_name)
+    return {level.name: counts.get(level.name, 0) for level in levels}
+
+
+async def ranked(db: AsyncSession, level_name: str, child_level: str, limit: int, offset: int):
+    """Nodes of `level_name` by their number of `child_level` rows, largest first."""
+    result = await db.execute(select(mod.TaxonCount.entity_id, mod.TaxonCount.count)\
+        .where(and_(mod.TaxonCount.level == level_name, mod.TaxonCount.child_level == child_level,
+            mod.TaxonCount.count > 0))\
+                .order_by(mod.TaxonCount.count.desc(), mod.TaxonCount.entity_id).limit(limit).offset(offset))
+    return [{'id': entity_id, 'count': count} for entity_id, count in result.all()]
+
+
+# a recompute always writes the cadastre rows, so an empty table has never been filled
+async def is_empty(db: AsyncSession):
+    result = await db.execute(select(mod.TaxonCount.level).limit(1))
+    return result.first() is None
+
+
+async def lock_counters(db: AsyncSession):
+    """Hold every other counter write off until the caller's transaction ends.
+
+    Writers change taxon_count in the transaction that changes the rows
+    they count. Once this lock is granted, every committed row is already
+    counted, and every uncommitted one adds its delta after the caller
+    commits. On Postgres the lock leaves reads alone. SQLite has no table
+    locks, so there the caller's first write takes the database write lock.
+    """
+    if db.bind.dialect.name == 'postgresql':
+        await db.execute(text('LOCK TABLE taxon_count IN EXCLUSIVE MODE'))
+
+
+async def recompute(db: AsyncSession):
+    """Rebuild every counter from the level tables with one GROUP BY per (ancestor, level) pair.
+
+    Counter writes wait until it commits, so none of them is lost to the rebuild.
+    """
+    await lock_counters(db)
+    await db.execute(delete(mod.TaxonCount))
+    rows = []
+    for level in mod.LEVELS:
+        model = level.model
+        result = await db.execute(select(func.count()).select_from(model).where(model.is_deleted == False))
+        rows.append({'level': CADASTRE, 'entity_id': 0, 'child_level': level.name, 'count': result.scalar()})
+        for ancestor in ancestors_of(level.name):
+            column = getattr(model, ancestor.id_key)
+            result = await db.execute(select(column, func.count())\
+                .where(and_(model.is_deleted == False, column.isnot(None))).group_by(column))
+            rows.extend({'level': ancestor.name, 'entity_id': id, 'child_level': level.name, 'count': count}
+                    for id, count in result.all())
+    for i in range(0, len(rows), STATS_BATCH_SIZE):
+        await db.execute(insert(mod.TaxonCount), rows[i:i + STATS_BATCH_SIZE])
+    await db.commit()
+    return len(rows)
+
+
+async def recompute_job(job):
+    """Background recompute, fixing any drift between the counters and the rows."""
+    async with SessionLocal() as db:
+        return {'rows': await recompute(db)}
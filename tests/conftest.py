@@ -0,0 +1,82 @@
+"""The app on a throwaway SQLite file, shared by the tests that go through its routes.
+
+The database lives for the whole run, so each test builds its own subtree
+and only looks at the rows it made.
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+DATABASE = os.path.join(tempfile.mkdtemp(), 'test.db')
+
+# before the app is imported: db.connection builds its engine from these
+os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{DATABASE}'
+os.environ['CHANGES_SETTLE_SECONDS'] = '0'
+os.environ['JOB_PROGRESS_INTERVAL'] = '0'
+
+import models as mod
+
+
+
+@pytest.fixture(scope='session')
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture(scope='session')
+def admin(client):
+    response = client.post('/api/create-superadmin', json={'username': 'root', 'password': 'pw'})
+    assert response.status_code == 200, response.text
+    return {'Authorization': f'Bearer {response.json()["token"]}'}
+
+
+def create(client, admin, level: str, name: str, **parents):
+    response = client.post(f'/api/create-{level}', json=dict(parents, name_lt=name, name_ru=name.lower()),
+            headers=admin)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+@pytest.fixture
+def tree(client, admin):
+    """tree(width) makes a department with `width` nodes on every level below it.
+
+    Returns {level: [ids]}; the nth node of each level hangs under the nth
+    node of the level above (the department for the first level).
+    """
+    def build(width: int = 2, name: str = 'T'):
+        department = create(client, admin, 'department', f'{name}0')
+        ids = {'department': [department['id']]}
+        for i in range(width):
+            parents = {'department_id': department['id']}
+            for level in mod.LEVELS[1:]:
+                node = create(client, admin, level.name, f'{name}{level.name}{i}', **parents)
+                ids.setdefault(level.name, []).append(node['id'])
+                parents[level.id_key] = node['id']
+        return ids
+    return build
+
+
+def wait_for_job(client, admin, id: str, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f'/api/jobs/{id}', headers=admin).json()
+        if job['state'] in ('done', 'failed', 'interrupted') or time.monotonic() > deadline:
+            return job
+        time.sleep(0.02)
+
+
+def rows(level: str, where: str, *args):
+    """(id, is_deleted) of the rows of a level matching `where`, read straight from the file."""
+    with sqlite3.connect(DATABASE) as connection:
+        table = mod.LEVELS_BY_NAME[level].model.__tablename__
+        return connection.execute(f'SELECT id, is_deleted FROM "{table}" WHERE {where} ORDER BY id', args).fetchall()
@@ -0,0 +1,42 @@
+"""Account routes, seen by a superadmin, and the login budget."""
+from types import SimpleNamespace
+
+from tokens.passwords import LoginBudget
+
+
+def test_password_hashes_are_never_sent(client, admin):
+    created = []
+    for kind in ('admin', 'user'):
+        response = client.post(f'/api/create-{kind}', json={'username': f'hashless{kind}', 'password': 'secret'},
+                headers=admin)
+        assert response.status_code == 201, response.text
+        created.append(response.json())
+    admin_id, user_id = (account['id'] for account in created)
+    responses = created + [client.get(path, headers=admin).json() for path in
+            ('/api/get-admins', f'/api/get-admin/{admin_id}', '/api/get-users', f'/api/get-user/{user_id}')]
+    for response in responses:
+        for account in response if isinstance(response, list) else [response]:
+            assert 'username' in account and 'password' not in account
+
+
+def test_only_failed_logins_spend_the_budget(client, admin):
+    credentials = {'username': 'budgeted', 'password': 'secret'}
+    assert client.post('/api/create-user', json=credentials, headers=admin).status_code == 201
+    # well past LOGIN_BURST
+    for _ in range(8):
+        assert client.post('/api/login-user', json=credentials).status_code == 200
+    statuses = [client.post('/api/login-user', json=dict(credentials, password='wrong')).json()['status_code']
+            for _ in range(6)]
+    assert statuses == [400] * 5 + [429]
+    # the right password waits for the bucket like everything else from this address
+    assert client.post('/api/login-user', json=credentials).json()['status_code'] == 429
+
+
+def test_budget_is_per_username_and_address():
+    budget = LoginBudget(SimpleNamespace(busy=lambda: False), burst=2, rate=0)
+    assert budget.allow('Victim', '10.0.0.1')
+    budget.fail('victim', '10.0.0.1')
+    budget.fail('VICTIM', '10.0.0.1')
+    assert not budget.allow('victim', '10.0.0.1')
+    assert budget.allow('victim', '10.0.0.2') and budget.allow('other', '10.0.0.1')
+    assert budget.refused == 1
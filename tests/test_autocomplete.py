@@ -0,0 +1,98 @@
+"""AutocompleteIndex patched by writes between builds, without a database."""
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import autocomplete
+import models as mod
+from autocomplete import AutocompleteIndex, load_levels
+
+
+FAMILIES = [(1, 'Rosaceae', 'Розовые'), (2, 'Malvaceae', 'Мальвовые'), (3, 'Rutaceae', 'Рутовые')]
+
+
+def index():
+    built = AutocompleteIndex(max_age=3600)
+    rows = {level.name: [] for level in mod.LEVELS}
+    rows['family'] = [SimpleNamespace(id=id, name_lt=name_lt, name_ru=name_ru) for id, name_lt, name_ru in FAMILIES]
+    built.levels = load_levels(rows)
+    built.built_at = float('inf')
+    return built
+
+
+def names(index, q):
+    return [suggestion['name_lt'] for suggestion in index.suggest(q)]
+
+
+def test_load_sorts_in_chunks(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'SORT_CHUNK', 2)
+    family = index().levels['family']
+    assert family.entries == sorted(family.entries)
+    assert len(family.entries) == 6
+
+
+def test_writes_are_merged_into_suggestions():
+    built = index()
+    built.apply('family', 4, 'create', {'name_lt': 'Rubiaceae', 'name_ru': 'Мареновые'})
+    assert names(built, 'ru') == ['Rubiaceae', 'Rutaceae']
+    built.apply('family', 3, 'update', {'name_lt': 'Rhamnaceae', 'name_ru': 'Крушиновые'})
+    assert names(built, 'ru') == ['Rubiaceae']
+    assert names(built, 'rh') == ['Rhamnaceae']
+    built.apply('family', 1, 'delete')
+    assert names(built, 'ro') == []
+    family = built.levels['family']
+    # the sorted keys of the build are left alone
+    assert len(family.entries) == 6
+    assert family.pending == len(family.recent) + len(family.removed) == 4 + 4
+
+
+def test_renaming_back_cancels_out():
+    built = index()
+    built.apply('family', 2, 'update', {'name_lt': 'Tiliaceae', 'name_ru': 'Липовые'})
+    built.apply('family', 2, 'update', {'name_lt': 'Malvaceae', 'name_ru': 'Мальвовые'})
+    assert built.levels['family'].pending == 0
+    assert names(built, 'мальв') == ['Malvaceae']
+
+
+def test_update_of_a_deleted_row_is_not_indexed():
+    built = index()
+    built.apply('family', 2, 'delete')
+    built.apply('family', 2, 'update', {'name_lt': 'Malvaceae', 'name_ru': 'Мальвовые'})
+    assert names(built, 'mal') == []
+
+
+def test_many_writes_schedule_a_rebuild(monkeypatch):
+    monkeypatch.setattr(autocomplete, 'PENDING_LIMIT', 3)
+    built = index()
+    refreshes = []
+    built.refresh = lambda: refreshes.append(1)
+    built.apply('family', 4, 'create', {'name_lt': 'Rubiaceae', 'name_ru': 'Мареновые'})
+    assert refreshes == []
+    built.apply('family', 5, 'create', {'name_lt': 'Apiaceae', 'name_ru': 'Зонтичные'})
+    assert refreshes == [1]
+
+
+def test_build_swaps_in_new_levels():
+    built = index()
+    before = built.levels
+
+    class Result:
+        def __init__(self, rows):
+            self.rows = rows
+
+        def all(self):
+            return self.rows
+
+    class Session:
+        async def execute(self, statement):
+            table = statement.get_final_froms()[0].name
+            rows = [SimpleNamespace(id=9, name_lt='Pinaceae', name_ru='Сосновые')] if table == 'family' else []
+            return Result(rows)
+
+    asyncio.run(built.build(Session()))
+    assert built.levels is not before
+    assert names(built, 'pin') == ['Pinaceae']
+    assert names(built, 'ros') == []
@@ -0,0 +1,74 @@
+"""/api/changes after each kind of write, read from a token taken just before it."""
+from conftest import create
+
+
+def drain(client, admin, since: str = None):
+    """Every change after `since`, a page at a time, and the token to resume from."""
+    changes = []
+    while True:
+        page = client.get('/api/changes', params={'since': since, 'limit': 5} if since else {'limit': 5},
+                headers=admin).json()
+        changes += page['changes']
+        since = page['next']
+        if not page['has_more']:
+            return changes, since
+
+
+def ops(changes):
+    return sorted((change['level'], change['id'], change['op']) for change in changes)
+
+
+def test_feed_reports_creates_updates_moves_and_deletes(client, admin, tree):
+    _, token = drain(client, admin)
+
+    ids = tree(1, 'F')
+    changes, token = drain(client, admin, token)
+    assert ops(changes) == sorted((level, nodes[0], 'create') for level, nodes in ids.items())
+    family = ids['family'][0]
+    assert [change['row']['name_lt'] for change in changes if change['level'] == 'family'] == ['Ffamily0']
+
+    response = client.put(f'/api/update-department/{ids["department"][0]}', json={'name_lt': 'Renamed',
+            'name_ru': 'renamed'}, headers=admin)
+    assert response.status_code == 201, response.text
+    changes, token = drain(client, admin, token)
+    assert ops(changes) == [('department', ids['department'][0], 'update')]
+    assert changes[0]['row']['name_lt'] == 'Renamed'
+
+    # a move rewrites the ancestor ids of everything under the node, so all of it is sent again
+    target = create(client, admin, 'department', 'Target')
+    _, token = drain(client, admin, token)
+    response = client.put(f'/api/update-class/{ids["class"][0]}', json={'name_lt': 'C', 'name_ru': 'c',
+            'department_id': target['id']}, headers=admin)
+    assert response.status_code == 201, response.text
+    changes, token = drain(client, admin, token)
+    below = ['class', 'subclass', 'supersubclass', 'order', 'suborder', 'family']
+    assert ops(changes) == sorted((level, ids[level][0], 'update') for level in below)
+    assert {change['row']['department_id'] for change in changes} == {target['id']}
+
+    assert client.delete(f'/api/delete-family/{family}?soft=true', headers=admin).status_code == 200
+    changes, token = drain(client, admin, token)
+    assert ops(changes) == [('family', family, 'delete')]
+    assert changes[0]['row'] is None
+
+    # hard deletes leave tombstones, the soft-deleted family's too; a repeated delete is harmless
+    assert client.delete(f'/api/delete-order/{ids["order"][0]}', headers=admin).status_code == 200
+    changes, token = drain(client, admin, token)
+    assert ops(changes) == sorted((level, ids[level][0], 'delete') for level in ('order', 'suborder', 'family'))
+
+    changes, again = drain(client, admin, token)
+    assert changes == [] and again == token
+
+
+def test_feed_rejects_a_bad_token(client, admin):
+    for token in ['junk', 'eyJ0IjogMX0', '']:
+        response = client.get('/api/changes', params={'since': token}, headers=admin)
+        if token:
+            assert response.status_code == 400
+            assert response.json() == {'detail': 'Invalid sync token'}
+        else:
+            # an empty token is a first sync
+            assert response.status_code == 200
+
+
+def test_feed_needs_an_admin(client):
+    assert client.get('/api/changes', headers={'Authorization': 'Bearer nope'}).json()['status_code'] == 401
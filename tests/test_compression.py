@@ -0,0 +1,202 @@
+"""Accept-Encoding negotiation, strong ETags and 304s, for CompressionMiddleware
+and for the precompressed listings snapshot_response sends."""
+import asyncio
+import gzip
+import os
+import sys
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import Request
+from compression import (CompressionMiddleware, ENCODINGS, negotiate, strong_etag, encoded_etag,
+        brotli, zstandard)
+from snapshot import SnapshotEntry, snapshot_response, http_date
+
+
+BODY = b'{"items": [' + b','.join(b'{"name_lt": "Rosaceae", "id": %d}' % i for i in range(200)) + b']}'
+
+
+def decompress(body: bytes, encoding: str):
+    if encoding == 'br':
+        return brotli.decompress(body)
+    if encoding == 'zstd':
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return gzip.decompress(body)
+
+
+def call(app, headers: dict = None, method: str = 'GET'):
+    """Run one request through an ASGI app; returns (status, headers, body)."""
+    scope = {'type': 'http', 'method': method, 'path': '/', 'query_string': b'', 'root_path': '',
+            'headers': [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(app(scope, receive, send))
+    start = messages[0]
+    response_headers = {key.decode(): value.decode() for key, value in start['headers']}
+    return start['status'], response_headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+
+def json_app(body: bytes = BODY):
+    async def app(scope, receive, send):
+        await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+    return CompressionMiddleware(app)
+
+
+def snapshot_app(entry: SnapshotEntry):
+    async def app(scope, receive, send):
+        await snapshot_response(entry, Request(scope), 200)(scope, receive, send)
+    return CompressionMiddleware(app)
+
+
+###############
+# NEGOTIATION #
+###############
+
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, None),
+    ('', None),
+    ('identity', None),
+    ('gzip', 'gzip'),
+    ('GZIP', 'gzip'),
+    ('gzip;q=0', None),
+    ('deflate, gzip;q=0.5', 'gzip'),
+    ('*', ENCODINGS[0]),
+    ('*;q=0, gzip', 'gzip'),
+])
+def test_negotiate(accept, expected):
+    assert negotiate(accept) == expected
+
+
+def test_negotiate_prefers_br_then_zstd_at_equal_weight():
+    pytest.importorskip('brotli')
+    pytest.importorskip('zstandard')
+    assert ENCODINGS == ['br', 'zstd', 'gzip']
+    assert negotiate('gzip, zstd, br') == 'br'
+    assert negotiate('gzip, zstd') == 'zstd'
+    assert negotiate('br;q=0.5, gzip') == 'gzip'
+
+
+##############
+# MIDDLEWARE #
+##############
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_middleware_compresses_json(encoding):
+    status, headers, body = call(json_app(), {'Accept-Encoding': encoding})
+    assert status == 200
+    assert headers['content-encoding'] == encoding
+    assert headers['vary'] == 'Accept-Encoding'
+    assert int(headers['content-length']) == len(body) < len(BODY)
+    assert decompress(body, encoding) == BODY
+    assert headers['etag'] == encoded_etag(strong_etag(BODY), encoding)
+
+
+def test_middleware_leaves_small_and_unaccepted_bodies_alone():
+    status, headers, body = call(json_app(b'{"id": 1}'), {'Accept-Encoding': 'gzip'})
+    assert (status, body) == (200, b'{"id": 1}')
+    assert 'content-encoding' not in headers
+    # small bodies are sent as they are, so their tag carries no encoding
+    assert headers['etag'] == strong_etag(b'{"id": 1}')
+    status, headers, body = call(json_app())
+    assert body == BODY and 'content-encoding' not in headers
+
+
+def test_middleware_etag_follows_the_body():
+    _, first, _ = call(json_app(), {'Accept-Encoding': 'gzip'})
+    _, again, _ = call(json_app(), {'Accept-Encoding': 'gzip'})
+    _, other, _ = call(json_app(BODY.replace(b'Rosaceae', b'Malvaceae')), {'Accept-Encoding': 'gzip'})
+    assert first['etag'] == again['etag'] != other['etag']
+    assert first['etag'].startswith('"') and first['etag'].endswith('-gzip"')
+
+
+@pytest.mark.parametrize('if_none_match', [
+    lambda etag: etag,
+    lambda etag: f'W/{etag}',
+    lambda etag: f'"nope", {etag}',
+    lambda etag: encoded_etag(etag[:-len('-gzip"')] + '"', None),
+    lambda etag: '*',
+])
+def test_middleware_answers_304_for_any_encoding_of_the_same_body(if_none_match):
+    _, headers, _ = call(json_app(), {'Accept-Encoding': 'gzip'})
+    status, not_modified, body = call(json_app(), {'Accept-Encoding': 'gzip',
+            'If-None-Match': if_none_match(headers['etag'])})
+    assert (status, body) == (304, b'')
+    assert not_modified['etag'] == headers['etag']
+    assert 'content-length' not in not_modified
+
+
+def test_middleware_sends_the_body_for_a_stale_tag_or_a_post():
+    status, _, body = call(json_app(), {'Accept-Encoding': 'gzip', 'If-None-Match': '"stale"'})
+    assert status == 200 and decompress(body, 'gzip') == BODY
+    status, headers, _ = call(json_app(), {'If-None-Match': '*'}, method='POST')
+    assert status == 200 and 'etag' not in headers
+
+
+#####################
+# SNAPSHOT RESPONSE #
+#####################
+
+
+LAST_MODIFIED = datetime(2026, 3, 1, 12, 30)
+
+
+def entry():
+    return SnapshotEntry(1, BODY, LAST_MODIFIED)
+
+
+@pytest.mark.parametrize('encoding', ENCODINGS)
+def test_snapshot_is_sent_precompressed(encoding):
+    snapshot = entry()
+    status, headers, body = call(snapshot_app(snapshot), {'Accept-Encoding': encoding})
+    assert status == 200
+    # passed through the middleware untouched, not compressed twice
+    assert headers['content-encoding'] == encoding
+    assert decompress(body, encoding) == BODY
+    assert int(headers['content-length']) == len(body)
+    assert headers['etag'] == encoded_etag(snapshot.etag, encoding)
+    assert headers['last-modified'] == http_date(LAST_MODIFIED)
+    # compressed once and kept on the entry
+    assert asyncio.run(snapshot.encoded(encoding)) is asyncio.run(snapshot.encoded(encoding))
+
+
+def test_snapshot_without_accept_encoding_is_plain():
+    snapshot = entry()
+    status, headers, body = call(snapshot_app(snapshot))
+    assert (status, body) == (200, BODY)
+    assert headers['etag'] == snapshot.etag == strong_etag(BODY)
+
+
+def test_snapshot_304_on_if_none_match():
+    snapshot = entry()
+    for encoding in ENCODINGS:
+        tag = encoded_etag(snapshot.etag, encoding)
+        status, headers, body = call(snapshot_app(snapshot), {'Accept-Encoding': 'gzip', 'If-None-Match': tag})
+        assert (status, body) == (304, b'')
+        assert headers['etag'] == encoded_etag(snapshot.etag, 'gzip')
+
+
+def test_snapshot_304_on_if_modified_since():
+    snapshot = entry()
+    status, _, body = call(snapshot_app(snapshot), {'If-Modified-Since': http_date(LAST_MODIFIED)})
+    assert (status, body) == (304, b'')
+    status, _, body = call(snapshot_app(snapshot), {'If-Modified-Since': 'Sun, 01 Feb 2026 00:00:00 GMT'})
+    assert (status, body) == (200, BODY)
+
+
+def test_snapshot_if_none_match_wins_over_if_modified_since():
+    status, _, body = call(snapshot_app(entry()), {'If-None-Match': '"stale"',
+            'If-Modified-Since': http_date(LAST_MODIFIED)})
+    assert (status, body) == (200, BODY)
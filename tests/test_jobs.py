@@ -0,0 +1,120 @@
+"""JobQueue states and per-kind limits, run on the app's event loop and job table."""
+import asyncio
+
+from conftest import wait_for_job
+from jobs import JobQueue, QUEUED, RUNNING, DONE, FAILED, INTERRUPTED
+
+
+async def until(condition, timeout: float = 5):
+    for _ in range(int(timeout / 0.01)):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError('timed out')
+
+
+def settled(queue: JobQueue, running: int = 0):
+    # the state is set before the job's last write to the table; its task ends after it
+    return lambda: len(queue._tasks) == running
+
+
+def gated():
+    """A job function that reports half-way and then waits for `gate` to open."""
+    gate = asyncio.Event()
+
+    async def work(job, value):
+        await job.report(1, 2)
+        await gate.wait()
+        return {'value': value}
+    return gate, work
+
+
+def test_states_and_results_reach_the_table(client, admin):
+    queue = JobQueue(workers=1, limits={})
+
+    async def scenario():
+        gate, work = gated()
+        first = await queue.submit('slow', work, 1)
+        second = await queue.submit('slow', work, 2)
+        await until(lambda: first.progress == 0.5)
+        seen = [(first.state, first.progress), (second.state, second.progress)]
+        gate.set()
+        await until(settled(queue))
+        await queue.shutdown()
+        return seen, first, second
+
+    seen, first, second = client.portal.call(scenario)
+    # one worker: the second waits its turn
+    assert seen == [(RUNNING, 0.5), (QUEUED, 0.0)]
+    assert (first.result, second.result) == ({'value': 1}, {'value': 2})
+    assert first.started_at <= first.finished_at <= second.started_at <= second.finished_at
+    # not in the app's queue, so the route reads them back from the table
+    for job in (first, second):
+        stored = client.get(f'/api/jobs/{job.id}', headers=admin).json()
+        assert (stored['state'], stored['progress'], stored['result']) == (DONE, 1.0, {'value': job.args[0]})
+
+
+def test_failed_and_interrupted_jobs(client, admin):
+    queue = JobQueue(workers=2, limits={})
+
+    async def scenario():
+        async def broken(job):
+            raise ValueError('no such taxon')
+        gate, work = gated()
+        failed = await queue.submit('broken', broken)
+        running = await queue.submit('slow', work, 1)
+        waiting = await queue.submit('slow', work, 2)
+        await until(lambda: running.progress == 0.5)
+        await until(settled(queue, running=1))
+        await queue.shutdown()
+        return failed, running, waiting
+
+    failed, running, waiting = client.portal.call(scenario)
+    assert failed.error == 'no such taxon'
+    assert (running.state, waiting.state) == (INTERRUPTED, INTERRUPTED)
+    assert client.get(f'/api/jobs/{failed.id}', headers=admin).json()['error'] == 'no such taxon'
+    assert client.get(f'/api/jobs/{waiting.id}', headers=admin).json()['state'] == INTERRUPTED
+
+
+def test_limits_are_per_kind(client):
+    queue = JobQueue(workers=3, limits={'export': 2})
+
+    async def scenario():
+        gate, work = gated()
+        exports = [await queue.submit('export', work, i) for i in range(3)]
+        cascades = [await queue.submit('cascade_delete', work, i) for i in range(2)]
+        await until(lambda: sum(job.progress == 0.5 for job in exports + cascades) == 3)
+        await asyncio.sleep(0.05)
+        seen = [job.state for job in exports + cascades]
+        gate.set()
+        await until(lambda: all(job.state == DONE for job in exports + cascades))
+        await until(settled(queue))
+        await queue.shutdown()
+        return seen
+
+    seen = client.portal.call(scenario)
+    # two exports (their limit) and one cascade (the default of 1) fill the three workers
+    assert seen == [RUNNING, RUNNING, QUEUED, RUNNING, QUEUED]
+
+
+def test_route_submitted_job_finishes(client, admin):
+    response = client.post('/api/stats/recompute', headers=admin)
+    assert response.status_code == 202, response.text
+    job = wait_for_job(client, admin, response.json()['job'])
+    assert (job['kind'], job['state'], job['progress']) == ('stats_recompute', DONE, 1.0)
+    assert client.get('/api/jobs/nope', headers=admin).json()['status_code'] == 404
+
+
+def test_export_job_file_can_be_downloaded(client, admin, tree):
+    ids = tree(1, 'X')
+    response = client.get('/api/export/family', params={'format': 'csv', 'background': 'true'}, headers=admin)
+    assert response.status_code == 202, response.text
+    job = wait_for_job(client, admin, response.json()['job'])
+    assert job['state'] == 'done'
+    download = client.get(f'/api/jobs/{job["id"]}/download', headers=admin)
+    assert download.status_code == 200
+    assert f'{ids["family"][0]},Xfamily0' in download.text
+    recompute = client.post('/api/stats/recompute', headers=admin).json()['job']
+    wait_for_job(client, admin, recompute)
+    # only finished exports have a file
+    assert client.get(f'/api/jobs/{recompute}/download', headers=admin).json()['status_code'] == 404
@@ -0,0 +1,17 @@
+"""Prometheus lines for the stats dicts collected at scrape time."""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from metrics import snapshot_metrics
+
+
+def test_running_totals_are_counters():
+    lines = list(snapshot_metrics('db_pool', {'checkouts': 3, 'wait_seconds_total': 0.5, 'size': 5}, 'Pool.',
+            ('checkouts', 'wait_seconds_total')))
+    assert [line for line in lines if not line.startswith('# HELP')] == [
+        '# TYPE db_pool_checkouts_total counter', 'db_pool_checkouts_total 3',
+        '# TYPE db_pool_wait_seconds_total counter', 'db_pool_wait_seconds_total 0.5',
+        '# TYPE db_pool_size gauge', 'db_pool_size 5',
+    ]
@@ -0,0 +1,64 @@
+"""taxon_count kept up by each write, checked against a full recompute."""
+import sqlite3
+
+import pytest
+
+from conftest import DATABASE, wait_for_job
+
+
+def counts():
+    with sqlite3.connect(DATABASE) as connection:
+        return sorted(connection.execute('SELECT level, entity_id, child_level, count FROM taxon_count '
+                'WHERE count != 0').fetchall())
+
+
+def recompute(client, admin):
+    response = client.post('/api/stats/recompute', headers=admin)
+    assert response.status_code == 202, response.text
+    assert wait_for_job(client, admin, response.json()['job'])['state'] == 'done'
+
+
+@pytest.fixture
+def matches_recompute(client, admin):
+    """Call after a write: the counts it left must be what a recompute makes of the rows."""
+    recompute(client, admin)
+
+    def check():
+        before = counts()
+        recompute(client, admin)
+        assert counts() == before
+    return check
+
+
+def test_create_and_move(client, admin, tree, matches_recompute):
+    source, target = tree(2, 'S'), tree(1, 'T')
+    matches_recompute()
+    response = client.put(f'/api/update-subclass/{source["subclass"][1]}', json={'name_lt': 'M', 'name_ru': 'm',
+            'department_id': target['department'][0], 'class_id': target['class'][0]}, headers=admin)
+    assert response.status_code == 201, response.text
+    matches_recompute()
+    counted = client.get(f'/api/stats/class/{target["class"][0]}', headers=admin).json()['counts']
+    assert counted == {'subclass': 2, 'supersubclass': 2, 'order': 2, 'suborder': 2, 'family': 2}
+
+
+def test_bulk_import(client, admin, tree, matches_recompute):
+    ids = tree(1, 'B')
+    parents = {f'{level}_id': ids[level][0] for level in ids if level != 'family'}
+    families = [dict(parents, name_lt=f'Bulk{i}', name_ru=f'bulk{i}') for i in range(5)]
+    response = client.post('/api/bulk-import/family', json=families, headers=admin)
+    assert response.status_code == 201, response.text
+    matches_recompute()
+    assert client.get(f'/api/stats/suborder/{ids["suborder"][0]}', headers=admin).json()['counts'] == {'family': 6}
+
+
+@pytest.mark.parametrize('soft', [True, False])
+def test_deletes(client, admin, tree, matches_recompute, soft):
+    ids = tree(2, 'D')
+    response = client.delete(f'/api/delete-supersubclass/{ids["supersubclass"][0]}?soft={str(soft).lower()}',
+            headers=admin)
+    assert response.status_code == 200, response.text
+    matches_recompute()
+    response = client.delete(f'/api/delete-department/{ids["department"][0]}?soft={str(soft).lower()}',
+            headers=admin)
+    assert response.status_code == 200, response.text
+    matches_recompute()
@@ -0,0 +1,107 @@
+"""Cascading deletes and subtree moves, checked through the routes and the rows they leave."""
+import crud
+import models as mod
+from conftest import rows, wait_for_job
+
+
+BELOW_DEPARTMENT = [level.name for level in mod.LEVELS[1:]]
+
+
+def node_stats(client, admin, level: str, id: int):
+    return client.get(f'/api/stats/{level}/{id}', headers=admin).json()
+
+
+def lineage(client, admin, level: str, id: int):
+    return [(node['level'], node['id']) for node in client.get(f'/api/lineage/{level}/{id}', headers=admin).json()]
+
+
+###########
+# CASCADE #
+###########
+
+
+def test_soft_cascade_marks_the_subtree_deleted(client, admin, tree):
+    ids = tree(2)
+    department, doomed, kept = ids['department'][0], ids['class'][0], ids['class'][1]
+    response = client.delete(f'/api/delete-class/{doomed}?soft=true', headers=admin)
+    assert response.status_code == 200, response.text
+    assert response.json()['deleted'] == {level: 1 for level in BELOW_DEPARTMENT}
+    for level in BELOW_DEPARTMENT:
+        # still there, flagged, next to the untouched branch
+        assert rows(level, 'class_id IN (?, ?)' if level != 'class' else 'id IN (?, ?)', doomed, kept) == \
+            sorted([(ids[level][0], 1), (ids[level][1], 0)])
+    assert node_stats(client, admin, 'department', department)['counts'] == {level: 1 for level in BELOW_DEPARTMENT}
+    assert client.get(f'/api/lineage/family/{ids["family"][0]}', headers=admin).json()['status_code'] == 404
+    # a second soft delete finds nothing live to delete
+    assert client.delete(f'/api/delete-class/{doomed}?soft=true', headers=admin).json()['status_code'] == 204
+
+
+def test_hard_cascade_removes_the_subtree(client, admin, tree):
+    ids = tree(2)
+    department = ids['department'][0]
+    totals = client.get('/api/stats', headers=admin).json()
+    response = client.delete(f'/api/delete-department/{department}', headers=admin)
+    assert response.status_code == 200, response.text
+    assert response.json()['deleted'] == dict({level: 2 for level in BELOW_DEPARTMENT}, department=1)
+    assert rows('department', 'id = ?', department) == []
+    for level in BELOW_DEPARTMENT:
+        assert rows(level, 'department_id = ?', department) == []
+    after = client.get('/api/stats', headers=admin).json()
+    assert after == dict({level: totals[level] - 2 for level in BELOW_DEPARTMENT},
+            department=totals['department'] - 1)
+    assert node_stats(client, admin, 'department', department)['status_code'] == 404
+
+
+def test_big_cascade_runs_as_a_job(client, admin, tree, monkeypatch):
+    monkeypatch.setattr(crud, 'CASCADE_BACKGROUND_ROWS', 3)
+    ids = tree(2)
+    department = ids['department'][0]
+    response = client.delete(f'/api/delete-department/{department}?soft=true', headers=admin)
+    assert response.status_code == 202, response.text
+    job = wait_for_job(client, admin, response.json()['job'])
+    assert job['state'] == 'done'
+    assert job['detail']['mode'] == 'soft'
+    assert job['detail']['done'] == job['detail']['total'] == dict({level: 2 for level in BELOW_DEPARTMENT},
+            department=1)
+    assert [deleted for _, deleted in rows('family', 'department_id = ?', department)] == [1, 1]
+    assert node_stats(client, admin, 'department', department)['status_code'] == 404
+
+
+########
+# MOVE #
+########
+
+
+def test_move_carries_the_subtree_to_its_new_ancestors(client, admin, tree):
+    source, target = tree(1, 'S'), tree(1, 'T')
+    order, suborder, family = source['order'][0], source['suborder'][0], source['family'][0]
+    parents = {key: target[level][0] for key, level in [('department_id', 'department'), ('class_id', 'class'),
+            ('subclass_id', 'subclass'), ('supersubclass_id', 'supersubclass')]}
+    response = client.put(f'/api/update-order/{order}', json=dict(parents, name_lt='Moved', name_ru='moved'),
+            headers=admin)
+    assert response.status_code == 201, response.text
+
+    above = [(level, target[level][0]) for level in ('department', 'class', 'subclass', 'supersubclass')]
+    assert lineage(client, admin, 'family', family) == above + [('order', order), ('suborder', suborder),
+            ('family', family)]
+    for level in ('suborder', 'family'):
+        assert rows(level, 'order_id = ? AND department_id = ? AND class_id = ? AND subclass_id = ? '
+                'AND supersubclass_id = ?', order, *parents.values()) == [(source[level][0], 0)]
+
+    moved = {'order': 1, 'suborder': 1, 'family': 1}
+    assert node_stats(client, admin, 'department', source['department'][0])['counts'] == \
+        {'class': 1, 'subclass': 1, 'supersubclass': 1, 'order': 0, 'suborder': 0, 'family': 0}
+    assert node_stats(client, admin, 'department', target['department'][0])['counts'] == \
+        {'class': 1, 'subclass': 1, 'supersubclass': 1, 'order': 2, 'suborder': 2, 'family': 2}
+    assert node_stats(client, admin, 'supersubclass', source['supersubclass'][0])['counts'] == \
+        {level: 0 for level in moved}
+    assert node_stats(client, admin, 'supersubclass', target['supersubclass'][0])['counts'] == \
+        {level: 2 for level in moved}
+
+
+def test_move_to_a_missing_parent_changes_nothing(client, admin, tree):
+    ids = tree(1)
+    response = client.put(f'/api/update-class/{ids["class"][0]}', json={'name_lt': 'C', 'name_ru': 'c',
+            'department_id': 999999}, headers=admin)
+    assert response.json()['status_code'] == 204
+    assert lineage(client, admin, 'family', ids['family'][0])[0] == ('department', ids['department'][0])
@@ -1 +1,5 @@
-from tokens.token import create_access_token, check_token, decode_token
\ No newline at end of file
+from tokens.token import (create_access_token, create_session_token, check_token, decode_token,
+        is_session_token, Principal, LEGACY_TOKENS)
+from tokens.principal_cache import principal_cache
+from tokens.token_versions import token_versions, REVOKED
+from tokens.passwords import password_hasher, login_budget, needs_rehash, DUMMY_HASH
\ No newline at end of file
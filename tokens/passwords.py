@@ -0,0 +1,148 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# scrypt cost; each hash takes 128 * N * R bytes of memory (16 MiB by default) and ~50 ms of CPU
+PASSWORD_SCRYPT_N = int(os.getenv('PASSWORD_SCRYPT_N', 2 ** 14))
+PASSWORD_SCRYPT_R = 8
+PASSWORD_SCRYPT_P = 1
+
+# threads hashing passwords; OpenSSL's scrypt releases the GIL, so they run beside the event loop
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', min(4, os.cpu_count() or 1)))
+
+# hashes queued or running before new logins are turned away
+PASSWORD_HASH_QUEUE = int(os.getenv('PASSWORD_HASH_QUEUE', 64))
+
+# failed logins per username and client address: a burst, then one more every 1 / LOGIN_RATE seconds
+LOGIN_BURST = float(os.getenv('LOGIN_BURST', 5))
+LOGIN_RATE = float(os.getenv('LOGIN_RATE', 0.2))
+
+PREFIX = 'scrypt'
+
+
+def b64(data: bytes):
+    return base64.b64encode(data).decode()
+
+
+def scrypt(password: str, salt: bytes, n: int, r: int, p: int):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r, dklen=32)
+
+
+def hash_password_sync(password: str):
+    salt = os.urandom(16)
+    digest = scrypt(password, salt, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return f'{PREFIX}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}${b64(salt)}${b64(digest)}'
+
+
+def verify_password_sync(password: str, stored: str):
+    try:
+        _, n, r, p, salt, digest = stored.split('$')
+        expected = base64.b64decode(digest)
+        actual = scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+# verified in place of a missing account's hash: scrypt runs with the current cost and the
+# comparison fails, so an unknown username takes as long as a wrong password
+DUMMY_HASH = f'{PREFIX}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}${b64(bytes(16))}${b64(bytes(32))}'
+
+
+def is_hashed(stored: str):
+    return bool(stored) and stored.startswith(PREFIX + '$')
+
+
+# plaintext rows from before hashing, and hashes made with an older cost
+def needs_rehash(stored: str):
+    return not is_hashed(stored) or stored.split('$')[1:4] != \
+        [str(PASSWORD_SCRYPT_N), str(PASSWORD_SCRYPT_R), str(PASSWORD_SCRYPT_P)]
+
+
+class PasswordHasher:
+    """scrypt on a bounded thread pool, so hashing never blocks the event loop."""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue: int = PASSWORD_HASH_QUEUE):
+        self.queue = queue
+        self.pending = 0
+        self.hashed = 0
+        self.verified = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+
+    def busy(self):
+        return self.pending >= self.queue
+
+    async def _run(self, function, *args):
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str):
+        self.hashed += 1
+        return await self._run(hash_password_sync, password)
+
+    async def verify(self, password: str, stored: str):
+        if not stored:
+            return False
+        if not is_hashed(stored):
+            return hmac.compare_digest(password.encode(), stored.encode())
+        self.verified += 1
+        return await self._run(verify_password_sync, password, stored)
+
+    def stats(self):
+        return {
+            'pending'   : self.pending,
+            'queue'     : self.queue,
+            'hashed'    : self.hashed,
+            'verified'  : self.verified
+        }
+
+
+class LoginBudget:
+    """Token bucket per (username, client address), spent by failed logins only.
+
+    A correct password never costs anything, and guesses from one address
+    cannot lock the account out for everyone else. Also refuses every login
+    while the hasher is saturated.
+    """
+
+    def __init__(self, hasher: PasswordHasher, burst: float = LOGIN_BURST, rate: float = LOGIN_RATE):
+        self.hasher = hasher
+        self.burst = burst
+        self.rate = rate
+        self.refused = 0
+        self._buckets = {}
+
+    def _tokens(self, key: tuple, now: float):
+        tokens, updated = self._buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def allow(self, username: str, address: str):
+        if self._tokens((username.lower(), address), time.monotonic()) < 1 or self.hasher.busy():
+            self.refused += 1
+            return False
+        return True
+
+    def fail(self, username: str, address: str):
+        now = time.monotonic()
+        key = (username.lower(), address)
+        self._buckets[key] = (self._tokens(key, now) - 1, now)
+        if len(self._buckets) > 10000:
+            self._prune(now)
+
+    def _prune(self, now: float):
+        # a bucket that has refilled is the same as no bucket
+        full_after = self.burst / self.rate if self.rate else float('inf')
+        for key in [key for key, (_, updated) in self._buckets.items() if now - updated >= full_after]:
+            del self._buckets[key]
+
+
+password_hasher = PasswordHasher()
+login_budget = LoginBudget(password_hasher)
@@ -0,0 +1,64 @@
+import os
+import time
+
+
+AUTH_CACHE_TTL = float(os.getenv('AUTH_CACHE_TTL', 60))
+
+
+class PrincipalCache:
+    """Authenticated accounts keyed by (kind, token).
+
+    Entries expire after `ttl` seconds and are dropped immediately by
+    `invalidate` whenever the account they belong to is changed.
+    """
+
+    def __init__(self, ttl: float = AUTH_CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._accounts = {}
+
+    def get(self, kind: str, token: str):
+        entry = self._entries.get((kind, token))
+        if entry is None:
+            self.misses += 1
+            return None
+        principal, expires_at = entry
+        if expires_at < time.monotonic():
+            self._drop(kind, token, principal.id)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return principal
+
+    def set(self, kind: str, token: str, principal):
+        self._entries[(kind, token)] = (principal, time.monotonic() + self.ttl)
+        self._accounts.setdefault((kind, principal.id), set()).add(token)
+
+    def invalidate(self, kind: str, id: int):
+        for token in self._accounts.pop((kind, id), ()):
+            self._entries.pop((kind, token), None)
+
+    def clear(self, kind: str = None):
+        for key in [key for key in self._accounts if kind is None or key[0] == kind]:
+            self.invalidate(*key)
+
+    def stats(self):
+        return {
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'size'      : len(self._entries),
+            'ttl'       : self.ttl
+        }
+
+    def _drop(self, kind: str, token: str, id: int):
+        self._entries.pop((kind, token), None)
+        tokens = self._accounts.get((kind, id))
+        if tokens:
+            tokens.discard(token)
+            if not tokens:
+                del self._accounts[(kind, id)]
+
+
+principal_cache = PrincipalCache()
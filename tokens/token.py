@@ -1,21 +1,60 @@
+import os
+import time
+from collections import namedtuple
+from functools import lru_cache
 from jose import jwt
 from fastapi import Request
 
-SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
+SECRET_KEY = os.getenv('SECRET_KEY', "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7")
 ALGORITHM = "HS256"
 
+# lifetime of session tokens issued at login, in seconds
+TOKEN_TTL = float(os.getenv('TOKEN_TTL', 12 * 3600))
+
+# tokens whose signature has been checked once; expiry is still checked on every use
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 4096))
+
+# accept the old {'username', 'password'} tokens, checked against the database on every cache miss;
+# they carry the password and never expire, so this is off unless a migration turns it on
+LEGACY_TOKENS = os.getenv('LEGACY_TOKENS', '0') == '1'
+
+# what a verified session token says about its bearer
+Principal = namedtuple('Principal', ['id', 'kind', 'is_superadmin'])
+
+
 async def create_access_token(data: dict):
     to_encode = data.copy()
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+
+async def create_session_token(kind: str, id: int, is_superadmin: bool, version: int):
+    return await create_access_token(data={
+        'sub'   : str(id),
+        'kind'  : kind,
+        'su'    : bool(is_superadmin),
+        'ver'   : version,
+        'exp'   : int(time.time() + TOKEN_TTL)
+    })
+
     
-async def decode_token(token: str):
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def verified_claims(token: str):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except:
+        return None
+
+
+async def decode_token(token: str):
+    payload = verified_claims(token)
+    if not payload or payload.get('exp', float('inf')) < time.time():
         return False
+    return payload
+
+
+def is_session_token(payload: dict):
+    return 'sub' in payload and 'ver' in payload
 
 
 async def check_token(header_param: Request):
@@ -26,4 +65,4 @@ async def check_token(header_param: Request):
         return False
     else:
         token = token.split('Bearer ')[1]
-        return token
\ No newline at end of file
+        return token
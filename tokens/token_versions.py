@@ -0,0 +1,53 @@
+import os
+import time
+
+
+TOKEN_VERSION_TTL = float(os.getenv('TOKEN_VERSION_TTL', 30))
+
+# cached for accounts that are missing, deleted or inactive: no version matches it
+REVOKED = -1
+
+
+class TokenVersions:
+    """Current token version per (kind, account id).
+
+    Session tokens carry the version they were issued with and stop
+    verifying once it changes. Entries live `ttl` seconds, so a bump made
+    by another worker is seen within that window; this worker's own bumps
+    call `invalidate` and take effect at once.
+    """
+
+    def __init__(self, ttl: float = TOKEN_VERSION_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+
+    def get(self, kind: str, id: int):
+        entry = self._entries.get((kind, id))
+        if entry is None or entry[1] < time.monotonic():
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0]
+
+    def set(self, kind: str, id: int, version: int):
+        self._entries[(kind, id)] = (version, time.monotonic() + self.ttl)
+
+    def invalidate(self, kind: str, id: int):
+        self._entries.pop((kind, id), None)
+
+    def clear(self, kind: str = None):
+        for key in [key for key in self._entries if kind is None or key[0] == kind]:
+            del self._entries[key]
+
+    def stats(self):
+        return {
+            'hits'      : self.hits,
+            'misses'    : self.misses,
+            'size'      : len(self._entries),
+            'ttl'       : self.ttl
+        }
+
+
+token_versions = TokenVersions()
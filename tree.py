@@ -0,0 +1,156 @@
+from sqlalchemy import select, and_, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from pagination import Page, Pagination, paginate, to_page
+from metrics import taxonomy_rows, taxonomy_tree_nodes
+import models as mod
+
+
+# keeps IN lists well below the driver's bind parameter limit
+CHUNK_SIZE = 5000
+
+
+def columns(model):
+    return list(model.__table__.columns)
+
+
+def level_index(name: str):
+    return mod.LEVELS.index(mod.LEVELS_BY_NAME[name])
+
+
+async def fetch_children(db: AsyncSession, level: mod.Level, parent_ids: list):
+    model = level.model
+    parent_column = getattr(model, level.parent_key)
+    rows = []
+    for i in range(0, len(parent_ids), CHUNK_SIZE):
+        result = await db.execute(select(*columns(model))\
+            .where(and_(parent_column.in_(parent_ids[i:i + CHUNK_SIZE]), model.is_deleted == False))\
+                .order_by(model.id))
+        rows.extend(result.all())
+    taxonomy_tree_nodes.inc(len(rows), level=level.name)
+    return rows
+
+
+# one flat query per level, children stitched onto their parent by id; deleted rows and
+# everything under them are never fetched
+async def attach_children(db: AsyncSession, nodes: list, index: int, depth: int = None):
+    level = mod.LEVELS[index]
+    if not level.children_key or depth == 0:
+        return
+    nodes_by_id = {}
+    for node in nodes:
+        node[level.children_key] = []
+        nodes_by_id[node['id']] = node
+    if not nodes_by_id:
+        return
+    child_level = mod.LEVELS[index + 1]
+    rows = await fetch_children(db, child_level, list(nodes_by_id))
+    children = []
+    for row in rows:
+        child = dict(row._mapping)
+        nodes_by_id[child[child_level.parent_key]][level.children_key].append(child)
+        children.append(child)
+    await attach_children(db, children, index + 1, None if depth is None else depth - 1)
+
+
+async def build_tree(db: AsyncSession, level_name: str, rows, depth: int = None):
+    """Turn rows of `level_name` into nested dicts with their descendants.
+
+    `depth` limits how many levels below the rows are loaded; None loads
+    everything down to families.
+    """
+    nodes = [dict(row._mapping) for row in rows]
+    taxonomy_rows.observe(len(nodes), level=level_name)
+    taxonomy_tree_nodes.inc(len(nodes), level=level_name)
+    await attach_children(db, nodes, level_index(level_name), depth)
+    return Page(nodes, getattr(rows, 'next_cursor', None))
+
+
+
+async def build_subtree(db: AsyncSession, level_name: str, id: int, depth: int = None):
+    """One node of `level_name` with its descendants `depth` levels down.
+
+    Every descendant level is read with a single query on its denormalised
+    column pointing at the root (e.g. family.order_id), so the cost follows
+    the size of the branch rather than of the level.
+    """
+    index = level_index(level_name)
+    level = mod.LEVELS[index]
+    result = await db.execute(select(*columns(level.model))\
+        .where(and_(level.model.id == id, level.model.is_deleted == False)))
+    row = result.first()
+    if row is None:
+        return None
+    root = dict(row._mapping)
+    parents = [root]
+    taxonomy_tree_nodes.inc(1, level=level.name)
+    last = len(mod.LEVELS) - 1 if depth is None else min(index + depth, len(mod.LEVELS) - 1)
+    for child_index in range(index + 1, last + 1):
+        parent_level, child_level = mod.LEVELS[child_index - 1], mod.LEVELS[child_index]
+        model = child_level.model
+        result = await db.execute(select(*columns(model))\
+            .where(and_(getattr(model, level.id_key) == id, model.is_deleted == False))\
+                .order_by(model.id))
+        parents_by_id = {}
+        for parent in parents:
+            parent[parent_level.children_key] = []
+            parents_by_id[parent['id']] = parent
+        children = []
+        for child_row in result.all():
+            child = dict(child_row._mapping)
+            parent = parents_by_id.get(child[child_level.parent_key])
+            # rows under a deleted parent stay hidden with it
+            if parent is not None:
+                parent[parent_level.children_key].append(child)
+                children.append(child)
+        taxonomy_tree_nodes.inc(len(children), level=child_level.name)
+        parents = children
+    return root
+
+
+
+async def last_modified(db: AsyncSession, level_name: str):
+    """When the tree listing of `level_name` last changed: the latest update_at of
+    that level, the levels below it and their tombstones, in one round trip."""
+    names = [level.name for level in mod.LEVELS[level_index(level_name):]]
+    maxima = [select(func.max(mod.LEVELS_BY_NAME[name].model.__table__.c.update_at)).scalar_subquery()
+              for name in names]
+    tombstone = mod.Tombstone.__table__
+    maxima.append(select(func.max(tombstone.c.update_at)).where(tombstone.c.level.in_(names)).scalar_subquery())
+    result = await db.execute(select(*maxima))
+    values = [value for value in result.first() if value is not None]
+    return max(values) if values else None
+
+
+async def read_lineage(db: AsyncSession, level_name: str, id: int):
+    """The path from the department down to a live node, root first.
+
+    The node's own row names every ancestor, so this is one primary key
+    lookup per level above it, whatever the size of the tree.
+    """
+    index = level_index(level_name)
+    level = mod.LEVELS[index]
+    result = await db.execute(select(*columns(level.model))\
+        .where(and_(level.model.id == id, level.model.is_deleted == False)))
+    row = result.first()
+    if row is None:
+        return None
+    node = row._mapping
+    lineage = []
+    for ancestor in mod.LEVELS[:index]:
+        model = ancestor.model
+        result = await db.execute(select(*columns(model)).where(model.id == node[ancestor.id_key]))
+        parent = result.first()
+        if parent is not None:
+            lineage.append(dict(parent._mapping, level=ancestor.name))
+    lineage.append(dict(node, level=level.name))
+    return lineage
+
+
+async def read_descendants(db: AsyncSession, level_name: str, id: int, child_level: str, page: Pagination = None):
+    """Live rows of `child_level` anywhere under the node, with one indexed query on
+    their denormalised column pointing at it (e.g. family.class_id)."""
+    model = mod.LEVELS_BY_NAME[child_level].model
+    column = getattr(model, mod.LEVELS_BY_NAME[level_name].id_key)
+    result = await db.execute(paginate(select(*columns(model))\
+        .where(and_(column == id, model.is_deleted == False)), model, page))
+    return to_page(result.all(), page)